@@ -0,0 +1 @@
+"""Benchmarks of the bot's commands, run with `python -m benchmarks`"""
@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import time
+from typing import Dict, List, Tuple
+
+from nio import (
+    RoomGetStateEventResponse,
+    RoomPutStateResponse,
+    RoomSendResponse,
+    UploadResponse,
+)
+
+
+class FakeRoom:
+    """Stands in for nio.MatrixRoom: a direct chat between a user and the bot"""
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.display_name = room_id
+        self.member_count = 2
+
+    def user_name(self, user_id: str) -> str:
+        return user_id
+
+
+class FakeMessage:
+    """Stands in for nio.RoomMessageText"""
+
+    _ids = itertools.count()
+
+    def __init__(self, sender: str, body: str):
+        self.sender = sender
+        self.body = body
+        self.event_id = f"$benchmark{next(self._ids)}"
+        self.server_timestamp = int(time.time() * 1000)
+
+
+class FakeHomeserver:
+    """Stands in for nio.AsyncClient, accepting every message the bot sends without
+    any network involved.
+
+    Only implements what Callbacks uses.
+    """
+
+    def __init__(self, user: str = "@taskbot:localhost", latency: float = 0.0):
+        """
+        Args:
+            user: The bot's user ID.
+
+            latency: How long each send takes, in seconds.
+        """
+        self.user = user
+        self.latency = latency
+        self.sent: List[Tuple[str, dict]] = []
+        # Rooms are unencrypted
+        self.rooms: Dict[str, object] = {}
+        self.uploaded = 0
+        self.state: Dict[Tuple[str, str], dict] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+
+    async def room_send(
+        self,
+        room_id: str,
+        message_type: str,
+        content: dict,
+        tx_id: str = None,
+        ignore_unverified_devices: bool = False,
+    ) -> RoomSendResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent.append((room_id, content))
+        for waiter in self._waiters.pop(room_id, []):
+            if not waiter.done():
+                waiter.set_result(content)
+        return RoomSendResponse(f"$event{len(self.sent)}", room_id)
+
+    async def upload(
+        self,
+        data_provider,
+        content_type: str = "application/octet-stream",
+        filename: str = None,
+        encrypt: bool = False,
+        filesize: int = None,
+    ) -> Tuple[UploadResponse, None]:
+        # Read the file as the real client would, without keeping it
+        with open(data_provider(0, 0), "rb") as f:
+            while f.read(64 * 1024):
+                pass
+        self.uploaded += 1
+        return UploadResponse(f"mxc://localhost/upload{self.uploaded}"), None
+
+    async def room_get_state_event(
+        self, room_id: str, event_type: str, state_key: str = ""
+    ) -> RoomGetStateEventResponse:
+        content = self.state.get((room_id, event_type), {})
+        return RoomGetStateEventResponse(content, event_type, state_key, room_id)
+
+    async def room_put_state(
+        self, room_id: str, event_type: str, content: dict, state_key: str = ""
+    ) -> RoomPutStateResponse:
+        self.state[(room_id, event_type)] = content
+        return RoomPutStateResponse(f"$state{len(self.state)}", room_id)
+
+    def next_message(self, room_id: str) -> asyncio.Future:
+        """Get a future of the content of the next message the bot sends to a room"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(room_id, []).append(waiter)
+        return waiter
@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from taskbot.backends import BACKENDS
+from taskbot.callbacks import Callbacks
+from taskbot.commands import task_commands
+from taskbot.config import Config
+
+from benchmarks.homeserver import FakeHomeserver, FakeMessage, FakeRoom
+from benchmarks.store import WORDS, generate_store
+
+SENDER = "@user:localhost"
+
+# Arguments of the n-th message of each command. done takes the lowest IDs and info
+# the highest ones, so that info still finds its tasks after done ran.
+COMMAND_ARGS: Dict[str, Callable[[int, int], str]] = {
+    "list": lambda n, size: "",
+    "add": lambda n, size: f"benchmark task {n}",
+    "done": lambda n, size: str(n + 1),
+    "info": lambda n, size: str(size - n),
+    "search": lambda n, size: WORDS[n % len(WORDS)][:3],
+}
+
+CONFIG_TEMPLATE = """\
+matrix:
+  user_id: "@taskbot:localhost"
+  device_id: BENCHMARK
+  homeserver_url: http://localhost
+storage:
+  store_path: {store_path}
+taskwarrior:
+  backend: {backend}
+  taskrc: {taskrc}
+# Every message comes from the same sender
+admission:
+  user_per_minute: 0
+  max_queued: 0
+logging:
+  level: WARNING
+  file_logging:
+    enabled: false
+  console_logging:
+    enabled: false
+"""
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def make_config(path: str, backend: str, taskrc: str) -> Config:
+    config_path = os.path.join(path, "config.yaml")
+    with open(config_path, "w") as f:
+        f.write(
+            CONFIG_TEMPLATE.format(
+                store_path=os.path.join(path, "store"), backend=backend, taskrc=taskrc
+            )
+        )
+    return Config(config_path)
+
+
+async def send(callbacks: Callbacks, client: FakeHomeserver, room_id: str, body: str) -> dict:
+    """Send a message to the bot and wait for its reply"""
+    reply = client.next_message(room_id)
+    await callbacks.message(FakeRoom(room_id), FakeMessage(SENDER, body))
+    return await reply
+
+
+async def bench_command(
+    callbacks: Callbacks, client: FakeHomeserver, name: str, size: int, iterations: int
+) -> dict:
+    """Measure the latency of a command, one message at a time, and its throughput,
+    with as many messages sent at once from different rooms.
+    """
+    make_args = COMMAND_ARGS.get(name, lambda n, size: "")
+    messages = [f"{name} {make_args(n, size)}".rstrip() for n in range(2 * iterations)]
+
+    latencies = []
+    for body in messages[:iterations]:
+        started = time.perf_counter()
+        await send(callbacks, client, f"!{name}:localhost", body)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            send(callbacks, client, f"!{name}-{n}:localhost", body)
+            for n, body in enumerate(messages[iterations:])
+        )
+    )
+    elapsed = time.perf_counter() - started
+
+    return {
+        "command": name,
+        "size": size,
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput": round(iterations / elapsed, 1),
+    }
+
+
+async def bench_size(size: int, backend: str, iterations: int, latency: float) -> List[dict]:
+    """Benchmark every command against a new store of the given size.
+
+    Commands run in the order of task_commands, on the same store, so later commands
+    see the tasks changed by earlier ones.
+    """
+    with tempfile.TemporaryDirectory(prefix="taskbot-bench-") as path:
+        taskrc = generate_store(os.path.join(path, "task"), size)
+        client = FakeHomeserver(latency=latency)
+        callbacks = Callbacks(client, make_config(path, backend, taskrc))
+        try:
+            started = time.perf_counter()
+            await callbacks.runner.stores.get(callbacks.store_key(SENDER)).cache.get()
+            load_ms = round((time.perf_counter() - started) * 1000, 3)
+            print(f"Loaded {size} tasks in {load_ms}ms", file=sys.stderr)
+
+            results = []
+            for name in task_commands:
+                result = await bench_command(callbacks, client, name, size, iterations)
+                result["load_ms"] = load_ms
+                print(
+                    f"{size} tasks, {name}: p50 {result['p50_ms']}ms, "
+                    f"p99 {result['p99_ms']}ms, {result['throughput']}/s",
+                    file=sys.stderr,
+                )
+                results.append(result)
+            return results
+        finally:
+            await callbacks.close()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(sizes: List[int], backend: str, iterations: int, latency: float) -> dict:
+    results = []
+    for size in sizes:
+        results.extend(await bench_size(size, backend, iterations, latency))
+    return {
+        "commit": git_commit(),
+        "date": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "backend": backend,
+        "iterations": iterations,
+        "latency": latency,
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> List[str]:
+    """Describe how the results changed from a previous run"""
+    previous = {(r["command"], r["size"]): r for r in old["results"]}
+    lines = [f"Compared to {old.get('commit') or 'previous run'}:"]
+    for result in new["results"]:
+        before = previous.get((result["command"], result["size"]))
+        if before is None:
+            continue
+        changes = ", ".join(
+            f"{key} {before[key]} -> {result[key]} ({result[key] / before[key] - 1:+.0%})"
+            for key in ("p50_ms", "p99_ms", "throughput")
+            if before[key]
+        )
+        lines.append(f"  {result['size']} tasks, {result['command']}: {changes}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark every bot command against synthetic Taskwarrior stores",
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+        help="number of pending tasks of each store",
+    )
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="datafile")
+    parser.add_argument(
+        "--iterations", type=int, default=50,
+        help="messages sent per command for latency, and again for throughput",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="simulated homeserver latency of each send, in seconds",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="where to save the results, defaults to benchmark-<commit>.json",
+    )
+    parser.add_argument("--compare", help="results of a previous run to compare with")
+    args = parser.parse_args()
+
+    # The bot's own warnings and errors
+    logging.basicConfig(format="%(name)s [%(levelname)s] %(message)s")
+    results = asyncio.run(run(args.sizes, args.backend, args.iterations, args.latency))
+
+    output = args.output or f"benchmark-{results['commit'] or 'results'}.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), results)))
@@ -0,0 +1,58 @@
+import os
+import random
+import time
+import uuid
+
+from taskw.utils import encode_task
+
+PROJECTS = ("Home", "Home.Garden", "Work", "Work.Reports", "Errands")
+TAGS = ("next", "waiting", "phone", "computer", "someday")
+WORDS = (
+    "call", "write", "review", "buy", "fix", "plan", "email", "read", "clean",
+    "book", "report", "groceries", "dentist", "invoice", "garden", "meeting",
+)
+
+
+def generate_store(path: str, count: int, seed: int = 0) -> str:
+    """Create a Taskwarrior data directory with count pending tasks, and a taskrc
+    pointing to it.
+
+    Tasks get a mix of projects, tags and due dates, like a real task list would. The
+    same seed gives the same tasks, except for dates, which are relative to now.
+
+    Args:
+        path: Directory to create the data files and the taskrc in.
+
+        count: Number of pending tasks.
+
+        seed: Seed of the random generator.
+
+    Returns:
+        The path of the taskrc.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    os.makedirs(path, exist_ok=True)
+
+    with open(os.path.join(path, "pending.data"), "w") as f:
+        for n in range(count):
+            task = {
+                "description": f"{' '.join(rng.choices(WORDS, k=rng.randint(2, 6)))} {n}",
+                "entry": str(now - rng.randint(60, 365 * 86400)),
+                "status": "pending",
+                "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            }
+            if rng.random() < 0.7:
+                task["project"] = rng.choice(PROJECTS)
+            if rng.random() < 0.5:
+                task["tags"] = rng.sample(TAGS, rng.randint(1, 2))
+            if rng.random() < 0.3:
+                task["due"] = str(now + rng.randint(-30, 90) * 86400)
+            f.write(encode_task(task))
+
+    open(os.path.join(path, "completed.data"), "w").close()
+
+    taskrc = os.path.join(path, "taskrc")
+    with open(taskrc, "w") as f:
+        f.write(f"data.location={path}\n")
+    return taskrc
@@ -0,0 +1,169 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Reasons a command is shed
+SHED_USER = "user"
+SHED_GLOBAL = "global"
+SHED_QUEUE = "queue"
+
+# How many senders are remembered. The least recently seen are forgotten first,
+# which only gives them a full bucket, or another busy reply.
+MAX_SENDERS = 10000
+
+
+class TokenBucket:
+    """Allows rate events per second on average, and bursts of up to burst events"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        """Add the tokens earned since the last update"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def configure(self, rate: float, burst: int) -> None:
+        """Change the rate and burst, keeping the tokens left"""
+        self.refill()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = min(self.tokens, burst)
+
+    def take(self) -> bool:
+        """Take a token if one is available"""
+        self.refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionControl:
+    """Decides whether a command is run or shed, before it is queued, so that a user
+    or a script flooding the bot doesn't slow everyone else down.
+
+    A command is shed when its sender used up their token bucket, when every sender
+    together used up the global one, or when too many commands wait to run. A rate
+    of 0 turns a bucket off.
+    """
+
+    def __init__(
+        self,
+        user_rate: float = 1.0,
+        user_burst: int = 10,
+        global_rate: float = 0.0,
+        global_burst: int = 100,
+        max_queued: int = 100,
+    ):
+        """
+        Args:
+            user_rate: Commands per second each sender may send, on average.
+
+            user_burst: Commands a sender may send at once.
+
+            global_rate: Commands per second every sender together may send.
+
+            global_burst: Commands every sender together may send at once.
+
+            max_queued: Commands that may wait to run. 0 allows any number.
+        """
+        self._users: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # Senders told the bot is busy since their last admitted command
+        self._told_busy: "OrderedDict[str, None]" = OrderedDict()
+        self._global: Optional[TokenBucket] = None
+        self.configure(user_rate, user_burst, global_rate, global_burst, max_queued)
+
+    @classmethod
+    def from_config(cls, config) -> "AdmissionControl":
+        admission = cls()
+        admission.apply_config(config)
+        return admission
+
+    def apply_config(self, config) -> None:
+        """Apply the configured limits, keeping the tokens each sender has left"""
+        self.configure(
+            user_rate=config.admission_user_per_minute / 60,
+            user_burst=config.admission_user_burst,
+            global_rate=config.admission_global_per_minute / 60,
+            global_burst=config.admission_global_burst,
+            max_queued=config.admission_max_queued,
+        )
+
+    def configure(
+        self,
+        user_rate: float,
+        user_burst: int,
+        global_rate: float,
+        global_burst: int,
+        max_queued: int,
+    ) -> None:
+        """Change the limits, see __init__. Existing buckets are updated in place."""
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queued = max_queued
+        if not user_rate:
+            self._users.clear()
+        for bucket in self._users.values():
+            bucket.configure(user_rate, user_burst)
+        if not global_rate:
+            self._global = None
+        elif self._global is None:
+            self._global = TokenBucket(global_rate, global_burst)
+        else:
+            self._global.configure(global_rate, global_burst)
+
+    def admit(self, sender: str, queued: int) -> Optional[str]:
+        """Check whether a sender's command may be queued
+
+        Args:
+            sender: User ID of the command's sender.
+
+            queued: Number of commands waiting to run.
+
+        Returns:
+            None if the command may run, else why it is shed.
+        """
+        reason = self._check(sender, queued)
+        if reason is None:
+            self._told_busy.pop(sender, None)
+        return reason
+
+    def tell_busy(self, sender: str) -> bool:
+        """Whether a shed sender should be told the bot is busy. Only the first
+        command shed in a row is answered, so a flood doesn't get a flood of replies.
+        """
+        if sender in self._told_busy:
+            self._told_busy.move_to_end(sender)
+            return False
+        self._told_busy[sender] = None
+        if len(self._told_busy) > MAX_SENDERS:
+            self._told_busy.popitem(last=False)
+        return True
+
+    def _check(self, sender: str, queued: int) -> Optional[str]:
+        if self.max_queued and queued >= self.max_queued:
+            return SHED_QUEUE
+
+        # A sender over their own limit doesn't use up the global bucket
+        if self.user_rate:
+            bucket = self._users.get(sender)
+            if bucket is None:
+                bucket = self._users[sender] = TokenBucket(self.user_rate, self.user_burst)
+                if len(self._users) > MAX_SENDERS:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(sender)
+            if not bucket.take():
+                return SHED_USER
+
+        if self._global and not self._global.take():
+            return SHED_GLOBAL
+        return None
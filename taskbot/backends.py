@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Type
+from urllib.parse import quote
+
+from taskw import TaskWarrior, TaskWarriorShellout
+from taskw.exceptions import TaskwarriorError
+from taskw.utils import DATE_FORMAT, convert_dict_to_override_args, decode_task
+from taskw.warrior import TASKRC, Command, DataFile, Status
+
+from taskbot.errors import ConfigError
+
+logger = logging.getLogger(__name__)
+
+# Attributes stored as UNIX timestamps in the data files, and as formatted dates
+# by 'task export'
+DATE_ATTRIBUTES = ("due", "end", "entry", "modified", "scheduled", "start", "until", "wait")
+
+
+class TaskBackend:
+    """Access to a Taskwarrior data store.
+
+    A backend is created once and shared by every command. Its methods are blocking,
+    and are meant to be run through a TaskExecutor.
+    """
+
+    def __init__(self, taskrc: Optional[str] = None, location: Optional[str] = None):
+        """
+        Args:
+            taskrc: Path to the taskrc. Defaults to $TASKRC or ~/.taskrc.
+
+            location: The data directory, which then takes precedence over both
+                TASKDATA and the taskrc.
+        """
+        self.taskrc = taskrc or TASKRC
+        self._location = location
+        if location and TaskWarrior is TaskWarriorShellout:
+            # Overrides are passed to the task command, where they beat TASKDATA
+            self.w = TaskWarrior(
+                config_filename=self.taskrc, config_overrides={"data": {"location": location}}
+            )
+        else:
+            self.w = TaskWarrior(config_filename=self.taskrc)
+
+    def __reduce__(self):
+        # taskw's TaskRc can't be pickled, so process pool workers create their own
+        # backend instead
+        return _worker_backend, (type(self), self.taskrc, self._location)
+
+    @property
+    def location(self) -> str:
+        """The directory holding the Taskwarrior data files.
+
+        Like the task CLI, the TASKDATA environment variable takes precedence over the
+        data.location setting of the taskrc.
+        """
+        if self._location:
+            return self._location
+        location = os.environ.get("TASKDATA")
+        if not location:
+            location = self.w.config.get("data", {}).get("location", "~/.task")
+        return os.path.expanduser(location)
+
+    def load_tasks(self, command: str = Command.PENDING) -> Dict[str, List[dict]]:
+        """Load tasks, in the same format as taskw's load_tasks"""
+        raise NotImplementedError
+
+    def iter_tasks(self, command: str = Command.PENDING) -> Iterator[dict]:
+        """Iterate over tasks, pending ones first.
+
+        Backends should override this to avoid loading every task at once.
+        """
+        for tasks in self.load_tasks(command).values():
+            yield from tasks
+
+    def task_add(self, description: str, **kw) -> dict:
+        """Add a task and return it"""
+        raise NotImplementedError
+
+    def task_done(self, uuid: str) -> dict:
+        """Mark a pending task as done and return it"""
+        raise NotImplementedError
+
+    def tasks_add(self, descriptions: List[str]) -> List[dict]:
+        """Add several tasks and return them, in the same order.
+
+        Backends should override this to add them all at once.
+        """
+        return [self.task_add(description) for description in descriptions]
+
+    def tasks_done(self, uuids: List[str]) -> None:
+        """Mark several pending tasks as done.
+
+        Backends should override this to change them all at once.
+        """
+        for uuid in uuids:
+            self.task_done(uuid)
+
+
+# Backends of a process pool worker, created once per taskrc and data directory
+_worker_backends: Dict[tuple, TaskBackend] = {}
+
+
+def _worker_backend(cls: Type[TaskBackend], taskrc: str, location: Optional[str]) -> TaskBackend:
+    key = (cls, taskrc, location)
+    backend = _worker_backends.get(key)
+    if backend is None:
+        backend = _worker_backends[key] = cls(taskrc, location=location)
+    return backend
+
+
+class TaskwBackend(TaskBackend):
+    """Goes through taskw for everything, which runs the task command when it is
+    installed.
+    """
+
+    def load_tasks(self, command: str = Command.PENDING) -> Dict[str, List[dict]]:
+        return self.w.load_tasks(command)
+
+    def iter_tasks(self, command: str = Command.PENDING) -> Iterator[dict]:
+        if not isinstance(self.w, TaskWarriorShellout):
+            # taskw's fallback reads each data file at once
+            yield from super().iter_tasks(command)
+            return
+        for db in Command.files(command):
+            yield from self._iter_export(f"status:{db}")
+            # Like taskw's load_tasks, waiting tasks are listed with pending ones
+            if db == DataFile.PENDING:
+                yield from self._iter_export("status:waiting")
+
+    def _iter_export(self, *args: str) -> Iterator[dict]:
+        """Run 'task export' and decode the tasks as they are read, rather than
+        loading all of its output at once like taskw does
+        """
+        overrides = dict(self.w.DEFAULT_CONFIG_OVERRIDES, **self.w.config_overrides)
+        # One task per line
+        overrides["json"] = {"array": "off"}
+        command = ["task", *convert_dict_to_override_args(overrides), *args, "export"]
+        env = dict(os.environ, TASKRC=self.taskrc)
+        encoding = self.w.config.get("encoding", "utf-8")
+
+        # stderr goes to a file, so that it can't fill up while stdout is read
+        with tempfile.TemporaryFile() as stderr:
+            with subprocess.Popen(
+                command, env=env, stdout=subprocess.PIPE, stderr=stderr
+            ) as proc:
+                for line in proc.stdout:
+                    line = line.decode(encoding, errors="replace").strip().rstrip(",")
+                    if line:
+                        yield json.loads(line)
+            if proc.returncode != 0:
+                stderr.seek(0)
+                raise TaskwarriorError(command, stderr.read().decode(encoding), "", proc.returncode)
+
+    def task_add(self, description: str, **kw) -> dict:
+        # Without the task command, taskw returns the task as stored in the data files
+        return normalize_task(self.w.task_add(description=description, **kw))
+
+    def task_done(self, uuid: str) -> dict:
+        return normalize_task(self.w.task_done(uuid=uuid))
+
+    def tasks_add(self, descriptions: List[str]) -> List[dict]:
+        if len(descriptions) == 1 or not isinstance(self.w, TaskWarriorShellout):
+            return super().tasks_add(descriptions)
+
+        entry = datetime.utcnow().strftime(DATE_FORMAT)
+        tasks = [
+            {
+                "description": description,
+                "entry": entry,
+                "status": Status.PENDING,
+                "uuid": str(uuid.uuid4()),
+            }
+            for description in descriptions
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(tasks, f)
+            f.flush()
+            self.w._execute("import", f.name)
+
+        # Read the tasks back to get their IDs
+        added = {task["uuid"]: task for task in self._export(task["uuid"] for task in tasks)}
+        return [added[task["uuid"]] for task in tasks]
+
+    def tasks_done(self, uuids: List[str]) -> None:
+        if len(uuids) == 1 or not isinstance(self.w, TaskWarriorShellout):
+            return super().tasks_done(uuids)
+
+        # rc.bulk=0 so that changing many tasks doesn't ask for confirmation
+        self.w._execute("rc.bulk=0", *uuids, "done")
+
+    def _export(self, uuids: Iterable[str]) -> List[dict]:
+        tasks = self.w._get_task_objects(*uuids, "export")
+        # A single task is exported on its own
+        return tasks if isinstance(tasks, list) else [tasks]
+
+
+class DataFileBackend(TaskwBackend):
+    """Reads pending.data and completed.data directly instead of running the task
+    command, and goes through taskw for changes.
+
+    Only the Taskwarrior 2.x data file format is supported.
+    """
+
+    def load_tasks(self, command: str = Command.PENDING) -> Dict[str, List[dict]]:
+        return {
+            db: self._read_data_file(db) for db in Command.files(command)
+        }
+
+    def iter_tasks(self, command: str = Command.PENDING) -> Iterator[dict]:
+        for db in Command.files(command):
+            path = os.path.join(self.location, DataFile.filename(db))
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+            # Read as the tasks are consumed, rather than all at once
+            with f:
+                yield from self._decode(db, f)
+
+    def _read_data_file(self, db: str) -> List[dict]:
+        path = os.path.join(self.location, DataFile.filename(db))
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        return list(self._decode(db, lines))
+
+    @staticmethod
+    def _decode(db: str, lines: Iterable[str]) -> Iterator[dict]:
+        next_id = 1
+        for line in lines:
+            if not line.strip():
+                continue
+            task = decode_data_line(line)
+
+            # Until the task command garbage collects it, a task that was just
+            # completed or deleted stays in pending.data
+            if db == DataFile.PENDING:
+                if not Status.is_pending(task.get("status")):
+                    continue
+                task["id"] = next_id
+                next_id += 1
+            else:
+                task["id"] = 0
+            yield task
+
+
+def decode_data_line(line: str) -> dict:
+    """Decode a data file line into the format used by 'task export'"""
+    return normalize_task(decode_task(line))
+
+
+def normalize_task(task: dict) -> dict:
+    """Convert a task as stored in the data files, with UNIX timestamps and
+    annotation_<timestamp> attributes, to the format used by 'task export'. Tasks
+    already in that format are left as they are.
+    """
+    annotations = []
+    for key in sorted(k for k in task if k.startswith("annotation_")):
+        annotations.append(
+            {
+                "entry": _format_timestamp(key[len("annotation_"):]),
+                "description": task.pop(key),
+            }
+        )
+    if annotations:
+        task["annotations"] = annotations
+
+    for key in DATE_ATTRIBUTES:
+        if key in task:
+            task[key] = _format_timestamp(task[key])
+
+    return task
+
+
+def _format_timestamp(timestamp: str) -> str:
+    try:
+        return datetime.utcfromtimestamp(int(timestamp)).strftime(DATE_FORMAT)
+    except ValueError:
+        # Already formatted
+        return timestamp
+
+
+BACKENDS = {
+    "taskw": TaskwBackend,
+    "datafile": DataFileBackend,
+}
+
+
+def backend_class(name: str) -> Type[TaskBackend]:
+    """Get a backend from its name in the config
+
+    Raises:
+        ConfigError: If the backend doesn't exist.
+    """
+    if name not in BACKENDS:
+        raise ConfigError(f"taskwarrior.backend must be one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def user_directory(config, user_id: str) -> str:
+    """The directory of a user's taskrc and data, when each user has their own"""
+    return os.path.join(config.users_directory, quote(user_id, safe="@:._=-"))
+
+
+def make_backend(config, user_id: Optional[str] = None) -> TaskBackend:
+    """Create the backend chosen in the config
+
+    Args:
+        config: Bot configuration parameters.
+
+        user_id: When set, the backend uses this user's own data directory, which
+            is created if needed. Their taskrc includes the configured one.
+
+    Raises:
+        ConfigError: If the backend doesn't exist.
+    """
+    cls = backend_class(config.taskwarrior_backend)
+    if user_id is None:
+        backend = cls(config.taskrc)
+    else:
+        directory = user_directory(config, user_id)
+        location = os.path.join(directory, "task")
+        taskrc = os.path.join(directory, "taskrc")
+        if not os.path.exists(taskrc):
+            os.makedirs(location, exist_ok=True)
+            shared_taskrc = os.path.expanduser(config.taskrc or TASKRC)
+            with open(taskrc, "w") as f:
+                if os.path.exists(shared_taskrc):
+                    f.write(f"include {shared_taskrc}\n")
+                f.write(f"data.location={location}\n")
+        backend = cls(taskrc, location=location)
+
+    logger.info(
+        f"Using {config.taskwarrior_backend} Taskwarrior backend on {backend.location}"
+    )
+    return backend
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import List, Optional, Set
+
+from taskbot.backends import TaskBackend
+from taskbot.executor import TaskExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self):
+        self.descriptions: List[str] = []
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.full = asyncio.Event()
+
+
+class AddBatcher:
+    """Collects the tasks added to a data store within a short window, and adds them
+    with a single backend call, so a burst of adds costs a single import and a single
+    rewrite of the data files.
+
+    Each caller gets back its own tasks, in the order it gave them.
+    """
+
+    def __init__(
+        self,
+        executor: TaskExecutor,
+        backend: TaskBackend,
+        window: float,
+        max_tasks: int = 500,
+    ):
+        """
+        Args:
+            executor: Runs the backend call.
+
+            backend: Backend of the data store.
+
+            window: How long, in seconds, the first add of a batch waits for others.
+
+            max_tasks: Number of tasks after which a batch is added right away.
+        """
+        self.executor = executor
+        self.backend = backend
+        self.window = window
+        self.max_tasks = max_tasks
+        self._batch: Optional[_Batch] = None
+        self._commits: Set[asyncio.Task] = set()
+
+        # Statistics
+        self.batches = 0
+        self.added = 0
+
+    async def add(self, descriptions: List[str]) -> List[dict]:
+        """Add tasks with the next batch, and return them once it was added
+
+        Raises:
+            ExecutorBusyError: If the executor's queue is full.
+        """
+        batch = self._batch
+        if batch is not None and len(batch.descriptions) + len(descriptions) > self.max_tasks:
+            batch.full.set()
+            batch = None
+        if batch is None:
+            batch = self._batch = _Batch()
+            task = asyncio.create_task(self._commit(batch))
+            self._commits.add(task)
+            task.add_done_callback(self._commits.discard)
+
+        start = len(batch.descriptions)
+        batch.descriptions.extend(descriptions)
+        if len(batch.descriptions) >= self.max_tasks:
+            batch.full.set()
+
+        # A caller giving up doesn't cancel the others' tasks
+        tasks = await asyncio.shield(batch.result)
+        return tasks[start:start + len(descriptions)]
+
+    async def _commit(self, batch: _Batch) -> None:
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        if self._batch is batch:
+            self._batch = None
+
+        try:
+            tasks = await self.executor.run(self.backend.tasks_add, batch.descriptions)
+        except Exception as e:
+            batch.result.set_exception(e)
+            # Avoids a warning when every caller gave up
+            batch.result.exception()
+            return
+        logger.debug("Added a batch of %d tasks", len(tasks))
+        self.batches += 1
+        self.added += len(tasks)
+        batch.result.set_result(tasks)
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from taskbot.backends import TaskBackend
+from taskbot.executor import TaskExecutor
+
+logger = logging.getLogger(__name__)
+
+DATA_FILES = ("pending.data", "completed.data")
+
+# Tasks measured to estimate the memory used by a snapshot
+SIZE_SAMPLE = 100
+
+Version = Tuple[Optional[Tuple[int, int]], ...]
+
+# Statuses of the tasks in the snapshot
+PENDING_STATUSES = ("pending", "waiting")
+
+
+def estimate_size(tasks: List[dict]) -> int:
+    """Estimate the memory used by tasks, in bytes, from a sample of them"""
+    sample = tasks[::max(1, len(tasks) // SIZE_SAMPLE)]
+    sample_size = 0
+    for task in sample:
+        sample_size += sys.getsizeof(task)
+        for key, value in task.items():
+            sample_size += sys.getsizeof(key) + sys.getsizeof(value)
+            if isinstance(value, list):
+                sample_size += sum(sys.getsizeof(item) for item in value)
+    estimate = sample_size * len(tasks) // len(sample) if sample else 0
+    return sys.getsizeof(tasks) + estimate
+
+
+def _without_id(task: dict) -> dict:
+    return {key: value for key, value in task.items() if key != "id"}
+
+
+class TaskSnapshot:
+    """Pending tasks as they were at a given version of the data files, indexed by
+    ID and UUID.
+    """
+
+    def __init__(self, version: Version, tasks: List[dict]):
+        self.version = version
+        self.tasks = tasks
+        self.by_id: Dict[int, dict] = {}
+        self.by_uuid: Dict[str, dict] = {}
+        # ID of the next task appended to pending.data
+        self.next_id = 1
+
+        for line, task in enumerate(tasks, start=1):
+            # taskw's fallback when the task command isn't installed gives no ID,
+            # which is then the task's line number in pending.data
+            task.setdefault("id", line)
+            self._index(task)
+
+        # Estimated once, as tasks added later barely change it
+        self.size = (
+            estimate_size(tasks) + sys.getsizeof(self.by_id) + sys.getsizeof(self.by_uuid)
+        )
+
+    def _index(self, task: dict) -> None:
+        if task.get("id"):
+            self.by_id[task["id"]] = task
+            self.next_id = max(self.next_id, task["id"] + 1)
+        if "uuid" in task:
+            self.by_uuid[task["uuid"]] = task
+
+    def add(self, task: dict) -> dict:
+        # A reload or the watcher may have loaded the task since it was written
+        if task.get("uuid") in self.by_uuid:
+            self.replace(task)
+            return task
+        # Taskwarrior appends new tasks to pending.data, so they take the next ID
+        task["id"] = self.next_id
+        self.tasks.append(task)
+        self._index(task)
+        return task
+
+    def replace(self, task: dict) -> Optional[dict]:
+        """Replace a task with a new version of it, which keeps its ID, and return
+        the old version
+        """
+        old = self.by_uuid.get(task.get("uuid"))
+        if old is None:
+            return None
+        task["id"] = old.get("id")
+        self.tasks[self.tasks.index(old)] = task
+        self._index(task)
+        return old
+
+    def remove(self, uuid: str) -> Optional[dict]:
+        task = self.by_uuid.pop(uuid, None)
+        if task is None:
+            return None
+        index = self.tasks.index(task)
+        del self.tasks[index]
+        if self.by_id.get(task.get("id")) is task:
+            del self.by_id[task["id"]]
+
+        # Like a load after Taskwarrior's garbage collection, the following tasks
+        # move up one ID
+        for position in range(index, len(self.tasks)):
+            later = self.tasks[position]
+            if self.by_id.get(later.get("id")) is later:
+                del self.by_id[later["id"]]
+            later["id"] = position + 1
+            self.by_id[later["id"]] = later
+        self.next_id = len(self.tasks) + 1
+        return task
+
+
+class TaskChanges:
+    """Pending tasks that changed between two snapshots"""
+
+    def __init__(
+        self,
+        added: List[dict] = (),
+        modified: List[dict] = (),
+        removed: List[dict] = (),
+        room_id: Optional[str] = None,
+    ):
+        """
+        Args:
+            added: Tasks that became pending.
+
+            modified: Pending tasks that were changed.
+
+            removed: Tasks that are no longer pending, as they last were.
+
+            room_id: The room whose command made the changes, if any.
+        """
+        self.added = list(added)
+        self.modified = list(modified)
+        self.removed = list(removed)
+        self.room_id = room_id
+
+    @classmethod
+    def between(cls, old: Optional[TaskSnapshot], new: TaskSnapshot) -> "TaskChanges":
+        if old is None:
+            return cls(added=list(new.tasks))
+
+        added = []
+        modified = []
+        for task in new.tasks:
+            previous = old.by_uuid.get(task.get("uuid"))
+            if previous is None:
+                added.append(task)
+            elif previous.get("modified") != task.get("modified"):
+                modified.append(task)
+        removed = [task for uuid, task in old.by_uuid.items() if uuid not in new.by_uuid]
+        return cls(added, modified, removed)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+
+class SnapshotCache:
+    """Keeps a snapshot of the pending tasks in memory, and only reloads it from
+    Taskwarrior when the data files change.
+
+    The version of the data files is their modification time and size. After the
+    bot writes to Taskwarrior itself, the snapshot is updated in place instead of
+    being reloaded.
+
+    Subscribers are told about every change to the snapshot.
+    """
+
+    def __init__(self, executor: TaskExecutor, backend: TaskBackend):
+        """
+        Args:
+            executor: Pool running the blocking reloads.
+
+            backend: Backend the tasks are loaded from.
+        """
+        self.executor = executor
+        self.backend = backend
+        self.paths = [os.path.join(backend.location, name) for name in DATA_FILES]
+        self.snapshot: Optional[TaskSnapshot] = None
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+        self._subscribers: List[Callable[[TaskChanges], None]] = []
+
+    def subscribe(self, callback: Callable[[TaskChanges], None]) -> None:
+        """Call callback with the changes whenever the snapshot changes"""
+        self._subscribers.append(callback)
+
+    def _publish(self, changes: TaskChanges) -> None:
+        if not changes:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(changes)
+            except Exception:
+                logger.exception(f"Task changes subscriber {callback} failed")
+
+    def version(self) -> Version:
+        """Get the current version of the data files"""
+        version = []
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                version.append(None)
+            else:
+                version.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    async def get(self) -> TaskSnapshot:
+        """Get the snapshot of the pending tasks, reloading it if the data files
+        changed since it was taken.
+        """
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == self.version():
+            return snapshot
+
+        async with self._lock:
+            # Another caller may have reloaded while we waited for the lock
+            if self.snapshot is None or self.snapshot.version != self.version():
+                await self._load()
+            return self.snapshot
+
+    async def reload(self) -> TaskSnapshot:
+        """Reload the snapshot even if the data files seem unchanged, publishing
+        what changed since the previous one.
+        """
+        async with self._lock:
+            await self._load()
+            return self.snapshot
+
+    async def _load(self) -> None:
+        version = self.version()
+        tasks = await self.executor.run(self.backend.load_tasks, "pending")
+        previous = self.snapshot
+        self.snapshot = TaskSnapshot(version, tasks["pending"])
+        self.reloads += 1
+        if self._subscribers:
+            self._publish(TaskChanges.between(previous, self.snapshot))
+        logger.debug(
+            "Reloaded %d pending tasks at version %s", len(self.snapshot.tasks), version
+        )
+
+    def added(self, task: dict, room_id: Optional[str] = None) -> None:
+        """Record a task the bot just added"""
+        if self._update(lambda snapshot: snapshot.add(task)):
+            self._publish(TaskChanges(added=[task], room_id=room_id))
+
+    def completed(self, uuid: str, room_id: Optional[str] = None) -> None:
+        """Record that the bot just marked a task as done"""
+        task = self._update(lambda snapshot: snapshot.remove(uuid))
+        if task:
+            self._publish(TaskChanges(removed=[task], room_id=room_id))
+
+    def apply(self, tasks: List[dict]) -> None:
+        """Apply changes made outside of the bot, given the new version of each
+        changed task, in the order they were made.
+        """
+        if self.snapshot is None:
+            return
+
+        changes = TaskChanges()
+        for task in tasks:
+            current = self.snapshot.by_uuid.get(task["uuid"])
+            if task.get("status") in PENDING_STATUSES:
+                if current is None:
+                    changes.added.append(self.snapshot.add(task))
+                elif _without_id(current) != _without_id(task):
+                    self.snapshot.replace(task)
+                    changes.modified.append(task)
+            elif current is not None:
+                self.snapshot.remove(task["uuid"])
+                changes.removed.append(task)
+
+        self.snapshot.version = self.version()
+        self._publish(changes)
+
+    def invalidate(self) -> None:
+        """Forget the snapshot, so it gets reloaded on next use"""
+        self.snapshot = None
+
+    def _update(self, change: Callable[[TaskSnapshot], Any]) -> Any:
+        # Without a snapshot, the change will be part of the next load
+        if self.snapshot is None:
+            return None
+        result = change(self.snapshot)
+        # The change is ours, so the snapshot is still current
+        self.snapshot.version = self.version()
+        return result
@@ -1,30 +1,86 @@
+import asyncio
+import functools
 import logging
 import sys
+import time
+from typing import Union
 
 from nio import (
     AsyncClient,
     MatrixRoom,
     MegolmEvent,
     RoomMessageText,
+    SyncResponse,
     UnknownEvent, )
 
-from taskbot.chat_functions import send_text_to_room
+from taskbot.admission import AdmissionControl
 from taskbot.commands import task_commands
 from taskbot.config import Config
+from taskbot.dashboard import DashboardMessages
+from taskbot.errors import ConfigError, WorkerError
+from taskbot.events import ProcessedEvents
+from taskbot.export import clear_exports
+from taskbot.logs import pipeline
+from taskbot.metrics import Metrics, MetricsServer
+from taskbot.outbox import Outbox
+from taskbot.profiling import LoopWatchdog
+from taskbot.render import DashboardReply, FileReply, Renderer, Reply
+from taskbot.runner import CommandRunner
+from taskbot.scheduler import CommandScheduler
+from taskbot.stores import SHARED
+from taskbot.workers import WorkerPool
 
 logger = logging.getLogger(__name__)
 
 
 class Callbacks:
-    def __init__(self, client: AsyncClient, config: Config):
+    def __init__(self, client: AsyncClient, config: Config, workers: int = 0):
         """
         Args:
             client: nio client used to interact with matrix.
 
             config: Bot configuration parameters.
+
+            workers: Number of worker processes running the commands. When 0,
+                commands run in this process.
         """
         self.client = client
         self.config = config
+        self.metrics = Metrics()
+        self.scheduler = CommandScheduler()
+        self.outbox = Outbox.from_config(client, config, self.metrics)
+        self.renderer = Renderer()
+        self.dashboards = DashboardMessages(client, self.outbox, config.store_path)
+        self.processed = ProcessedEvents.from_config(config)
+        self.admission = AdmissionControl.from_config(config)
+        clear_exports(config.store_path)
+        if workers:
+            self.runner = WorkerPool(config, workers, self.reply)
+        else:
+            self.runner = CommandRunner(config, self.reply, self.scheduler, self.metrics)
+
+        self.metrics.add_gauge(
+            "taskbot_commands_queued", "Commands waiting to run", lambda: self.scheduler.pending
+        )
+        self.metrics.add_gauge(
+            "taskbot_messages_queued", "Messages waiting to be sent", lambda: self.outbox.depth
+        )
+        self.metrics.add_gauge(
+            "taskbot_log_records_dropped",
+            "Log records dropped as the logging queue was full",
+            lambda: pipeline.dropped,
+        )
+        self.metrics_server = None
+        if config.metrics_enabled:
+            self.metrics_server = MetricsServer.from_config(self.metrics, config)
+
+        self.watchdog = None
+        if config.profiling_loop_stall_ms:
+            self.watchdog = LoopWatchdog.from_config(config)
+
+    def store_key(self, user_id: str) -> str:
+        """Key of the store a user's commands work on"""
+        return user_id if self.config.per_user else SHARED
 
     async def message(self, room: MatrixRoom, event: RoomMessageText) -> None:
         """Callback for when a message event is received
@@ -41,23 +97,124 @@ class Callbacks:
         if event.sender == self.client.user:
             return
 
-        logger.debug(
-            f"Bot message received for room {room.display_name} | "
-            f"{room.user_name(event.sender)}: {msg}"
-        )
+        # Runs for every message, so the user name isn't looked up unless it's logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Bot message received for room %s | %s: %s",
+                room.display_name,
+                room.user_name(event.sender),
+                msg,
+            )
 
         if room.member_count > 2:
             # do nothing in group rooms
             return
 
-        cmd, _, args = msg.partition(' ')
-        cmd = cmd.lower()
+        # A replayed sync or a reset store delivers events the bot already handled
+        timestamp = event.server_timestamp / 1000
+        if self.processed.seen(event.event_id, timestamp):
+            logger.debug("Ignoring already handled event %s", event.event_id)
+            return
+        self.processed.add(event.event_id, timestamp)
+
+        reason = self.admission.admit(event.sender, self.scheduler.pending)
+        if reason:
+            logger.debug("Shed a command from %s, over the %s limit", event.sender, reason)
+            self.metrics.commands_shed.inc(reason)
+            if self.config.admission_busy_reply and self.admission.tell_busy(event.sender):
+                self.outbox.send_text(
+                    room.room_id, "Too many commands, try again later.", markdown_convert=False
+                )
+            return
+
+        # Split on any whitespace, as arguments may start on a new line
+        words = msg.split(maxsplit=1)
+        cmd = words[0].lower() if words else ''
+        args = words[1] if len(words) > 1 else ''
+        self.scheduler.submit(
+            room.room_id,
+            functools.partial(
+                self._run_command, room.room_id, self.store_key(event.sender), cmd, args
+            ),
+        )
+
+    async def _run_command(self, room_id: str, store_key: str, cmd: str, args: str) -> None:
+        """Run a command and send its response to the room it came from"""
+        started = time.monotonic()
         if not cmd in task_commands:
             response = f"Unknown command '{cmd}'"
         else:
-            cmd = task_commands.get(cmd)()
-            response = await cmd.process(args)
-        await send_text_to_room(self.client, room.room_id, message=response)
+            try:
+                response = await self.runner.run(room_id, store_key, cmd, args)
+            except WorkerError as e:
+                logger.error(e)
+                response = "Something went wrong, try again later."
+            except Exception:
+                # Answered like a command failing in a worker process
+                logger.exception(f"Failed to run '{cmd}' command")
+                response = "Something went wrong, try again later."
+        self.reply(room_id, response)
+        self.metrics.command_seconds.observe(
+            time.monotonic() - started, cmd if cmd in task_commands else "unknown"
+        )
+
+    def reply(self, room_id: str, response: Union[str, Reply, FileReply, DashboardReply]) -> None:
+        """Queue a response to be sent to a room"""
+        if isinstance(response, Reply):
+            self.outbox.send(room_id, self.renderer.render(response))
+        elif isinstance(response, DashboardReply):
+            self.dashboards.show(room_id, self.renderer.render(response.reply), new=response.new)
+        elif isinstance(response, FileReply):
+            if response.summary:
+                self.outbox.send_text(room_id, response.summary, markdown_convert=False)
+            self.outbox.send_file(room_id, response.path, response.filename, response.mimetype)
+        else:
+            self.outbox.send_text(room_id, response)
+
+    async def start(self) -> None:
+        """Start background tasks"""
+        await self.runner.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.watchdog:
+            self.watchdog.start()
+
+    def reload_config(self) -> None:
+        """Read the config file again, and apply the options that can change while
+        the bot runs. Nothing changes if the file is invalid.
+        """
+        try:
+            changed = self.config.reload()
+        except ConfigError as e:
+            logger.error(f"Not reloading the config: {e}")
+            return
+        if not changed:
+            logger.info("Reloaded the config, nothing to apply")
+            return
+
+        self.processed.max_age = self.config.processed_events_max_age_days * 86400
+        self.admission.apply_config(self.config)
+        self.outbox.max_retries = self.config.send_max_retries
+        self.outbox.max_merged = self.config.send_max_merged
+        self.runner.apply_config()
+        logger.info(f"Reloaded the config, applied {', '.join(changed)}")
+
+    async def close(self) -> None:
+        """Stop running commands and release resources"""
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.watchdog:
+            await self.watchdog.stop()
+        await self.scheduler.close()
+        await self.runner.close()
+        try:
+            # Give replies to the last commands a chance to go out
+            await self.outbox.drain(timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self.outbox.depth} unsent messages")
+        await self.outbox.close()
+        await self.dashboards.close()
+        self.processed.close()
 
     async def decryption_failure(self, room: MatrixRoom, event: MegolmEvent) -> None:
         """Callback for when an event fails to decrypt. Inform the user.
@@ -72,9 +229,9 @@ class Callbacks:
             f"\n\n"
             f"Tip: try using a different device ID in your config file and restart."
             f"\n\n"
-            f"If all else fails, delete your store directory and let the bot recreate "
-            f"it (your reminders will NOT be deleted, but the bot may respond to existing "
-            f"commands a second time)."
+            f"If all else fails, delete {self.client.user_id}_{self.client.device_id}.db "
+            f"in your store directory and let the bot recreate it (your reminders will NOT "
+            f"be deleted, and commands the bot already handled won't run again)."
         )
 
         sys.exit(1)
@@ -84,5 +241,8 @@ class Callbacks:
             f"Got unknown event with type to {event.type} from {event.sender} in {room.room_id}."
         )
 
+    async def sync(self, response: SyncResponse) -> None:
+        self.metrics.synced()
+
     async def sync_error(self, response):
         logger.info(response)
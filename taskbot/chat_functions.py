@@ -1,7 +1,6 @@
 import logging
 from typing import Optional, Union
 
-from markdown import markdown
 from nio import (
     AsyncClient,
     ErrorResponse,
@@ -44,6 +43,29 @@ async def send_text_to_room(
     Returns:
         A RoomSendResponse if the request was successful, else an ErrorResponse.
     """
+    content = make_text_content(message, notice, markdown_convert, reply_to_event_id)
+
+    try:
+        return await client.room_send(
+            room_id,
+            "m.room.message",
+            content,
+            ignore_unverified_devices=True,
+        )
+    except SendRetryError:
+        logger.exception(f"Unable to send message response to {room_id}")
+
+
+def make_text_content(
+    message: str,
+    notice: bool = True,
+    markdown_convert: bool = True,
+    reply_to_event_id: Optional[str] = None,
+) -> dict:
+    """Build the content of a text message event.
+
+    Takes the same arguments as send_text_to_room.
+    """
     # Determine whether to ping room members or not
     msgtype = "m.notice" if notice else "m.text"
 
@@ -54,20 +76,16 @@ async def send_text_to_room(
     }
 
     if markdown_convert:
+        # Imported on first use, as it's slow to import and most replies are
+        # rendered without it
+        from markdown import markdown
+
         content["formatted_body"] = markdown(message)
 
     if reply_to_event_id:
         content["m.relates_to"] = {"m.in_reply_to": {"event_id": reply_to_event_id}}
 
-    try:
-        return await client.room_send(
-            room_id,
-            "m.room.message",
-            content,
-            ignore_unverified_devices=True,
-        )
-    except SendRetryError:
-        logger.exception(f"Unable to send message response to {room_id}")
+    return content
 
 
 def make_pill(user_id: str, displayname: str = None) -> str:
@@ -1,86 +1,430 @@
+import asyncio
 import logging
+import math
+import os
+import uuid
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional
 
-from taskw import TaskWarrior
+from taskbot.backends import TaskBackend
+from taskbot.batching import AddBatcher
+from taskbot.cache import SnapshotCache, TaskChanges
+from taskbot.config import Config
+from taskbot.dashboard import DashboardScheduler
+from taskbot.executor import TaskExecutor
+from taskbot.export import EXPORT_FORMATS, EXPORT_MIMETYPE, exports_directory, write_export
+from taskbot.render import FileReply, Reply
+from taskbot.search import SearchIndex, tokenize
 
 logger = logging.getLogger(__name__)
 
+# Upper bound for the list command's limit argument
+MAX_LIST_LIMIT = 100
+
+# Upper bound for the number of tasks changed by a single message
+MAX_BULK_TASKS = 500
+
 
 class BaseCommand:
-    def __init__(self):
-        self.w = TaskWarrior()
+    # Whether the command changes tasks, in which case it doesn't run at the same
+    # time as any other command using the same data store
+    writes = False
+
+    def __init__(self, config: Config, backend: TaskBackend, cache: SnapshotCache, executor: TaskExecutor):
+        self.config = config
+        self.backend = backend
+        self.cache = cache
+        self.executor = executor
 
-    async def process(self, args: str):
+    async def process(self, args: str, room_id: str):
         raise NotImplementedError
 
-    def _task_id_exists(self, id: int):
-        tasks = self.w.load_tasks()['pending']
-        ids = [t['id'] for t in tasks]
-        return id in ids
+    async def _get_pending_task(self, id: int):
+        snapshot = await self.cache.get()
+        return snapshot.by_id.get(id)
+
+    @staticmethod
+    def _plural(items: list, word: str) -> str:
+        return f"{word}s" if len(items) > 1 else word
+
+    @staticmethod
+    def _format_ids(ids: Iterable[int]) -> str:
+        return ', '.join(str(id) for id in ids)
 
     @staticmethod
     def _parse_date(date_string: str):
         date = datetime.strptime(date_string, '%Y%m%dT%H%M%SZ')
         return date
 
-    @staticmethod
-    def _format_date(date: datetime):
-        delta = datetime.utcnow() - date
-        days = delta.days
-        hours, remainder = divmod(delta.seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-
-        if days:
-            return f'{days}d'
-        elif hours:
-            return f'{hours}h'
-        elif minutes:
-            return f"{minutes}m"
+
+class ListCursor:
+    """Which page of which pending tasks a room is looking at"""
+
+    def __init__(
+        self,
+        limit: int,
+        page: int = 1,
+        project: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        due_before: Optional[str] = None,
+    ):
+        self.limit = limit
+        self.page = page
+        self.project = project
+        self.tags = tags or []
+        self.due_before = due_before
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.project or self.tags or self.due_before)
+
+    def parse_filter(self, word: str) -> bool:
+        """Add a filter argument, such as 'project:Home', '+tag' or
+        'due.before:2022-05-01'.
+
+        Returns:
+            Whether the word was a filter.
+
+        Raises:
+            ValueError: If the filter's value is invalid.
+        """
+        name, sep, value = word.partition(':')
+        if word.startswith('+') and len(word) > 1:
+            self.tags.append(word[1:])
+        elif sep and name in ('project', 'pro') and value:
+            self.project = value
+        elif sep and name == 'due.before':
+            try:
+                due_before = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+            self.due_before = due_before.strftime('%Y%m%dT%H%M%SZ')
         else:
-            return f'{seconds}s'
+            return False
+        return True
+
+    def matches(self, task: dict) -> bool:
+        if self.project:
+            # Like Taskwarrior, project:Home also matches Home.Garden
+            project = task.get('project', '')
+            if project != self.project and not project.startswith(self.project + '.'):
+                return False
+        if self.tags and not set(self.tags).issubset(task.get('tags', ())):
+            return False
+        if self.due_before:
+            # Dates share the same format, so they sort as strings
+            due = task.get('due')
+            if not due or due >= self.due_before:
+                return False
+        return True
 
 
 class ListCommand(BaseCommand):
-    async def process(self, args: str):
-        task_list = self.w.load_tasks()
-        pending_tasks = task_list['pending']
-        if len(pending_tasks) == 0:
-            return "No pending tasks."
-        response = [f"**Current tasks**:"]
-        for task in pending_tasks:
-            date = datetime.strptime(task['entry'], '%Y%m%dT%H%M%SZ')
-            formatted_date = self._format_date(date)
-            response.append(f"**{task['id']}** - **{formatted_date}** - {task['description']}")
-        return '\n\n'.join(response)
+    """Returns pending tasks a page at a time, optionally filtered"""
+
+    usage = "Usage: `list [more] [page:N] [limit:N] [project:NAME] [+TAG] [due.before:YYYY-MM-DD]`"
+
+    def __init__(self, config: Config, backend: TaskBackend, cache: SnapshotCache, executor: TaskExecutor):
+        super().__init__(config, backend, cache, executor)
+        # Last page listed in each room, used by 'list more'
+        self.cursors: Dict[str, ListCursor] = {}
+
+    async def process(self, args: str, room_id: str):
+        words = args.split()
+        if words == ['more']:
+            cursor = self.cursors.get(room_id)
+            if cursor is None:
+                return "Nothing to continue, use `list` first."
+            cursor.page += 1
+        else:
+            try:
+                cursor = self._parse_cursor(words)
+            except ValueError as e:
+                return f"{e}\n\n{self.usage}"
+
+        snapshot = await self.cache.get()
+        matching = [task for task in snapshot.tasks if cursor.matches(task)]
+        if not matching:
+            self.cursors.pop(room_id, None)
+            return "No pending tasks matching the filters." if cursor.filtered else "No pending tasks."
+
+        pages = math.ceil(len(matching) / cursor.limit)
+        if cursor.page > pages:
+            self.cursors.pop(room_id, None)
+            return f"No more tasks, there are {pages} pages."
+        self.cursors[room_id] = cursor
+
+        start = (cursor.page - 1) * cursor.limit
+        page_tasks = matching[start:start + cursor.limit]
+        summary = f"{start + 1}-{start + len(page_tasks)} of {len(matching)}"
+        if cursor.filtered:
+            summary += f" matching ({len(snapshot.tasks)} pending)"
+        summary += f", page {cursor.page}/{pages}"
+        if cursor.page < pages:
+            summary += ", `list more` for the next one"
+        return Reply("Current tasks", summary, tasks=page_tasks)
+
+    def _parse_cursor(self, words: List[str]) -> ListCursor:
+        """Parse list arguments
+
+        Raises:
+            ValueError: If an argument is invalid.
+        """
+        cursor = ListCursor(limit=self.config.list_page_size)
+        for word in words:
+            name, sep, value = word.partition(':')
+            if sep and name in ('page', 'limit'):
+                try:
+                    number = int(value)
+                except ValueError:
+                    number = 0
+                if number < 1:
+                    raise ValueError(f"{name} must be a positive number")
+                if name == 'page':
+                    cursor.page = number
+                else:
+                    cursor.limit = min(number, MAX_LIST_LIMIT)
+            elif not cursor.parse_filter(word):
+                raise ValueError(f"Unknown list argument '{word}'")
+        return cursor
 
 
 class AddCommand(BaseCommand):
-    async def process(self, args: str):
-        description = args
-        task = self.w.task_add(description=description)
-        return f"Task {task['id']} added."
+    """Adds one task per line of the message"""
 
+    writes = True
 
-class DoneCommand(BaseCommand):
-    async def process(self, args: str):
-        id = int(args)
-        if self._task_id_exists(id):
-            self.w.task_done(id=id)
-            return f"Task {id} done."
+    def __init__(self, config: Config, backend: TaskBackend, cache: SnapshotCache, executor: TaskExecutor):
+        super().__init__(config, backend, cache, executor)
+        self.batcher = None
+        if config.add_batch_window_ms:
+            self.batcher = AddBatcher(
+                executor, backend, config.add_batch_window_ms / 1000, max_tasks=MAX_BULK_TASKS
+            )
+            # Adds share the store while they wait for their batch, and the batch
+            # still excludes every other write
+            self.writes = False
+
+    async def process(self, args: str, room_id: str):
+        descriptions = [line.strip() for line in args.splitlines() if line.strip()]
+        if not descriptions:
+            return "Nothing to add."
+        if len(descriptions) > MAX_BULK_TASKS:
+            return f"Too many tasks, at most {MAX_BULK_TASKS} can be added at once."
+
+        if self.batcher:
+            tasks = await self.batcher.add(descriptions)
         else:
-            return f"No pending task matching ID {id}."
+            tasks = await self.executor.run(self.backend.tasks_add, descriptions)
+        for task in tasks:
+            self.cache.added(task, room_id)
+        return f"{self._plural(tasks, 'Task')} {self._format_ids(t['id'] for t in tasks)} added."
+
+
+class DoneCommand(BaseCommand):
+    """Marks tasks as done, given IDs and ranges of IDs such as '3 5 7-12'"""
+
+    writes = True
+
+    async def process(self, args: str, room_id: str):
+        try:
+            ids = self._parse_ids(args)
+        except ValueError as e:
+            return str(e)
+        if not ids:
+            return "Usage: `done <id> [<id>...]`, with IDs such as `3 5 7-12`"
+
+        snapshot = await self.cache.get()
+        tasks = [snapshot.by_id[id] for id in ids if id in snapshot.by_id]
+        missing = [id for id in ids if id not in snapshot.by_id]
+
+        response = []
+        if tasks:
+            uuids = [task['uuid'] for task in tasks]
+            await self.executor.run(self.backend.tasks_done, uuids)
+            for uuid in uuids:
+                self.cache.completed(uuid, room_id)
+            response.append(f"{self._plural(tasks, 'Task')} {self._format_ids(t['id'] for t in tasks)} done.")
+        if missing:
+            response.append(f"No pending task matching {self._plural(missing, 'ID')} {self._format_ids(missing)}.")
+        return '\n\n'.join(response)
+
+    @staticmethod
+    def _parse_ids(args: str) -> List[int]:
+        """Parse IDs and ranges of IDs, separated by spaces or commas
+
+        Raises:
+            ValueError: If an ID or range is invalid, or there are too many IDs.
+        """
+        ids = []
+        for word in args.replace(',', ' ').split():
+            start, sep, end = word.partition('-')
+            try:
+                start = int(start)
+                end = int(end) if sep else start
+            except ValueError:
+                raise ValueError(f"Invalid task ID '{word}'")
+            if start < 1 or end < start:
+                raise ValueError(f"Invalid task ID '{word}'")
+            if len(ids) + end - start >= MAX_BULK_TASKS:
+                raise ValueError(f"Too many tasks, at most {MAX_BULK_TASKS} can be done at once.")
+            ids.extend(range(start, end + 1))
+        # Remove duplicates, keeping the order
+        return list(dict.fromkeys(ids))
 
 
 class InfoCommand(BaseCommand):
-    async def process(self, args: str):
-        id = int(args)
-        if not self._task_id_exists(id):
+    usage = "Usage: `info <id>`"
+
+    async def process(self, args: str, room_id: str):
+        try:
+            ids = DoneCommand._parse_ids(args)
+        except ValueError as e:
+            return str(e)
+        if len(ids) != 1:
+            return self.usage
+        id = ids[0]
+        task_data = await self._get_pending_task(id)
+        if not task_data:
             return f"No pending task matching ID {id}."
-        task = self.w.get_task(id=id)
-        _, task_data = task
         logger.debug(task_data)
+        fields = [('description', task_data['description'])]
         due = task_data.get('due')
-        return f"[{id}] - {task_data['description']} {f' - **due**: {self._parse_date(due)}' if due else ''}"
+        if due:
+            fields.append(('due', str(self._parse_date(due))))
+        return Reply(f"Task {id}", fields=fields)
+
+
+class ExportCommand(BaseCommand):
+    """Sends tasks as a compressed JSON or CSV file, optionally filtered"""
+
+    usage = "Usage: `export [json|csv] [status:pending|completed|all] [project:NAME] [+TAG] [due.before:YYYY-MM-DD]`"
+
+    async def process(self, args: str, room_id: str):
+        words = args.split()
+        export_format = 'json'
+        if words and words[0].lower() in EXPORT_FORMATS:
+            export_format = words.pop(0).lower()
+
+        status = 'pending'
+        cursor = ListCursor(limit=MAX_LIST_LIMIT)
+        try:
+            for word in words:
+                name, sep, value = word.partition(':')
+                if sep and name == 'status' and value in ('pending', 'completed', 'all'):
+                    status = value
+                elif not cursor.parse_filter(word):
+                    raise ValueError(f"Unknown export argument '{word}'")
+        except ValueError as e:
+            return f"{e}\n\n{self.usage}"
+
+        # Written to disk rather than kept in memory, however many tasks there are
+        directory = exports_directory(self.config.store_path)
+        path = os.path.join(directory, f"{uuid.uuid4()}.{export_format}.gz")
+        count = 0
+        try:
+            count = await self.executor.run(
+                write_export, self.backend, path, export_format, status, cursor.matches
+            )
+        finally:
+            if not count and os.path.exists(path):
+                os.remove(path)
+        if not count:
+            return "No tasks matching the filters." if cursor.filtered else f"No {status} tasks."
+
+        filename = f"tasks-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}.gz"
+        return FileReply(
+            path,
+            filename,
+            EXPORT_MIMETYPE,
+            summary=f"Exported {count} task{'s' if count > 1 else ''}.",
+        )
+
+
+class SearchCommand(BaseCommand):
+    """Finds pending tasks from the start of words of their description, project,
+    tags or annotations, best matches first
+    """
+
+    usage = "Usage: `search <words>`, where words may be the start of longer ones"
+
+    def __init__(self, config: Config, backend: TaskBackend, cache: SnapshotCache, executor: TaskExecutor):
+        super().__init__(config, backend, cache, executor)
+        # Built on first use, then kept current as tasks change
+        self.index = SearchIndex()
+        self._built: Optional[asyncio.Future] = None
+        # Changes published while the index is being built
+        self._changes: Optional[List[TaskChanges]] = None
+        cache.subscribe(self._update)
+
+    def _update(self, changes: TaskChanges) -> None:
+        if self._changes is not None:
+            self._changes.append(changes)
+        elif self._built is not None:
+            self.index.update(changes)
+
+    async def _build(self, tasks: List[dict]) -> None:
+        self._changes = []
+        try:
+            await self.index.build(tasks)
+            for changes in self._changes:
+                self.index.update(changes)
+        except BaseException:
+            self._built = None
+            raise
+        finally:
+            self._changes = None
+
+    async def process(self, args: str, room_id: str):
+        if not tokenize(args):
+            return self.usage
+
+        snapshot = await self.cache.get()
+        if self._built is None:
+            self._built = asyncio.ensure_future(self._build(list(snapshot.tasks)))
+        # Searches arriving during the build wait for it, without cancelling it
+        await asyncio.shield(self._built)
+        snapshot = self.cache.snapshot or snapshot
+
+        count, uuids = self.index.search(args, limit=self.config.list_page_size)
+        # IDs are looked up, as they change without the tasks changing
+        tasks = [snapshot.by_uuid[uuid] for uuid in uuids if uuid in snapshot.by_uuid]
+        query = ' '.join(args.split())
+        if not tasks:
+            return f"No pending tasks matching `{query}`."
+
+        summary = f"{count} matching `{query}`"
+        if len(tasks) < count:
+            summary += f", the best {len(tasks)} shown"
+        return Reply("Search results", summary, tasks=tasks)
+
+
+class DashboardCommand(BaseCommand):
+    """Posts a dashboard of the pending tasks in the room, which is then edited as
+    tasks change
+    """
+
+    usage = "Usage: `dashboard [off]`"
+
+    def __init__(self, config: Config, backend: TaskBackend, cache: SnapshotCache, executor: TaskExecutor):
+        super().__init__(config, backend, cache, executor)
+        # Set by the runner when dashboards are enabled
+        self.dashboards: Optional[DashboardScheduler] = None
+
+    async def process(self, args: str, room_id: str):
+        if self.dashboards is None:
+            return "Dashboards are turned off."
+
+        words = args.lower().split()
+        if words == ['off']:
+            if not self.dashboards.hide(room_id):
+                return "There is no dashboard in this room."
+            return "The dashboard won't be updated anymore."
+        if words:
+            return self.usage
+
+        snapshot = await self.cache.get()
+        return self.dashboards.show(room_id, snapshot)
 
 
 task_commands = {
@@ -88,4 +432,7 @@ task_commands = {
     'add': AddCommand,
     'done': DoneCommand,
     'info': InfoCommand,
+    'export': ExportCommand,
+    'search': SearchCommand,
+    'dashboard': DashboardCommand,
 }
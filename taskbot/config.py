@@ -7,6 +7,8 @@ from typing import Any, List, Optional
 import yaml
 
 from taskbot.errors import ConfigError
+from taskbot.executor import EXECUTOR_TYPES
+from taskbot.logs import pipeline
 
 logger = logging.getLogger()
 logging.getLogger("peewee").setLevel(
@@ -17,6 +19,32 @@ logging.getLogger("peewee").setLevel(
 class Config:
     """Creates a Config object from a YAML-encoded config file from a given filepath"""
 
+    # Options applied to the running bot when the config is reloaded. Others need a
+    # restart.
+    RELOADABLE = (
+        "log_level",
+        "file_logging_enabled",
+        "file_logging_filepath",
+        "console_logging_enabled",
+        "log_queue_size",
+        "processed_events_max_age_days",
+        "pool_max_stores",
+        "pool_max_memory_mb",
+        "executor_max_queue",
+        "send_max_retries",
+        "send_max_merged",
+        "reminders_refresh_interval",
+        "profiling_slow_command_ms",
+        "list_page_size",
+        "admission_user_per_minute",
+        "admission_user_burst",
+        "admission_global_per_minute",
+        "admission_global_burst",
+        "admission_max_queued",
+        "admission_busy_reply",
+        "dashboard_delay_ms",
+    )
+
     def __init__(self, filepath: str):
         self.filepath = filepath
         if not os.path.isfile(filepath):
@@ -28,35 +56,66 @@ class Config:
 
         # Parse and validate config options
         self._parse_config_values()
+        # Only once the whole config is valid, so a bad reload changes nothing
+        self._setup_logging()
 
-    def _parse_config_values(self):
-        """Read and validate each config option"""
-        # Logging setup
+    def reload(self) -> List[str]:
+        """Read the config file again, and update the options in RELOADABLE.
+
+        Returns:
+            The names of the options that changed.
+
+        Raises:
+            ConfigError: If the config file is invalid, in which case nothing changes.
+        """
+        new = Config(self.filepath)
+        changed = []
+        for name, value in vars(new).items():
+            if name == "config_dict" or getattr(self, name, None) == value:
+                continue
+            if name in self.RELOADABLE:
+                setattr(self, name, value)
+                changed.append(name)
+            else:
+                logger.warning(f"Restart the bot to apply the new value of {name}")
+        self.config_dict = new.config_dict
+        return changed
+
+    def _setup_logging(self):
+        """Replace the handlers set up by a previous config with the configured ones"""
+        logger.setLevel(self.log_level)
         formatter = logging.Formatter(
             "%(asctime)s | %(name)s [%(levelname)s] %(message)s"
         )
+        handlers = []
+        if self.file_logging_enabled:
+            handlers.append(logging.FileHandler(self.file_logging_filepath))
+        if self.console_logging_enabled:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        # Writing is left to a background thread
+        pipeline.install(handlers, self.log_queue_size)
 
-        log_level = self._get_cfg(["logging", "level"], default="INFO")
-        logger.setLevel(log_level)
-
-        file_logging_enabled = self._get_cfg(
+    def _parse_config_values(self):
+        """Read and validate each config option"""
+        # Logging setup
+        self.log_level = self._get_cfg(["logging", "level"], default="INFO")
+        # getLevelName maps known level names to their number
+        if not isinstance(logging.getLevelName(self.log_level), int) and not isinstance(
+            self.log_level, int
+        ):
+            raise ConfigError(f"Unknown logging.level '{self.log_level}'")
+        self.file_logging_enabled = self._get_cfg(
             ["logging", "file_logging", "enabled"], default=False
         )
-        file_logging_filepath = self._get_cfg(
+        self.file_logging_filepath = self._get_cfg(
             ["logging", "file_logging", "filepath"], default="bot.log"
         )
-        if file_logging_enabled:
-            handler = logging.FileHandler(file_logging_filepath)
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
-
-        console_logging_enabled = self._get_cfg(
+        self.console_logging_enabled = self._get_cfg(
             ["logging", "console_logging", "enabled"], default=True
         )
-        if console_logging_enabled:
-            handler = logging.StreamHandler(sys.stdout)
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
+        self.log_queue_size = self._get_positive_int(["logging", "queue_size"], default=10000)
 
         # Storage setup
         self.store_path = self._get_cfg(["storage", "store_path"], required=True)
@@ -70,6 +129,10 @@ class Config:
                     f"storage.store_path '{self.store_path}' is not a directory"
                 )
 
+        # Commands the bot handled are remembered this long, so they don't run again
+        self.processed_events_max_age_days = self._get_positive_int(
+            ["storage", "processed_events_max_age_days"], default=30
+        )
 
         # Matrix bot account setup
         self.user_id = self._get_cfg(["matrix", "user_id"], required=False)
@@ -84,7 +147,133 @@ class Config:
             ["matrix", "device_name"], default="nio-template"
         )
         self.homeserver_url = self._get_cfg(["matrix", "homeserver_url"], required=True)
+        self.filtered_sync = self._get_cfg(
+            ["matrix", "filtered_sync"], default=True, required=False
+        )
+
+        # Taskwarrior setup
+        self.taskwarrior_backend = self._get_cfg(
+            ["taskwarrior", "backend"], default="taskw", required=False
+        )
+        self.taskrc = self._get_cfg(["taskwarrior", "taskrc"], required=False)
+        self.per_user = self._get_cfg(
+            ["taskwarrior", "per_user"], default=False, required=False
+        )
+        self.users_directory = self._get_cfg(
+            ["taskwarrior", "users_directory"],
+            default=os.path.join(self.store_path, "users"),
+            required=False,
+        )
+        self.pool_max_stores = self._get_positive_int(
+            ["taskwarrior", "pool", "max_stores"], default=32
+        )
+        self.pool_max_memory_mb = self._get_positive_int(
+            ["taskwarrior", "pool", "max_memory_mb"], default=256
+        )
+
+        self.watch_enabled = self._get_cfg(
+            ["taskwarrior", "watch", "enabled"], default=True, required=False
+        )
+        self.watch_poll_interval = self._get_positive_int(
+            ["taskwarrior", "watch", "poll_interval"], default=5
+        )
+
+        self.executor_type = self._get_cfg(
+            ["taskwarrior", "executor", "type"], default="thread", required=False
+        )
+        if self.executor_type not in EXECUTOR_TYPES:
+            raise ConfigError(
+                f"taskwarrior.executor.type must be one of {', '.join(EXECUTOR_TYPES)}"
+            )
+        self.executor_max_workers = self._get_positive_int(
+            ["taskwarrior", "executor", "max_workers"], default=4
+        )
+        self.executor_max_queue = self._get_positive_int(
+            ["taskwarrior", "executor", "max_queue"], default=32
+        )
+
+        # Sending setup
+        self.send_max_retries = self._get_int(["sending", "max_retries"], default=5)
+        self.send_max_merged = self._get_positive_int(
+            ["sending", "max_merged"], default=10
+        )
+
+        # Admission control setup
+        self.admission_user_per_minute = self._get_int(
+            ["admission", "user_per_minute"], default=60
+        )
+        self.admission_user_burst = self._get_positive_int(
+            ["admission", "user_burst"], default=10
+        )
+        self.admission_global_per_minute = self._get_int(
+            ["admission", "global_per_minute"], default=0
+        )
+        self.admission_global_burst = self._get_positive_int(
+            ["admission", "global_burst"], default=100
+        )
+        self.admission_max_queued = self._get_int(["admission", "max_queued"], default=100)
+        self.admission_busy_reply = self._get_cfg(
+            ["admission", "busy_reply"], default=True, required=False
+        )
+
+        # Reminders setup
+        self.reminders_enabled = self._get_cfg(
+            ["reminders", "enabled"], default=True, required=False
+        )
+        self.reminders_room_id = self._get_cfg(["reminders", "room_id"], required=False)
+        self.reminders_refresh_interval = self._get_positive_int(
+            ["reminders", "refresh_interval"], default=300
+        )
+
+        # Dashboards setup
+        self.dashboard_enabled = self._get_cfg(
+            ["dashboard", "enabled"], default=True, required=False
+        )
+        self.dashboard_delay_ms = self._get_int(["dashboard", "delay_ms"], default=5000)
 
+        # Metrics setup
+        self.metrics_enabled = self._get_cfg(
+            ["metrics", "enabled"], default=False, required=False
+        )
+        self.metrics_host = self._get_cfg(
+            ["metrics", "host"], default="127.0.0.1", required=False
+        )
+        self.metrics_port = self._get_positive_int(["metrics", "port"], default=9163)
+
+        # Profiling setup
+        self.profiling_slow_command_ms = self._get_int(
+            ["profiling", "slow_command_ms"], default=0
+        )
+        self.profiling_loop_stall_ms = self._get_int(
+            ["profiling", "loop_stall_ms"], default=0
+        )
+
+        # Commands setup
+        self.list_page_size = self._get_positive_int(
+            ["commands", "list", "page_size"], default=20
+        )
+        self.add_batch_window_ms = self._get_int(
+            ["commands", "add", "batch_window_ms"], default=0
+        )
+
+    def _get_positive_int(self, path: List[str], default: int) -> int:
+        """Get an optional config option that must be a positive integer.
+
+        Raises:
+            ConfigError: If the option is set to anything but a positive integer.
+        """
+        return self._get_int(path, default, minimum=1)
+
+    def _get_int(self, path: List[str], default: int, minimum: int = 0) -> int:
+        """Get an optional config option that must be an integer of at least minimum.
+
+        Raises:
+            ConfigError: If the option is set to anything else.
+        """
+        value = self._get_cfg(path, default=default, required=False)
+        if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+            raise ConfigError(f"{'.'.join(path)} must be an integer of at least {minimum}")
+        return value
 
     def _get_cfg(
         self,
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional, Set
+
+from aiohttp import ClientError
+from nio import AsyncClient, RoomGetStateEventResponse, RoomPutStateResponse
+
+from taskbot.cache import SnapshotCache, TaskChanges, TaskSnapshot
+from taskbot.outbox import Outbox
+from taskbot.render import DashboardReply, Reply
+
+logger = logging.getLogger(__name__)
+
+# Rooms with a dashboard, in the directory of each store
+ROOMS_FILENAME = "dashboard_rooms.json"
+
+# Event of the dashboard of each room, in the bot's store path
+MESSAGES_FILENAME = "dashboards.json"
+
+# Changes that keep coming delay an update by at most this many times the delay
+MAX_DELAY_FACTOR = 6
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except ValueError:
+        logger.warning(f"Ignoring invalid {path}")
+        return default
+
+
+def _save_json(path: str, value) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def render_dashboard(snapshot: TaskSnapshot, limit: int) -> Reply:
+    """The dashboard of a store's pending tasks"""
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+    tasks = snapshot.tasks[:limit]
+    if not tasks:
+        return Reply("Dashboard", f"no pending tasks, updated {now} UTC")
+    summary = f"{len(snapshot.tasks)} pending"
+    if len(tasks) < len(snapshot.tasks):
+        summary += f", the first {len(tasks)} shown"
+    return Reply("Dashboard", f"{summary}, updated {now} UTC", tasks=tasks)
+
+
+class DashboardScheduler:
+    """Updates the dashboards of a store's rooms when its pending tasks change.
+
+    Updates are debounced: one is sent once the tasks stopped changing for delay
+    seconds, so a burst of changes gives a single edit. Changes that keep coming
+    delay it by at most MAX_DELAY_FACTOR times the delay.
+    """
+
+    def __init__(
+        self,
+        cache: SnapshotCache,
+        send: Callable[[str, DashboardReply], None],
+        store_path: str,
+        delay: float = 5,
+        limit: int = 20,
+    ):
+        """
+        Args:
+            cache: Snapshot cache of the tasks shown.
+
+            send: Called with a room ID and a dashboard to show it.
+
+            store_path: Directory where the rooms with a dashboard are saved.
+
+            delay: How long, in seconds, the tasks must stay unchanged before the
+                dashboards are updated.
+
+            limit: How many tasks a dashboard shows.
+        """
+        self.cache = cache
+        self.send = send
+        self.delay = delay
+        self.limit = limit
+
+        self._rooms_path = os.path.join(store_path, ROOMS_FILENAME)
+        self.rooms: Set[str] = set(_load_json(self._rooms_path, []))
+
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # When the first change not shown yet was made
+        self._changed_at: Optional[float] = None
+        self._update_task: Optional[asyncio.Task] = None
+
+        # Statistics
+        self.updates = 0
+
+        cache.subscribe(self.on_changes)
+
+    @classmethod
+    def from_config(cls, cache: SnapshotCache, send, store_path: str, config) -> "DashboardScheduler":
+        return cls(
+            cache,
+            send,
+            store_path,
+            delay=config.dashboard_delay_ms / 1000,
+            limit=config.list_page_size,
+        )
+
+    def show(self, room_id: str, snapshot: TaskSnapshot) -> DashboardReply:
+        """Add a room's dashboard, and return it to be posted"""
+        if room_id not in self.rooms:
+            self.rooms.add(room_id)
+            _save_json(self._rooms_path, sorted(self.rooms))
+        return DashboardReply(render_dashboard(snapshot, self.limit), new=True)
+
+    def hide(self, room_id: str) -> bool:
+        """Stop updating a room's dashboard. Returns whether it had one."""
+        if room_id not in self.rooms:
+            return False
+        self.rooms.discard(room_id)
+        _save_json(self._rooms_path, sorted(self.rooms))
+        return True
+
+    def on_changes(self, changes: TaskChanges) -> None:
+        if not self.rooms:
+            return
+        now = time.monotonic()
+        if self._changed_at is None:
+            self._changed_at = now
+        # Wait for the changes to stop, but not forever
+        due = min(now + self.delay, self._changed_at + self.delay * MAX_DELAY_FACTOR)
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_at(loop.time() + due - now, self._start_update)
+
+    def _start_update(self) -> None:
+        self._timer = None
+        self._changed_at = None
+        if self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.create_task(self._update())
+
+    async def _update(self) -> None:
+        try:
+            snapshot = await self.cache.get()
+        except Exception:
+            logger.exception("Failed to update dashboards")
+            return
+        reply = render_dashboard(snapshot, self.limit)
+        for room_id in sorted(self.rooms):
+            self.send(room_id, DashboardReply(reply))
+        self.updates += 1
+
+    async def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._update_task is not None:
+            self._update_task.cancel()
+            await asyncio.gather(self._update_task, return_exceptions=True)
+            self._update_task = None
+
+
+class DashboardMessages:
+    """Posts the dashboard of each room, and then edits it in place with m.replace
+    events. Runs in the bot's process, which knows the event IDs.
+
+    A new dashboard is pinned to the room, replacing the previous one, if the bot is
+    allowed to.
+    """
+
+    def __init__(self, client: AsyncClient, outbox: Outbox, store_path: str):
+        """
+        Args:
+            client: Used to pin dashboards.
+
+            outbox: Sends the dashboards and their edits.
+
+            store_path: Directory where the event of each dashboard is saved.
+        """
+        self.client = client
+        self.outbox = outbox
+        self._path = os.path.join(store_path, MESSAGES_FILENAME)
+        self.event_ids: Dict[str, str] = _load_json(self._path, {})
+        # Number of new dashboards of each room waiting for their event ID, and the
+        # latest update of those rooms, shown once they have one
+        self._posting: Dict[str, int] = {}
+        self._updates: Dict[str, dict] = {}
+        self._pins: Set[asyncio.Task] = set()
+
+        # Statistics
+        self.edits = 0
+
+    def show(self, room_id: str, content: dict, new: bool = False) -> None:
+        """Post a room's dashboard, or edit the existing one
+
+        Args:
+            room_id: The dashboard's room.
+
+            content: The content of the dashboard's m.room.message event.
+
+            new: Whether to post a new dashboard even if the room has one.
+        """
+        # A new dashboard is asked for by a command, so it's always posted
+        if new:
+            self._post(room_id, content)
+            return
+        if room_id in self._posting:
+            self._updates[room_id] = content
+            return
+        event_id = self.event_ids.get(room_id)
+        if event_id is None:
+            self._post(room_id, content)
+            return
+
+        # Clients that don't support edits show the fallback, marked with a '*'
+        edit = {"msgtype": content["msgtype"], "body": f"* {content['body']}"}
+        if "formatted_body" in content:
+            edit["format"] = content["format"]
+            edit["formatted_body"] = f"* {content['formatted_body']}"
+        edit["m.new_content"] = content
+        edit["m.relates_to"] = {"rel_type": "m.replace", "event_id": event_id}
+        self.edits += 1
+        self.outbox.send(
+            room_id,
+            edit,
+            # Only the latest edit of a dashboard needs sending
+            key=f"dashboard {event_id}",
+        )
+
+    def _post(self, room_id: str, content: dict) -> None:
+        self._posting[room_id] = self._posting.get(room_id, 0) + 1
+        self.outbox.send(
+            room_id, content, on_sent=lambda event_id: self._posted(room_id, event_id)
+        )
+
+    def _posted(self, room_id: str, event_id: Optional[str]) -> None:
+        self._posting[room_id] -= 1
+        if not self._posting[room_id]:
+            del self._posting[room_id]
+
+        # When dropped, the room keeps its previous dashboard, if any
+        if event_id is not None:
+            old_event_id = self.event_ids.get(room_id)
+            self.event_ids[room_id] = event_id
+            _save_json(self._path, self.event_ids)
+            task = asyncio.create_task(self._pin(room_id, old_event_id, event_id))
+            self._pins.add(task)
+            task.add_done_callback(self._pins.discard)
+
+        if room_id not in self._posting:
+            content = self._updates.pop(room_id, None)
+            if content is not None:
+                self.show(room_id, content)
+
+    async def _pin(self, room_id: str, old_event_id: Optional[str], event_id: str) -> None:
+        """Pin a new dashboard in place of the previous one"""
+        try:
+            response = await self.client.room_get_state_event(room_id, "m.room.pinned_events")
+            pinned = []
+            if isinstance(response, RoomGetStateEventResponse):
+                pinned = [id for id in response.content.get("pinned", []) if id != old_event_id]
+            response = await self.client.room_put_state(
+                room_id, "m.room.pinned_events", {"pinned": pinned + [event_id]}
+            )
+        except (ClientError, asyncio.TimeoutError) as e:
+            response = e
+        # Pinning needs a power level the bot may not have, which is fine
+        if not isinstance(response, RoomPutStateResponse):
+            logger.info(f"Couldn't pin the dashboard of {room_id}: {response!r}")
+
+    async def close(self) -> None:
+        await asyncio.gather(*self._pins, return_exceptions=True)
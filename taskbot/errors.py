@@ -10,3 +10,25 @@ class ConfigError(RuntimeError):
 
     def __init__(self, msg: str):
         super(ConfigError, self).__init__("%s" % (msg,))
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when too many Taskwarrior calls are already waiting for a worker.
+
+    Args:
+        msg: The message displayed to the user on error.
+    """
+
+    def __init__(self, msg: str):
+        super(ExecutorBusyError, self).__init__("%s" % (msg,))
+
+
+class WorkerError(RuntimeError):
+    """Raised when a command sent to a worker process failed.
+
+    Args:
+        msg: The message displayed to the user on error.
+    """
+
+    def __init__(self, msg: str):
+        super(WorkerError, self).__init__("%s" % (msg,))
@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import time
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FILENAME = "processed_events.db"
+
+# How often old events are pruned, in seconds
+PRUNE_INTERVAL = 24 * 3600
+
+
+class BloomFilter:
+    """A set of strings that may give false positives, but never false negatives"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: Number of items the filter is sized for. More items may be
+                added, at the cost of more false positives.
+
+            error_rate: Rate of false positives once the filter holds capacity items.
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # Double hashing, from the two halves of a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class ProcessedEvents:
+    """IDs of the events the bot handled, so that events it gets again, after a
+    store reset or a replayed sync, are ignored.
+
+    Event IDs are saved in an SQLite database. A Bloom filter of them is kept in
+    memory, so checking an event the bot hasn't handled, which is nearly every
+    event, doesn't touch the database.
+
+    Events older than max_age are pruned. As they can't be told apart from new
+    events anymore, events that old are considered handled.
+    """
+
+    def __init__(self, store_path: str, max_age: float = 30 * 86400, capacity: int = 100000):
+        """
+        Args:
+            store_path: Directory of the database.
+
+            max_age: How long event IDs are kept, in seconds.
+
+            capacity: Number of events the Bloom filter is sized for. It grows
+                when pruning finds more events.
+        """
+        self.path = os.path.join(store_path, EVENTS_FILENAME)
+        self.max_age = max_age
+        self.capacity = capacity
+        self._db = sqlite3.connect(self.path)
+        # Durable enough for an index, and much faster to commit to
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events (event_id TEXT PRIMARY KEY, timestamp REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)")
+        self._db.commit()
+        self._last_prune = 0.0
+        self.prune()
+
+    @classmethod
+    def from_config(cls, config) -> "ProcessedEvents":
+        return cls(config.store_path, max_age=config.processed_events_max_age_days * 86400)
+
+    def seen(self, event_id: str, timestamp: Optional[float] = None) -> bool:
+        """Whether an event was already handled
+
+        Args:
+            event_id: ID of the event.
+
+            timestamp: When the event was sent, as a UNIX timestamp.
+        """
+        if timestamp is not None and timestamp < time.time() - self.max_age:
+            return True
+        if event_id not in self._filter:
+            return False
+        row = self._db.execute("SELECT 1 FROM events WHERE event_id = ?", (event_id,)).fetchone()
+        return row is not None
+
+    def add(self, event_id: str, timestamp: Optional[float] = None) -> None:
+        """Record that an event was handled"""
+        self._db.execute(
+            "INSERT OR IGNORE INTO events VALUES (?, ?)", (event_id, timestamp or time.time())
+        )
+        self._db.commit()
+        self._filter.add(event_id)
+
+        if time.time() - self._last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self) -> None:
+        """Forget events older than max_age, and rebuild the Bloom filter"""
+        self._last_prune = time.time()
+        with self._db:
+            deleted = self._db.execute(
+                "DELETE FROM events WHERE timestamp < ?", (self._last_prune - self.max_age,)
+            ).rowcount
+        count = self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+        self.capacity = max(self.capacity, 2 * count)
+        self._filter = BloomFilter(self.capacity)
+        for (event_id,) in self._db.execute("SELECT event_id FROM events"):
+            self._filter.add(event_id)
+        logger.debug(f"Pruned {deleted} processed events, {count} left")
+
+    def close(self) -> None:
+        self._db.close()
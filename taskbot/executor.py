@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Callable, Optional
+
+from taskbot.errors import ExecutorBusyError
+from taskbot.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_TYPES = ("thread", "process")
+
+
+def _name(func: Callable) -> str:
+    while isinstance(func, functools.partial):
+        func = func.func
+    return getattr(func, "__name__", repr(func))
+
+
+def _timed_call(submitted: float, func: Callable, *args) -> Any:
+    """Run func in a worker and return how long it sat in the queue and how long it
+    ran, along with its result.
+
+    time.monotonic() is system-wide on Linux, so this also holds for process pools.
+    """
+    started = time.monotonic()
+    result = func(*args)
+    return started - submitted, time.monotonic() - started, result
+
+
+class TaskExecutor:
+    """Runs blocking Taskwarrior calls in a bounded worker pool, so they don't block
+    the event loop.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        max_queue: int = 32,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        Args:
+            kind: Either 'thread' or 'process'.
+
+            max_workers: Number of workers in the pool.
+
+            max_queue: How many calls may wait for a free worker before new calls are
+                rejected with an ExecutorBusyError.
+
+            metrics: Where to record the duration of calls.
+        """
+        # Imported here, as the config module imports EXECUTOR_TYPES
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        if kind == "thread":
+            self._pool = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="taskbot-worker"
+            )
+        elif kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError(f"Unknown executor type '{kind}'")
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.metrics = metrics or Metrics()
+
+        # Number of calls either running or waiting for a worker
+        self.pending = 0
+
+        # Queue wait statistics, in seconds
+        self.calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    @classmethod
+    def from_config(cls, config, metrics: Optional[Metrics] = None) -> "TaskExecutor":
+        return cls(
+            kind=config.executor_type,
+            max_workers=config.executor_max_workers,
+            max_queue=config.executor_max_queue,
+            metrics=metrics,
+        )
+
+    @property
+    def queued(self) -> int:
+        """Number of calls waiting for a free worker"""
+        return max(0, self.pending - self.max_workers)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool and return its result.
+
+        Raises:
+            ExecutorBusyError: If the queue is already full.
+        """
+        if self.pending >= self.max_workers + self.max_queue:
+            raise ExecutorBusyError(
+                f"{self.queued} Taskwarrior calls already waiting for a worker"
+            )
+
+        if kwargs:
+            func = functools.partial(func, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            wait, duration, result = await loop.run_in_executor(
+                self._pool, _timed_call, time.monotonic(), func, *args
+            )
+        finally:
+            self.pending -= 1
+
+        self._record_call(func, wait, duration)
+        return result
+
+    def _record_call(self, func: Callable, wait: float, duration: float) -> None:
+        name = _name(func)
+        self.metrics.taskwarrior_seconds.observe(duration, name)
+        self.metrics.taskwarrior_wait_seconds.observe(wait)
+        self.calls += 1
+        self.total_wait += wait
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+        logger.debug(
+            "%s waited %.1fms for a worker and ran for %.1fms (%d pending)",
+            name,
+            wait * 1000,
+            duration * 1000,
+            self.pending,
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
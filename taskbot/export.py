@@ -0,0 +1,80 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+from typing import Callable
+
+from taskbot.backends import TaskBackend
+
+EXPORT_FORMATS = ("json", "csv")
+
+# Exports wait in this subdirectory of the store path until they are uploaded
+EXPORTS_DIRECTORY = "exports"
+
+# Columns of CSV exports. Tags are joined with spaces, and annotations left out.
+CSV_FIELDS = ("id", "uuid", "status", "project", "tags", "due", "entry", "end", "description")
+
+# Exports are sent compressed
+EXPORT_MIMETYPE = "application/gzip"
+
+
+def exports_directory(store_path: str) -> str:
+    """The directory of exports waiting to be uploaded, created if needed"""
+    directory = os.path.join(store_path, EXPORTS_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def clear_exports(store_path: str) -> None:
+    """Delete the exports left by a bot that stopped before uploading them"""
+    shutil.rmtree(os.path.join(store_path, EXPORTS_DIRECTORY), ignore_errors=True)
+
+
+def write_export(
+    backend: TaskBackend,
+    path: str,
+    export_format: str,
+    status: str,
+    matches: Callable[[dict], bool],
+) -> int:
+    """Write tasks to a gzip compressed file, one task at a time, so memory use
+    doesn't depend on the number of tasks.
+
+    Args:
+        backend: Where tasks are read from.
+
+        path: The file to write.
+
+        export_format: One of EXPORT_FORMATS. JSON exports are a list of tasks in
+            the same format as 'task export'.
+
+        status: Which tasks to export, as a taskw command: 'pending',
+            'completed' or 'all'.
+
+        matches: Called with each task, to tell whether it is exported.
+
+    Returns:
+        The number of exported tasks.
+    """
+    count = 0
+    with gzip.open(path, "wt", newline="") as f:
+        if export_format == "csv":
+            writer = csv.DictWriter(f, CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+        else:
+            f.write("[")
+
+        for task in backend.iter_tasks(status):
+            if not matches(task):
+                continue
+            if export_format == "csv":
+                writer.writerow(dict(task, tags=" ".join(task.get("tags", ()))))
+            else:
+                f.write(",\n" if count else "\n")
+                f.write(json.dumps(task))
+            count += 1
+
+        if export_format == "json":
+            f.write("\n]\n")
+    return count
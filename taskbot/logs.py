@@ -0,0 +1,75 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+from typing import List, Optional
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records for a QueueListener without ever blocking. Records arriving
+    while the queue is full are dropped and counted.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(queue.Queue(max_size))
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Sends the root logger's records through a bounded queue to a background
+    thread, which writes them to the actual handlers. Logging then never blocks the
+    event loop on a file or a terminal.
+
+    Installing the pipeline again replaces the previous one, after writing out its
+    queued records.
+    """
+
+    def __init__(self):
+        self.handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        # Records dropped by previous handlers
+        self._dropped = 0
+        atexit.register(self.stop)
+
+    @property
+    def dropped(self) -> int:
+        """Number of records dropped because the queue was full"""
+        return self._dropped + (self.handler.dropped if self.handler else 0)
+
+    def install(self, handlers: List[logging.Handler], max_size: int) -> None:
+        """Route the root logger's records to handlers
+
+        Args:
+            handlers: Where records are written, from the listener's thread.
+
+            max_size: How many records may wait to be written.
+        """
+        self.stop()
+        self.handler = DroppingQueueHandler(max_size)
+        self.listener = logging.handlers.QueueListener(
+            self.handler.queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        logging.getLogger().addHandler(self.handler)
+
+    def stop(self) -> None:
+        """Write out the queued records and close the handlers"""
+        if self.handler is None:
+            return
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self._dropped += self.handler.dropped
+        self.handler = None
+        self.listener = None
+
+
+# The pipeline of the root logger, set up by Config
+pipeline = LogPipeline()
@@ -1,27 +1,37 @@
 #!/usr/bin/env python3
 import argparse
-import asyncio
 import logging
+import signal
 import sys
-from getpass import getpass
-
-from aiohttp import ClientConnectionError, ServerDisconnectedError
-from nio import (
-    AsyncClient,
-    AsyncClientConfig,
-    LoginError,
-    MegolmEvent,
-    RoomMessageText,
-    UnknownEvent, SyncError, )
-
-from taskbot.callbacks import Callbacks
-from taskbot.config import Config
+import time
+
 from taskbot.errors import ConfigError
 
+# Modules needed by a single subcommand are imported in that subcommand, so that
+# `taskbot --help` and `taskbot login` don't pay for the whole bot.
+# tests/test_imports.py checks that it stays that way.
+
 logger = logging.getLogger(__name__)
 
 
 async def run_bot(args):
+    started = time.monotonic()
+
+    import asyncio
+
+    from aiohttp import ClientConnectionError, ServerDisconnectedError
+    from nio import (
+        AsyncClient,
+        AsyncClientConfig,
+        LoginError,
+        MegolmEvent,
+        RoomMessageText,
+        UnknownEvent, SyncError, SyncResponse, )
+
+    from taskbot.callbacks import Callbacks
+    from taskbot.config import Config
+    from taskbot.sync import first_sync_filter, upload_sync_filter
+
     config_path = args.config_path
     try:
         config = Config(config_path)
@@ -51,7 +61,12 @@ async def run_bot(args):
         client.access_token = config.user_token
         client.user_id = config.user_id
 
-    callbacks = Callbacks(client, config)
+    try:
+        callbacks = Callbacks(client, config, workers=args.workers)
+    except ConfigError as e:
+        logger.error(f"Could not load config: {e}")
+        await client.close()
+        sys.exit(1)
 
     try:
         if config.user_token:
@@ -87,7 +102,17 @@ async def run_bot(args):
 
         logger.info(f"Logged in as {config.user_id}")
 
-        response = await client.sync()
+        if config.filtered_sync:
+            # Stick to the events we handle, and resume from the stored sync token
+            if client.loaded_sync_token:
+                logger.info("Resuming sync from the stored sync token")
+            response = await client.sync(sync_filter=first_sync_filter())
+            sync_filter = await upload_sync_filter(client)
+            full_state = False
+        else:
+            response = await client.sync()
+            sync_filter = None
+            full_state = True
         if isinstance(response, SyncError) and response.status_code == 'M_UNKNOWN_TOKEN':
             logger.error("Invalid access token. Run the login command and set matrix.user_token again")
             return False
@@ -95,17 +120,31 @@ async def run_bot(args):
         client.add_event_callback(callbacks.decryption_failure, (MegolmEvent,))
         client.add_event_callback(callbacks.unknown, (UnknownEvent,))
         client.add_event_callback(callbacks.message, (RoomMessageText,))
-        await client.sync_forever(timeout=30000, full_state=True)
+        client.add_response_callback(callbacks.sync, (SyncResponse,))
+        await callbacks.start()
+        # Settings that can change without losing the session are applied on SIGHUP
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, callbacks.reload_config)
+        logger.info(f"Ready in {time.monotonic() - started:.2f}s")
+        await client.sync_forever(
+            timeout=30000, sync_filter=sync_filter, full_state=full_state
+        )
 
     except (ClientConnectionError, ServerDisconnectedError):
         logger.error("Unable to connect to homeserver.")
 
     finally:
-        # Make sure to close the client connection on disconnect
+        # Let pending replies go out before closing the client connection
+        await callbacks.close()
         await client.close()
 
 
 async def login(args):
+    from getpass import getpass
+
+    from nio import AsyncClient, AsyncClientConfig
+
+    from taskbot.config import Config
+
     config_path = args.config_path
     # Read the parsed config file and create a Config object
     try:
@@ -154,6 +193,10 @@ def main():
     # run bot
     run_parser = sub_parsers.add_parser('run')
     run_parser.add_argument('config_path')
+    run_parser.add_argument(
+        '--workers', type=int, default=0, metavar='N',
+        help='run commands in N worker processes instead of the main process',
+    )
     run_parser.set_defaults(cmd='run')
 
     # login
@@ -162,6 +205,8 @@ def main():
     login_parser.set_defaults(cmd='login')
     args = parser.parse_args()
 
+    import asyncio
+
     loop = asyncio.get_event_loop()
     if args.cmd == 'run':
         try:
@@ -0,0 +1,254 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Syncs return after at most the 30s long polling timeout when nothing happens
+SYNC_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 35, 60, 120, 300)
+
+# How often the event loop lag is measured, in seconds
+LAG_INTERVAL = 0.5
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return f"{{{','.join(pairs)}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, function: Callable[[], float]):
+        super().__init__(name, help)
+        self.function = function
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {_format_value(self.function())}"]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Per labels, the count of each bucket, the last one being +Inf, and the
+        # sum of the observations
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] = self._sums.get(labels, 0.0) + value
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}"
+                )
+            suffix = _format_labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(self._sums[labels])}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """The bot's metrics, rendered in the Prometheus text format.
+
+    Metrics are always recorded, as doing so is cheap, and only served when enabled
+    in the config.
+    """
+
+    def __init__(self):
+        self.command_seconds = Histogram(
+            "taskbot_command_seconds",
+            "Time to run a command, from its message being handled to its reply being queued",
+            labels=("command",),
+        )
+        self.taskwarrior_seconds = Histogram(
+            "taskbot_taskwarrior_seconds",
+            "Time spent in Taskwarrior calls",
+            labels=("function",),
+        )
+        self.taskwarrior_wait_seconds = Histogram(
+            "taskbot_taskwarrior_wait_seconds",
+            "Time Taskwarrior calls waited for a free worker",
+        )
+        self.room_send_seconds = Histogram(
+            "taskbot_room_send_seconds", "Time taken by each room_send request"
+        )
+        self.room_send_failures = Counter(
+            "taskbot_room_send_failures_total",
+            "Failed room_send requests, by error code or exception",
+            labels=("reason",),
+        )
+        self.messages_dropped = Counter(
+            "taskbot_messages_dropped_total", "Messages dropped after failing to send"
+        )
+        self.commands_shed = Counter(
+            "taskbot_commands_shed_total",
+            "Commands not run as the bot was too busy, by the limit they went over",
+            labels=("reason",),
+        )
+        self.sync_interval_seconds = Histogram(
+            "taskbot_sync_interval_seconds",
+            "Time between two sync responses",
+            buckets=SYNC_BUCKETS,
+        )
+        self.event_loop_lag_seconds = Histogram(
+            "taskbot_event_loop_lag_seconds",
+            "How late the event loop runs scheduled callbacks",
+        )
+        self._metrics: List[Metric] = [
+            self.command_seconds,
+            self.taskwarrior_seconds,
+            self.taskwarrior_wait_seconds,
+            self.room_send_seconds,
+            self.room_send_failures,
+            self.messages_dropped,
+            self.commands_shed,
+            self.sync_interval_seconds,
+            self.event_loop_lag_seconds,
+        ]
+        self._last_sync: Optional[float] = None
+
+    def add_gauge(self, name: str, help: str, function: Callable[[], float]) -> None:
+        self._metrics.append(Gauge(name, help, function))
+
+    def synced(self) -> None:
+        """Record that a sync response was received"""
+        now = time.monotonic()
+        if self._last_sync is not None:
+            self.sync_interval_seconds.observe(now - self._last_sync)
+        self._last_sync = now
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves the metrics over HTTP at /metrics, and measures the event loop lag
+    while running.
+    """
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9163):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._lag_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, metrics: Metrics, config) -> "MetricsServer":
+        return cls(metrics, host=config.metrics_host, port=config.metrics_port)
+
+    async def start(self) -> None:
+        # Imported here, as the executor records its metrics in this module and the
+        # config module, which must stay light, imports the executor
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.create_task(self._measure_lag())
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        return web.Response(
+            body=self.metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def _measure_lag(self) -> None:
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.metrics.event_loop_lag_seconds.observe(max(0.0, time.monotonic() - expected))
@@ -0,0 +1,325 @@
+import asyncio
+import html
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+from aiohttp import ClientError
+from nio import AsyncClient, ErrorResponse, SendRetryError, UploadResponse
+
+from taskbot.chat_functions import make_text_content
+from taskbot.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Used when a rate limited response doesn't say how long to wait
+DEFAULT_RETRY_AFTER_MS = 5000
+
+# Merged messages stay well below the 64KiB event size limit
+MAX_MERGED_BODY = 16 * 1024
+
+# Only text messages are merged
+TEXT_MSGTYPES = ("m.text", "m.notice")
+
+
+def _transient(response: ErrorResponse) -> bool:
+    """Whether sending again may succeed after an error response: a server error,
+    or a response that isn't a Matrix error, from a proxy for instance
+    """
+    if response.status_code is None:
+        return True
+    status = getattr(getattr(response, "transport_response", None), "status", None)
+    return isinstance(status, int) and status >= 500
+
+
+class OutgoingMessage:
+    def __init__(
+        self,
+        content: dict,
+        upload_path: Optional[str] = None,
+        on_sent: Optional[Callable[[Optional[str]], None]] = None,
+        key: Optional[str] = None,
+    ):
+        self.content = content
+        # File uploaded, then deleted, before the message is sent
+        self.upload_path = upload_path
+        # Called with the event ID once sent, or with None if dropped
+        self.on_sent = on_sent
+        # A message queued with the same key replaces this one while it waits
+        self.key = key
+        self.queued_at = time.monotonic()
+
+    def can_merge(self, other: "OutgoingMessage") -> bool:
+        return (
+            self.content.get("msgtype") in TEXT_MSGTYPES
+            and not (self.on_sent or other.on_sent or self.key or other.key)
+            and self.content.get("msgtype") == other.content.get("msgtype")
+            and "m.relates_to" not in self.content
+            and "m.relates_to" not in other.content
+            and len(self.content["body"]) + len(other.content["body"]) <= MAX_MERGED_BODY
+        )
+
+    def merge(self, other: "OutgoingMessage") -> None:
+        """Append another message to this one"""
+        if "formatted_body" in self.content or "formatted_body" in other.content:
+            self.content["formatted_body"] = "\n".join(
+                message.content.get("formatted_body")
+                or f"<p>{html.escape(message.content['body'])}</p>"
+                for message in (self, other)
+            )
+        self.content["body"] = f"{self.content['body']}\n\n{other.content['body']}"
+
+
+class Outbox:
+    """Sends messages in the background.
+
+    Messages to a room are sent in order. A rate limited send waits as long as the
+    homeserver asks, and other failures are retried with exponential backoff. When
+    several messages for a room are waiting, they are merged into a single event.
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        max_retries: int = 5,
+        max_merged: int = 10,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        Args:
+            client: The client to communicate to matrix with.
+
+            max_retries: How many times a failed send is retried before the message
+                is dropped.
+
+            max_merged: How many waiting messages may be merged into one event.
+
+            backoff: Delay before the first retry, in seconds. It doubles on each
+                following retry.
+
+            max_backoff: Maximum delay between retries, in seconds.
+
+            metrics: Where to record the duration and failures of sends.
+        """
+        self.client = client
+        self.max_retries = max_retries
+        self.max_merged = max_merged
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics or Metrics()
+
+        self._queues: Dict[str, Deque[OutgoingMessage]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+        # Statistics
+        self.sent = 0
+        self.merged = 0
+        self.replaced = 0
+        self.retries = 0
+        self.failures = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    @classmethod
+    def from_config(cls, client: AsyncClient, config, metrics: Optional[Metrics] = None) -> "Outbox":
+        return cls(
+            client,
+            max_retries=config.send_max_retries,
+            max_merged=config.send_max_merged,
+            metrics=metrics,
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of messages waiting to be sent"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def send_text(self, room_id: str, message: str, **kwargs) -> None:
+        """Queue a text message. Takes the same arguments as send_text_to_room."""
+        self.send(room_id, make_text_content(message, **kwargs))
+
+    def send_file(self, room_id: str, path: str, filename: str, mimetype: str) -> None:
+        """Queue a file, which is uploaded when its turn comes and then deleted.
+        Files to encrypted rooms are encrypted.
+        """
+        content = {
+            "msgtype": "m.file",
+            "body": filename,
+            "filename": filename,
+            "info": {"mimetype": mimetype, "size": os.path.getsize(path)},
+        }
+        self._queue(room_id, OutgoingMessage(content, upload_path=path))
+
+    def send(
+        self,
+        room_id: str,
+        content: dict,
+        on_sent: Optional[Callable[[Optional[str]], None]] = None,
+        key: Optional[str] = None,
+    ) -> None:
+        """Queue an m.room.message event
+
+        Args:
+            room_id: The room to send it to.
+
+            content: The event's content.
+
+            on_sent: Called with the event ID once the event is sent, or with None
+                if it is dropped.
+
+            key: Replaces a waiting message queued with the same key, such as an
+                older edit of the same event.
+        """
+        self._queue(room_id, OutgoingMessage(content, on_sent=on_sent, key=key))
+
+    def _queue(self, room_id: str, message: OutgoingMessage) -> None:
+        queue = self._queues.get(room_id)
+        if queue is None:
+            queue = self._queues[room_id] = deque()
+        if message.key is not None:
+            for index, waiting in enumerate(queue):
+                if waiting.key == message.key:
+                    del queue[index]
+                    self.replaced += 1
+                    break
+        queue.append(message)
+
+        if room_id not in self._workers:
+            self._workers[room_id] = asyncio.create_task(self._work(room_id, queue))
+
+    async def _work(self, room_id: str, queue: Deque[OutgoingMessage]) -> None:
+        # Run until the room's queue is empty, so idle rooms don't keep a task around
+        try:
+            while queue:
+                message = queue.popleft()
+                merged = 1
+                while queue and merged < self.max_merged and message.can_merge(queue[0]):
+                    message.merge(queue.popleft())
+                    merged += 1
+                if merged > 1:
+                    self.merged += merged
+                    logger.debug("Merged %d messages to %s", merged, room_id)
+
+                if message.upload_path:
+                    await self._upload(room_id, message)
+                await self._send(room_id, message)
+        finally:
+            del self._workers[room_id]
+            del self._queues[room_id]
+
+    async def _send(self, room_id: str, message: OutgoingMessage) -> None:
+        # Retries reuse the transaction ID, so the homeserver can't apply a send twice
+        tx_id = str(uuid.uuid4())
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            started = time.monotonic()
+            try:
+                response = await self.client.room_send(
+                    room_id,
+                    "m.room.message",
+                    message.content,
+                    tx_id=tx_id,
+                    ignore_unverified_devices=True,
+                )
+            except (SendRetryError, ClientError, asyncio.TimeoutError) as e:
+                self.metrics.room_send_failures.inc(type(e).__name__)
+                delay = self._backoff(attempt)
+                logger.warning(f"Failed to send message to {room_id}: {e!r}, retrying in {delay}s")
+            else:
+                self.metrics.room_send_seconds.observe(time.monotonic() - started)
+                if not isinstance(response, ErrorResponse):
+                    self._record_sent(message)
+                    if message.on_sent:
+                        message.on_sent(response.event_id)
+                    return
+
+                self.metrics.room_send_failures.inc(response.status_code or "unknown")
+                if response.status_code == "M_LIMIT_EXCEEDED":
+                    delay = (response.retry_after_ms or DEFAULT_RETRY_AFTER_MS) / 1000
+                    logger.info(f"Rate limited sending to {room_id}, retrying in {delay}s")
+                elif _transient(response):
+                    delay = self._backoff(attempt)
+                    logger.warning(
+                        f"Failed to send message to {room_id}: {response}, retrying in {delay}s"
+                    )
+                else:
+                    logger.error(f"Unable to send message to {room_id}: {response}")
+                    break
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        self.failures += 1
+        self.metrics.messages_dropped.inc()
+        logger.error(f"Dropped message to {room_id}")
+        if message.on_sent:
+            message.on_sent(None)
+
+    async def _upload(self, room_id: str, message: OutgoingMessage) -> None:
+        """Upload a message's file and point the message to it. If the upload fails,
+        the message becomes a notice saying so.
+        """
+        path, message.upload_path = message.upload_path, None
+        room = self.client.rooms.get(room_id)
+        encrypt = bool(room and room.encrypted)
+        filename = message.content["filename"]
+        try:
+            # Given a path, nio reads the file in chunks as it uploads it
+            response, keys = await self.client.upload(
+                lambda got_429, got_timeouts: path,
+                content_type=message.content["info"]["mimetype"],
+                filename=filename,
+                encrypt=encrypt,
+                filesize=message.content["info"]["size"],
+            )
+        except (ClientError, asyncio.TimeoutError, OSError) as e:
+            response = e
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        if not isinstance(response, UploadResponse):
+            self.metrics.room_send_failures.inc("upload")
+            logger.error(f"Unable to upload {filename} to {room_id}: {response!r}")
+            message.content = make_text_content(
+                f"Couldn't upload {filename}, try again later.", markdown_convert=False
+            )
+        elif encrypt:
+            message.content["file"] = dict(keys, url=response.content_uri)
+        else:
+            message.content["url"] = response.content_uri
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+    def _record_sent(self, message: OutgoingMessage) -> None:
+        latency = time.monotonic() - message.queued_at
+        self.sent += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait for every queued message to be sent or dropped"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._workers:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError
+            await asyncio.wait(list(self._workers.values()), timeout=remaining)
+
+    async def close(self) -> None:
+        """Stop sending, dropping any queued message"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
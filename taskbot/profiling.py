@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Counter, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIRECTORY = "profiles"
+
+# How often the stacks of every thread are sampled while a command runs, in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Bounds the memory used by samples when commands keep overlapping
+MAX_SAMPLES = 100000
+
+
+def _folded_stack(thread_name: str, frame) -> str:
+    """Format a stack in the folded format of flamegraph.pl, root first"""
+    names = [
+        f"{os.path.basename(f.f_code.co_filename)}:{f.f_code.co_name}"
+        for f, _ in traceback.walk_stack(frame)
+    ]
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class CommandProfiler:
+    """Samples the stacks of every thread while commands run, and saves the samples
+    of commands slower than a threshold.
+
+    Sampling shows where time went both on the event loop and in the Taskwarrior
+    worker threads, which cProfile can't follow. Samples are saved in the folded
+    format, one stack and its count per line, which flamegraph.pl and speedscope
+    read. Workers of a process pool aren't sampled.
+    """
+
+    def __init__(self, store_path: str, threshold: float, interval: float = SAMPLE_INTERVAL):
+        """
+        Args:
+            store_path: Profiles are saved in its 'profiles' subdirectory.
+
+            threshold: Commands running for longer than this, in seconds, get their
+                profile saved.
+
+            interval: Time between samples, in seconds.
+        """
+        self.directory = os.path.join(store_path, PROFILES_DIRECTORY)
+        self.threshold = threshold
+        self.interval = interval
+        self.saved = 0
+
+        # (timestamp, stacks) pairs, taken while at least one command runs
+        self._samples: collections.deque = collections.deque(maxlen=MAX_SAMPLES)
+        self._active = 0
+        self._lock = threading.Lock()
+        # Set to stop the running sampler thread
+        self._stop: Optional[threading.Event] = None
+
+    @classmethod
+    def from_config(cls, config) -> "CommandProfiler":
+        return cls(config.store_path, config.profiling_slow_command_ms / 1000)
+
+    @contextlib.contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """Sample stacks while the block runs, and save them if it is slow"""
+        self._start_sampling()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            ended = time.monotonic()
+            with self._lock:
+                samples = [stacks for at, stacks in self._samples if started <= at <= ended]
+            self._stop_sampling()
+
+            if ended - started > self.threshold:
+                self._save(name, ended - started, samples)
+
+    def _start_sampling(self) -> None:
+        with self._lock:
+            self._active += 1
+            if self._stop is None:
+                self._stop = threading.Event()
+                threading.Thread(
+                    target=self._sample, args=(self._stop,), name="taskbot-profiler", daemon=True
+                ).start()
+
+    def _stop_sampling(self) -> None:
+        # The sampler thread isn't joined, so the event loop doesn't wait for it
+        with self._lock:
+            self._active -= 1
+            if not self._active and self._stop is not None:
+                self._stop.set()
+                self._stop = None
+                self._samples.clear()
+
+    def _sample(self, stop: threading.Event) -> None:
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                _folded_stack(names.get(thread_id, str(thread_id)), frame)
+                for thread_id, frame in sys._current_frames().items()
+                if thread_id != own_id
+            ]
+            with self._lock:
+                if not stop.is_set():
+                    self._samples.append((time.monotonic(), stacks))
+
+    def _save(self, name: str, duration: float, samples: List[List[str]]) -> None:
+        counts: Counter[str] = collections.Counter()
+        for stacks in samples:
+            counts.update(stacks)
+
+        os.makedirs(self.directory, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(
+            self.directory, f"{timestamp}-{name}-{duration * 1000:.0f}ms.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        self.saved += 1
+        logger.warning(
+            f"'{name}' command took {duration * 1000:.0f}ms, "
+            f"saved {len(samples)} stack samples to {path}"
+        )
+
+
+class LoopWatchdog:
+    """Logs the stack of the event loop's thread when the loop is blocked for too
+    long.
+
+    A task on the loop beats regularly. A thread watches the beats, and when they
+    stop for longer than the threshold, logs what the loop's thread is running.
+    """
+
+    def __init__(self, threshold: float):
+        """
+        Args:
+            threshold: How long the loop may be blocked, in seconds.
+        """
+        self.threshold = threshold
+        self.stalls = 0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config) -> "LoopWatchdog":
+        return cls(config.profiling_loop_stall_ms / 1000)
+
+    def start(self) -> None:
+        """Start watching the running loop"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="taskbot-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _beat(self) -> None:
+        interval = self.threshold / 4
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            blocked = now - self._last_beat - interval
+            if blocked > self.threshold:
+                logger.warning(f"Event loop was blocked for {blocked * 1000:.0f}ms")
+            self._last_beat = now
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.threshold / 4):
+            last_beat = self._last_beat
+            if time.monotonic() - last_beat <= self.threshold or last_beat == reported_beat:
+                continue
+
+            # Only report each stall once
+            reported_beat = last_beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "unknown\n"
+            logger.warning(
+                f"Event loop blocked for more than {self.threshold * 1000:.0f}ms, in:\n{stack}"
+            )
@@ -0,0 +1,290 @@
+import asyncio
+import calendar
+import contextlib
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from taskbot.cache import SnapshotCache, TaskChanges
+from taskbot.render import DATE_FORMAT, Reply
+
+logger = logging.getLogger(__name__)
+
+ROOMS_FILENAME = "reminder_rooms.json"
+
+# When the next reminder of a store is due, saved when the store is closed
+NEXT_DUE_FILENAME = "next_reminder.json"
+
+# Closed stores are opened this many seconds before their next reminder is due
+WAKEUP_EARLY = 60
+
+
+def due_timestamp(due: str) -> float:
+    """Convert a Taskwarrior date, which is in UTC, to a UNIX timestamp"""
+    return calendar.timegm(datetime.strptime(due, DATE_FORMAT).timetuple())
+
+
+def load_next_due(store_path: str) -> Optional[float]:
+    """When the next reminder of a closed store is due, if it has one"""
+    path = os.path.join(store_path, NEXT_DUE_FILENAME)
+    try:
+        with open(path) as f:
+            return float(json.load(f)["due"])
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring invalid {path}")
+        return None
+
+
+class ReminderScheduler:
+    """Sends a reminder to a task's room when it becomes due.
+
+    Upcoming due dates are kept in a heap, which is updated as tasks change, and the
+    scheduler sleeps until the earliest one. A reminder goes to the room the task was
+    added from, or else to the configured room, or else to the last room the bot got
+    a command from.
+
+    Only tasks that become due while the bot runs get a reminder. When stopped, the
+    scheduler saves when its next reminder is due, so that the store can be opened
+    again in time for it.
+    """
+
+    def __init__(
+        self,
+        cache: SnapshotCache,
+        send: Callable[[str, Reply], None],
+        store_path: str,
+        room_id: Optional[str] = None,
+        refresh_interval: float = 300,
+        on_stop: Optional[Callable[[Optional[float]], None]] = None,
+    ):
+        """
+        Args:
+            cache: Snapshot cache of the tasks to remind about.
+
+            send: Called with a room ID and a reply to send a reminder.
+
+            store_path: Directory where the room of each task is saved.
+
+            room_id: Room for tasks that weren't added by the bot.
+
+            refresh_interval: The longest time, in seconds, before checking for
+                changes made outside of the bot.
+
+            on_stop: Called with the timestamp of the next reminder, if any, when
+                the scheduler is stopped.
+        """
+        self.cache = cache
+        self.send = send
+        self.room_id = room_id
+        self.refresh_interval = refresh_interval
+        self.on_stop = on_stop
+        self.last_room: Optional[str] = None
+
+        # Entries are (timestamp, uuid, due). An entry is stale when it no longer
+        # matches self._due, and is then skipped when popped.
+        self._heap: List[Tuple[float, str, str]] = []
+        self._due: Dict[str, str] = {}
+
+        self._rooms_path = os.path.join(store_path, ROOMS_FILENAME)
+        self._next_due_path = os.path.join(store_path, NEXT_DUE_FILENAME)
+        self.rooms: Dict[str, str] = self._load_rooms()
+
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+
+        cache.subscribe(self.on_changes)
+
+    @classmethod
+    def from_config(cls, cache: SnapshotCache, send, config) -> "ReminderScheduler":
+        return cls(
+            cache,
+            send,
+            config.store_path,
+            room_id=config.reminders_room_id,
+            refresh_interval=config.reminders_refresh_interval,
+        )
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        next_due = self.next_due
+        self._save_next_due(next_due)
+        if self.on_stop:
+            self.on_stop(next_due)
+
+    def on_changes(self, changes: TaskChanges) -> None:
+        """Update the heap from changes to the pending tasks"""
+        rooms_changed = False
+        if changes.room_id:
+            for task in changes.added:
+                self.rooms[task["uuid"]] = changes.room_id
+                rooms_changed = True
+
+        for task in changes.added + changes.modified:
+            self.schedule(task)
+        for task in changes.removed:
+            self._due.pop(task["uuid"], None)
+            if self.rooms.pop(task["uuid"], None):
+                rooms_changed = True
+
+        if rooms_changed:
+            self._save_rooms()
+
+    def schedule(self, task: dict) -> None:
+        """Schedule, move or cancel the reminder of a task from its due date"""
+        uuid = task["uuid"]
+        due = task.get("due")
+        if due == self._due.get(uuid):
+            return
+        if not due:
+            del self._due[uuid]
+            return
+
+        timestamp = due_timestamp(due)
+        if timestamp <= time.time():
+            self._due.pop(uuid, None)
+            return
+
+        self._due[uuid] = due
+        heapq.heappush(self._heap, (timestamp, uuid, due))
+        if self._heap[0][1] == uuid:
+            # Sleep until this one instead
+            self._wakeup.set()
+
+    @property
+    def upcoming(self) -> int:
+        return len(self._due)
+
+    @property
+    def next_due(self) -> Optional[float]:
+        """Timestamp of the next reminder, if any"""
+        return min(
+            (timestamp for timestamp, uuid, due in self._heap if self._due.get(uuid) == due),
+            default=None,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Changes made outside of the bot show up as a new snapshot
+                await self.cache.get()
+                self._send_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to send reminders")
+
+            timeout = self.refresh_interval
+            if self._heap:
+                timeout = min(timeout, max(0, self._heap[0][0] - time.time()))
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _send_due(self) -> None:
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, uuid, due = heapq.heappop(self._heap)
+            if self._due.get(uuid) != due:
+                continue
+            del self._due[uuid]
+
+            task = self.cache.snapshot.by_uuid.get(uuid)
+            room_id = self.rooms.get(uuid) or self.room_id or self.last_room
+            if task is None:
+                continue
+            if room_id is None:
+                logger.info(f"No room to send the reminder of task {uuid} to")
+                continue
+
+            self.send(room_id, Reply("Reminder", "this task is now due", tasks=[task]))
+            self.sent += 1
+
+    def _load_rooms(self) -> Dict[str, str]:
+        try:
+            with open(self._rooms_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f"Ignoring invalid {self._rooms_path}")
+            return {}
+
+    def _save_rooms(self) -> None:
+        tmp_path = f"{self._rooms_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.rooms, f)
+        os.replace(tmp_path, self._rooms_path)
+
+    def _save_next_due(self, next_due: Optional[float]) -> None:
+        if next_due is None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._next_due_path)
+            return
+        tmp_path = f"{self._next_due_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"due": next_due}, f)
+        os.replace(tmp_path, self._next_due_path)
+
+
+class ReminderWakeups:
+    """Opens closed stores again in time for their next reminder, as reminders are
+    only sent for open stores.
+    """
+
+    def __init__(self, wake: Callable[[str], object]):
+        """
+        Args:
+            wake: Called with the key of a store to open it.
+        """
+        self.wake = wake
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+        # Statistics
+        self.wakeups = 0
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, key: str, next_due: Optional[float]) -> None:
+        """Open a store WAKEUP_EARLY seconds before its next reminder is due"""
+        self.cancel(key)
+        if next_due is None:
+            return
+        delay = max(0.0, next_due - WAKEUP_EARLY - time.time())
+        self._timers[key] = asyncio.get_running_loop().call_later(delay, self._wake, key)
+
+    def cancel(self, key: str) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _wake(self, key: str) -> None:
+        del self._timers[key]
+        self.wakeups += 1
+        logger.debug("Opening the Taskwarrior store of '%s' for its reminders", key)
+        try:
+            self.wake(key)
+        except Exception:
+            logger.exception(f"Failed to open the store of '{key}' for its reminders")
+
+    def stop(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
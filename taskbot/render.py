@@ -0,0 +1,168 @@
+import html
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+
+
+class Reply:
+    """A command's response, turned into a message by a Renderer"""
+
+    def __init__(
+        self,
+        title: str,
+        summary: str = '',
+        tasks: Sequence[dict] = (),
+        fields: Sequence[Tuple[str, str]] = (),
+    ):
+        """
+        Args:
+            title: Shown in bold at the top of the message.
+
+            summary: Shown after the title. Text between backticks is shown as code.
+
+            tasks: Tasks shown one per line, with their ID, age and description.
+
+            fields: Name and value pairs shown one per line.
+        """
+        self.title = title
+        self.summary = summary
+        self.tasks = tasks
+        self.fields = fields
+
+
+class FileReply:
+    """A command's response sent as a file, uploaded from disk and deleted once sent"""
+
+    def __init__(self, path: str, filename: str, mimetype: str, summary: str = ''):
+        """
+        Args:
+            path: Where the file was written.
+
+            filename: Name of the file in the room.
+
+            mimetype: Type of the file's content.
+
+            summary: Sent as a text message along with the file.
+        """
+        self.path = path
+        self.filename = filename
+        self.mimetype = mimetype
+        self.summary = summary
+
+
+class DashboardReply:
+    """A room's dashboard, posted once and then edited in place as tasks change"""
+
+    def __init__(self, reply: Reply, new: bool = False):
+        """
+        Args:
+            reply: The dashboard's content.
+
+            new: Whether to post it as a new message, rather than edit the room's
+                current dashboard.
+        """
+        self.reply = reply
+        self.new = new
+
+
+class TaskFragment(NamedTuple):
+    """The parts of a task line that only change when the task is modified"""
+
+    entry: datetime
+    text: str
+    html: str
+
+
+def format_age(date: datetime, now: Optional[datetime] = None) -> str:
+    delta = (now or datetime.utcnow()) - date
+    days = delta.days
+    hours, remainder = divmod(delta.seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+
+    if days:
+        return f'{days}d'
+    elif hours:
+        return f'{hours}h'
+    elif minutes:
+        return f"{minutes}m"
+    else:
+        return f'{seconds}s'
+
+
+class Renderer:
+    """Builds message content with both a plain text body and an HTML body.
+
+    Task fragments are cached by UUID and modification date, so long lists are
+    assembled from cached pieces. The ID and age of a task are filled in on each
+    render, as they change without the task being modified.
+    """
+
+    def __init__(self, max_fragments: int = 10000):
+        self.max_fragments = max_fragments
+        self._fragments: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, reply: Reply, notice: bool = True) -> dict:
+        """Build the content of an m.room.message event from a reply"""
+        now = datetime.utcnow()
+        has_lines = bool(reply.tasks or reply.fields)
+
+        heading = f"{reply.title} {reply.summary}".rstrip()
+        summary_html = _code(html.escape(reply.summary))
+        heading_html = f"<strong>{html.escape(reply.title)}</strong> {summary_html}".rstrip()
+        if has_lines:
+            heading += ':'
+            heading_html += ':'
+
+        body = [heading]
+        formatted_body = [f"<p>{heading_html}</p>"]
+
+        for task in reply.tasks:
+            fragment = self.fragment(task)
+            age = format_age(fragment.entry, now)
+            body.append(f"{task['id']} - {age} - {fragment.text}")
+            formatted_body.append(
+                f"<p><strong>{task['id']}</strong> - <strong>{age}</strong> - {fragment.html}</p>"
+            )
+
+        for name, value in reply.fields:
+            body.append(f"{name}: {value}")
+            formatted_body.append(f"<p><strong>{html.escape(name)}</strong>: {html.escape(value)}</p>")
+
+        return {
+            "msgtype": "m.notice" if notice else "m.text",
+            "format": "org.matrix.custom.html",
+            "body": '\n\n'.join(body),
+            "formatted_body": '\n'.join(formatted_body),
+        }
+
+    def fragment(self, task: dict) -> TaskFragment:
+        """Get the cached fragment of a task, rendering it if needed"""
+        key = (task.get('uuid'), task.get('modified') or task['entry'])
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self.hits += 1
+            self._fragments.move_to_end(key)
+            return fragment
+
+        self.misses += 1
+        fragment = TaskFragment(
+            entry=datetime.strptime(task['entry'], DATE_FORMAT),
+            text=task['description'],
+            html=html.escape(task['description']),
+        )
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.max_fragments:
+            self._fragments.popitem(last=False)
+        return fragment
+
+
+def _code(escaped: str) -> str:
+    return re.sub(r'`([^`]+)`', r'<code>\1</code>', escaped)
@@ -0,0 +1,187 @@
+import contextlib
+import logging
+import os
+from typing import Callable, Optional, Union
+from urllib.parse import unquote
+
+from taskbot.backends import backend_class, make_backend, user_directory
+from taskbot.cache import SnapshotCache
+from taskbot.commands import task_commands
+from taskbot.config import Config
+from taskbot.dashboard import DashboardScheduler
+from taskbot.errors import ExecutorBusyError
+from taskbot.executor import TaskExecutor
+from taskbot.metrics import Metrics
+from taskbot.profiling import CommandProfiler
+from taskbot.reminders import ReminderScheduler, ReminderWakeups, load_next_due
+from taskbot.render import DashboardReply, FileReply, Reply
+from taskbot.scheduler import CommandScheduler
+from taskbot.stores import SHARED, Store, StorePool
+from taskbot.watcher import DataWatcher
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[str, Union[str, Reply, DashboardReply]], None]
+
+
+class CommandRunner:
+    """Runs commands on the Taskwarrior stores it opens in the current process.
+
+    Either the bot's own process uses it directly, or each worker process has one.
+    """
+
+    def __init__(self, config: Config, send: Send, scheduler: CommandScheduler, metrics: Metrics):
+        """
+        Args:
+            config: Bot configuration parameters.
+
+            send: Called with a room ID and a reply to send a reminder or a
+                dashboard.
+
+            scheduler: Provides the lock of each data store.
+
+            metrics: Where to record the duration of Taskwarrior calls.
+        """
+        self.config = config
+        self.send = send
+        self.scheduler = scheduler
+        self.executor = TaskExecutor.from_config(config, metrics)
+        # Stores are opened on first use, so check the backend now
+        backend_class(config.taskwarrior_backend)
+        self.stores = StorePool.from_config(self._open_store, config)
+        # Opens closed stores again when they have a reminder due
+        self.wakeups = ReminderWakeups(self.stores.get)
+
+        self.profiler = None
+        if config.profiling_slow_command_ms:
+            self.profiler = CommandProfiler.from_config(config)
+
+        metrics.add_gauge(
+            "taskbot_taskwarrior_calls_pending",
+            "Taskwarrior calls running or waiting for a worker",
+            lambda: self.executor.pending,
+        )
+        metrics.add_gauge(
+            "taskbot_stores_open", "Taskwarrior stores kept open", lambda: len(self.stores)
+        )
+        metrics.add_gauge(
+            "taskbot_stores_memory_bytes",
+            "Estimated memory used by the snapshots of open stores",
+            lambda: self.stores.memory,
+        )
+
+    def _open_store(self, key: str) -> Store:
+        backend = make_backend(self.config, user_id=key or None)
+        cache = SnapshotCache(self.executor, backend)
+        commands = {
+            name: command(self.config, backend, cache, self.executor)
+            for name, command in task_commands.items()
+        }
+
+        reminders = None
+        if self.config.reminders_enabled and key == SHARED:
+            reminders = ReminderScheduler.from_config(cache, self.send, self.config)
+        elif self.config.reminders_enabled:
+            # The configured room is for the shared store only
+            reminders = ReminderScheduler(
+                cache,
+                self.send,
+                user_directory(self.config, key),
+                refresh_interval=self.config.reminders_refresh_interval,
+                on_stop=lambda next_due: self.wakeups.schedule(key, next_due),
+            )
+            self.wakeups.cancel(key)
+
+        watcher = None
+        if self.config.watch_enabled:
+            watcher = DataWatcher(cache, poll_interval=self.config.watch_poll_interval)
+
+        dashboards = None
+        if self.config.dashboard_enabled:
+            directory = self.config.store_path if key == SHARED else user_directory(self.config, key)
+            dashboards = DashboardScheduler.from_config(cache, self.send, directory, self.config)
+            commands["dashboard"].dashboards = dashboards
+        return Store(key, backend, cache, commands, reminders, watcher, dashboards)
+
+    async def start(
+        self, open_shared: bool = True, owns: Optional[Callable[[str], bool]] = None
+    ) -> None:
+        """Start background tasks
+
+        Args:
+            open_shared: Whether to open the shared store now, so its reminders get
+                sent, when users don't have their own.
+
+            owns: Tells whether this runner runs the commands of a store, when
+                several runners share the stores. Closed stores it owns are opened
+                again in time for their next reminder.
+        """
+        if open_shared and not self.config.per_user:
+            self.stores.get(SHARED)
+        if self.config.per_user and self.config.reminders_enabled:
+            self._schedule_wakeups(owns)
+
+    def _schedule_wakeups(self, owns: Optional[Callable[[str], bool]]) -> None:
+        """Schedule the next reminder of each user's store, saved when it was closed"""
+        try:
+            names = os.listdir(self.config.users_directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            key = unquote(name)
+            if owns is not None and not owns(key):
+                continue
+            next_due = load_next_due(user_directory(self.config, key))
+            if next_due is not None:
+                self.wakeups.schedule(key, next_due)
+
+    def apply_config(self) -> None:
+        """Apply the reloadable options of the config, after it was reloaded"""
+        config = self.config
+        self.executor.max_queue = config.executor_max_queue
+        self.stores.max_stores = config.pool_max_stores
+        self.stores.max_memory = config.pool_max_memory_mb * 1024 * 1024
+        self.stores.evict()
+        for store in self.stores:
+            if store.reminders:
+                store.reminders.refresh_interval = config.reminders_refresh_interval
+            if store.dashboards:
+                store.dashboards.delay = config.dashboard_delay_ms / 1000
+                store.dashboards.limit = config.list_page_size
+
+        self.profiler = None
+        if config.profiling_slow_command_ms:
+            self.profiler = CommandProfiler.from_config(config)
+
+    async def run(self, room_id: str, store_key: str, cmd: str, args: str) -> Union[str, Reply, FileReply]:
+        """Run one of task_commands and return its response
+
+        Args:
+            room_id: The room the command came from.
+
+            store_key: Key of the store to run the command on.
+
+            cmd: The command's name.
+
+            args: The command's arguments.
+        """
+        with self.stores.use(store_key) as store:
+            command = store.commands[cmd]
+            profile = self.profiler.profile(cmd) if self.profiler else contextlib.nullcontext()
+            try:
+                with profile:
+                    async with self.scheduler.lock(store.backend.location, command.writes):
+                        response = await command.process(args, room_id)
+            except ExecutorBusyError as e:
+                logger.warning(f"Rejected '{cmd}' command: {e}")
+                response = "Too many pending requests, try again later."
+
+            if store.reminders:
+                store.reminders.last_room = room_id
+            return response
+
+    async def close(self) -> None:
+        """Stop background tasks and release resources"""
+        await self.stores.close()
+        self.wakeups.stop()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[None]]
+
+
+class ReadWriteLock:
+    """An asyncio lock that can be held by many readers or by a single writer.
+
+    Waiting writers block new readers, so a steady flow of reads can't starve writes.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire_read(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and not self._waiting_writers
+            )
+            self._readers += 1
+
+    async def release_read(self) -> None:
+        async with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    async def acquire_write(self) -> None:
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(
+                    lambda: not self._writer and not self._readers
+                )
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    async def release_write(self) -> None:
+        async with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class CommandScheduler:
+    """Runs commands off nio's callback dispatch.
+
+    Each room has its own queue, so commands of a room run in the order they were
+    received, while rooms proceed independently. Commands hold a read or write lock
+    on the data store they use, so reads run in parallel and writes are serialized.
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[Hashable, ReadWriteLock] = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of commands waiting in every room's queue"""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def submit(self, room_id: str, job: Job) -> None:
+        """Queue a command for a room.
+
+        Args:
+            room_id: The room the command came from.
+
+            job: Coroutine function running the command and sending its reply.
+        """
+        queue = self._queues.get(room_id)
+        if queue is None:
+            queue = self._queues[room_id] = asyncio.Queue()
+        queue.put_nowait(job)
+
+        if room_id not in self._workers:
+            self._workers[room_id] = asyncio.create_task(self._work(room_id, queue))
+
+    async def _work(self, room_id: str, queue: asyncio.Queue) -> None:
+        # Run until the room's queue is empty, so idle rooms don't keep a task around
+        try:
+            while not queue.empty():
+                job = queue.get_nowait()
+                try:
+                    await job()
+                except Exception:
+                    logger.exception(f"Command failed in room {room_id}")
+        finally:
+            del self._workers[room_id]
+            del self._queues[room_id]
+
+    @contextlib.asynccontextmanager
+    async def lock(self, store: Hashable, writes: bool) -> AsyncIterator[None]:
+        """Hold the read or write lock of a data store.
+
+        Args:
+            store: Key of the data store.
+
+            writes: Whether tasks are going to be changed.
+        """
+        lock = self._locks.get(store)
+        if lock is None:
+            lock = self._locks[store] = ReadWriteLock()
+
+        if writes:
+            await lock.acquire_write()
+            try:
+                yield
+            finally:
+                await lock.release_write()
+        else:
+            await lock.acquire_read()
+            try:
+                yield
+            finally:
+                await lock.release_read()
+
+    async def drain(self) -> None:
+        """Wait for every queued command to finish"""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    async def close(self) -> None:
+        """Cancel every queued and running command"""
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
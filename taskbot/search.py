@@ -0,0 +1,161 @@
+import asyncio
+import bisect
+import heapq
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from taskbot.cache import TaskChanges
+
+WORD = re.compile(r"\w+")
+
+# How much a term counts in each part of a task
+ANNOTATION_WEIGHT = 1.0
+PROJECT_WEIGHT = 2.0
+TAG_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 3.0
+
+# Tasks indexed between yields to the event loop, when building the index
+BUILD_CHUNK = 2000
+
+# How much more a whole word counts than a word it is the prefix of
+EXACT_BONUS = 2.0
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def task_terms(task: dict) -> Dict[str, float]:
+    """The terms of a task, with the weight of the part they are in"""
+    terms: Dict[str, float] = {}
+    # From the lowest weight to the highest, so a term keeps its highest weight
+    annotations = task.get("annotations")
+    if annotations:
+        text = " ".join(a.get("description", "") for a in annotations)
+        terms.update(dict.fromkeys(tokenize(text), ANNOTATION_WEIGHT))
+    if "project" in task:
+        terms.update(dict.fromkeys(tokenize(task["project"]), PROJECT_WEIGHT))
+    if "tags" in task:
+        terms.update(dict.fromkeys(tokenize(" ".join(task["tags"])), TAG_WEIGHT))
+    terms.update(dict.fromkeys(tokenize(task.get("description", "")), DESCRIPTION_WEIGHT))
+    return terms
+
+
+class SearchIndex:
+    """An inverted index of pending tasks, mapping each term to the UUIDs of the
+    tasks containing it.
+
+    Terms are also kept sorted, so that the terms starting with a prefix are found
+    by bisection. The index is updated from the TaskChanges of a SnapshotCache
+    rather than rebuilt.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._terms: List[str] = []
+        self._task_terms: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._task_terms)
+
+    async def build(self, tasks: List[dict]) -> None:
+        """Index tasks from scratch, yielding to the event loop every BUILD_CHUNK
+        tasks so that a large store doesn't stall it
+        """
+        self._postings.clear()
+        self._task_terms.clear()
+        for i, task in enumerate(tasks, start=1):
+            uuid = task.get("uuid")
+            if uuid is not None:
+                terms = task_terms(task)
+                self._task_terms[uuid] = set(terms)
+                for term, weight in terms.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = {}
+                    postings[uuid] = weight
+            if not i % BUILD_CHUNK:
+                await asyncio.sleep(0)
+        self._terms = sorted(self._postings)
+
+    def add(self, task: dict) -> None:
+        uuid = task.get("uuid")
+        if uuid is None:
+            return
+        # Tasks that weren't seen being removed, before a reload, are replaced
+        self.remove(uuid)
+        terms = task_terms(task)
+        self._task_terms[uuid] = set(terms)
+        for term, weight in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+            postings[uuid] = weight
+
+    def remove(self, uuid: str) -> None:
+        for term in self._task_terms.pop(uuid, ()):
+            postings = self._postings[term]
+            del postings[uuid]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def update(self, changes: TaskChanges) -> None:
+        """Apply the changes published by a SnapshotCache"""
+        for task in changes.removed:
+            self.remove(task.get("uuid"))
+        for task in changes.added + changes.modified:
+            self.add(task)
+
+    def _prefixed(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._terms, prefix)
+        # Every term starting with prefix sorts before prefix + the last code point
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff", start)
+        return self._terms[start:end]
+
+    def search(self, query: str, limit: Optional[int] = None) -> Tuple[int, List[str]]:
+        """Find the tasks with a term starting with each word of the query.
+
+        Rare terms, whole words and terms in descriptions score higher.
+
+        Returns:
+            The number of matching tasks, and the UUIDs of the limit best ones, best
+            first.
+        """
+        words = tokenize(query)
+        if not words:
+            return 0, []
+
+        total = len(self._task_terms)
+        scores: Dict[str, float] = {}
+        for i, word in enumerate(words):
+            word_scores: Dict[str, float] = {}
+            for term in self._prefixed(word):
+                postings = self._postings[term]
+                factor = math.log(1 + total / len(postings))
+                if term == word:
+                    factor *= EXACT_BONUS
+                for uuid, weight in postings.items():
+                    score = weight * factor
+                    if score > word_scores.get(uuid, 0.0):
+                        word_scores[uuid] = score
+
+            # Tasks must match every word
+            if i == 0:
+                scores = word_scores
+            else:
+                scores = {
+                    uuid: score + word_scores[uuid]
+                    for uuid, score in scores.items()
+                    if uuid in word_scores
+                }
+            if not scores:
+                return 0, []
+
+        if limit is None:
+            best = sorted(scores, key=scores.__getitem__, reverse=True)
+        else:
+            best = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        return len(scores), best
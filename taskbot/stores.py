@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from taskbot.backends import TaskBackend
+from taskbot.cache import SnapshotCache
+from taskbot.dashboard import DashboardScheduler
+from taskbot.reminders import ReminderScheduler
+from taskbot.watcher import DataWatcher
+
+logger = logging.getLogger(__name__)
+
+# Key of the store shared by every user, when users don't have their own
+SHARED = ""
+
+
+class Store:
+    """A Taskwarrior data store, along with what the bot keeps in memory for it"""
+
+    def __init__(
+        self,
+        key: str,
+        backend: TaskBackend,
+        cache: SnapshotCache,
+        commands: Dict[str, object],
+        reminders: Optional[ReminderScheduler] = None,
+        watcher: Optional[DataWatcher] = None,
+        dashboards: Optional[DashboardScheduler] = None,
+    ):
+        """
+        Args:
+            key: The user ID the store belongs to, or SHARED.
+
+            backend: Backend of the data store.
+
+            cache: Snapshot of the pending tasks.
+
+            commands: The commands, by name, working on this store.
+
+            reminders: Sends the reminders of this store's tasks.
+
+            watcher: Keeps the snapshot current with changes made outside of the
+                bot.
+
+            dashboards: Updates the dashboards of this store's tasks.
+        """
+        self.key = key
+        self.backend = backend
+        self.cache = cache
+        self.commands = commands
+        self.reminders = reminders
+        self.watcher = watcher
+        self.dashboards = dashboards
+        # Number of commands currently using the store
+        self.users = 0
+
+    @property
+    def memory(self) -> int:
+        """Estimated memory used by the snapshot, in bytes"""
+        snapshot = self.cache.snapshot
+        return snapshot.size if snapshot else 0
+
+    def start(self) -> None:
+        if self.watcher:
+            self.watcher.start()
+        if self.reminders:
+            self.reminders.start()
+
+    async def close(self) -> None:
+        if self.watcher:
+            await self.watcher.stop()
+        if self.reminders:
+            await self.reminders.stop()
+        if self.dashboards:
+            await self.dashboards.stop()
+
+
+class StorePool:
+    """Keeps the most recently used stores open, so their snapshots don't get
+    reloaded on every message.
+
+    When there are more than max_stores open stores, or when their snapshots use
+    more than max_memory, the least recently used stores are closed. Stores in use by
+    a command, and the most recently used store, are never closed.
+
+    Reminders are only sent, and dashboards only updated, for open stores. The
+    runner's ReminderWakeups open closed stores again for their next reminder.
+    """
+
+    def __init__(
+        self,
+        open_store: Callable[[str], Store],
+        max_stores: int = 32,
+        max_memory: int = 256 * 1024 * 1024,
+    ):
+        """
+        Args:
+            open_store: Creates the store of a key.
+
+            max_stores: How many stores may be open at once.
+
+            max_memory: How much memory, in bytes, the snapshots of open stores may
+                use at once.
+        """
+        self.open_store = open_store
+        self.max_stores = max_stores
+        self.max_memory = max_memory
+        self._stores: "OrderedDict[str, Store]" = OrderedDict()
+        self._closing: Set[asyncio.Task] = set()
+
+        # Statistics
+        self.opened = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_config(cls, open_store: Callable[[str], Store], config) -> "StorePool":
+        return cls(
+            open_store,
+            max_stores=config.pool_max_stores,
+            max_memory=config.pool_max_memory_mb * 1024 * 1024,
+        )
+
+    def __len__(self) -> int:
+        return len(self._stores)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._stores
+
+    def __iter__(self) -> Iterator[Store]:
+        return iter(list(self._stores.values()))
+
+    @property
+    def memory(self) -> int:
+        """Estimated memory used by the snapshots of open stores, in bytes"""
+        return sum(store.memory for store in self._stores.values())
+
+    def get(self, key: str) -> Store:
+        """Get a store, opening it if needed. Must be called from the running event
+        loop, as opening a store starts its reminders.
+        """
+        store = self._stores.get(key)
+        if store is not None:
+            self._stores.move_to_end(key)
+            return store
+
+        store = self._stores[key] = self.open_store(key)
+        store.start()
+        self.opened += 1
+        self.evict()
+        return store
+
+    @contextlib.contextmanager
+    def use(self, key: str) -> Iterator[Store]:
+        """Get a store, which stays open until the block exits"""
+        store = self.get(key)
+        store.users += 1
+        try:
+            yield store
+        finally:
+            store.users -= 1
+            # The snapshot may have just been loaded
+            self.evict()
+
+    def evict(self) -> None:
+        """Close the least recently used stores beyond the limits"""
+        memory = self.memory
+        # The last store is the most recently used one
+        for key in list(self._stores)[:-1]:
+            if len(self._stores) <= self.max_stores and memory <= self.max_memory:
+                return
+            store = self._stores[key]
+            if store.users:
+                continue
+
+            del self._stores[key]
+            memory -= store.memory
+            self.evicted += 1
+            logger.debug("Closed the Taskwarrior store of '%s'", key)
+            task = asyncio.create_task(store.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def close(self) -> None:
+        """Close every store"""
+        stores = list(self._stores.values())
+        self._stores.clear()
+        await asyncio.gather(*(store.close() for store in stores), *self._closing)
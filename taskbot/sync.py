@@ -0,0 +1,64 @@
+import copy
+import logging
+from typing import Any, Dict, Union
+
+from nio import AsyncClient, UploadFilterResponse
+
+logger = logging.getLogger(__name__)
+
+NOTHING = {"not_types": ["*"]}
+
+# Timeline events the bot never looks at. State events also arrive in the timeline,
+# and nio needs them to track members and whether a room is encrypted, so events
+# are excluded rather than the timeline limited to messages.
+IGNORED_TIMELINE_TYPES = [
+    "m.reaction",
+    "m.sticker",
+    "m.call.*",
+    "m.poll.*",
+    "org.matrix.msc3381.poll.*",
+]
+
+# Only what Callbacks and nio's room state need. Members are lazy loaded, as the
+# bot only needs the member count, which comes in the room summary.
+SYNC_FILTER: Dict[str, Any] = {
+    "presence": NOTHING,
+    "account_data": NOTHING,
+    "room": {
+        "state": {"lazy_load_members": True},
+        "timeline": {
+            "not_types": IGNORED_TIMELINE_TYPES,
+            "lazy_load_members": True,
+        },
+        "ephemeral": NOTHING,
+        "account_data": NOTHING,
+    },
+}
+
+
+def first_sync_filter() -> Dict[str, Any]:
+    """The filter of the first sync, whose events are skipped anyway: the bot only
+    answers messages received once it's running.
+    """
+    sync_filter = copy.deepcopy(SYNC_FILTER)
+    sync_filter["room"]["timeline"]["limit"] = 1
+    return sync_filter
+
+
+async def upload_sync_filter(client: AsyncClient) -> Union[str, Dict[str, Any]]:
+    """Upload SYNC_FILTER to the homeserver.
+
+    Returns:
+        The filter ID, so syncs don't send the whole filter. If the upload failed,
+        the filter itself.
+    """
+    response = await client.upload_filter(
+        presence=SYNC_FILTER["presence"],
+        account_data=SYNC_FILTER["account_data"],
+        room=SYNC_FILTER["room"],
+    )
+    if isinstance(response, UploadFilterResponse):
+        return response.filter_id
+
+    logger.warning(f"Could not upload the sync filter, sending it inline: {response}")
+    return SYNC_FILTER
@@ -0,0 +1,218 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+from taskbot.backends import decode_data_line
+from taskbot.cache import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+WATCHED_FILES = ("pending.data", "completed.data", "undo.data")
+
+# Changes come in bursts, as a task command writes several files
+DEBOUNCE = 0.05
+
+# Taskwarrior appends a transaction to undo.data for every change, ending with this
+TRANSACTION_END = b"---\n"
+
+# From sys/inotify.h
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_inotify()
+
+
+def read_transactions(path: str, offset: int) -> Tuple[List[dict], int]:
+    """Read the transactions appended to undo.data since offset.
+
+    Returns:
+        The new version of each task changed by the complete transactions, in the
+        order they were made, and the offset after the last complete transaction.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+
+    # The last transaction may still be being written
+    end = data.rfind(TRANSACTION_END)
+    if end == -1:
+        return [], offset
+    data = data[:end + len(TRANSACTION_END)]
+
+    tasks = []
+    for line in data.decode().splitlines():
+        if line.startswith("new "):
+            tasks.append(decode_data_line(line[len("new "):]))
+    return tasks, offset + len(data)
+
+
+class DataWatcher:
+    """Keeps a SnapshotCache current with changes made outside of the bot, by the
+    task command, sync or hooks.
+
+    The data directory is watched with inotify, or polled where inotify isn't
+    available. Most changes are read from the transactions Taskwarrior appends to
+    undo.data, so only what changed is read. Changes that don't go through
+    undo.data, such as the garbage collection rewriting pending.data, cause a full
+    reload.
+
+    Either way, the cache publishes the changed tasks to its subscribers.
+    """
+
+    def __init__(self, cache: SnapshotCache, poll_interval: float = 5.0):
+        """
+        Args:
+            cache: The cache to keep current.
+
+            poll_interval: Time between checks of the data files, in seconds, when
+                inotify isn't available.
+        """
+        self.cache = cache
+        self.directory = cache.backend.location
+        self.poll_interval = poll_interval
+        self.undo_path = os.path.join(self.directory, "undo.data")
+
+        self._stats = self._stat()
+        undo = self._stats["undo.data"]
+        self._undo_offset = undo[1] if undo else 0
+        self._fd: Optional[int] = None
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Statistics
+        self.incremental = 0
+        self.reloads = 0
+
+    def start(self) -> None:
+        self._fd = self._watch()
+        if self._fd is not None:
+            asyncio.get_running_loop().add_reader(self._fd, self._on_inotify)
+        else:
+            logger.info(f"Polling {self.directory} every {self.poll_interval}s")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _watch(self) -> Optional[int]:
+        if _libc is None:
+            return None
+        fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logger.warning(f"inotify unavailable: {os.strerror(ctypes.get_errno())}")
+            return None
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if _libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+            logger.warning(
+                f"Can't watch {self.directory}: {os.strerror(ctypes.get_errno())}"
+            )
+            os.close(fd)
+            return None
+        return fd
+
+    def _on_inotify(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            start = offset + INOTIFY_EVENT.size
+            name = data[start:start + length].rstrip(b"\0").decode()
+            offset = start + length
+            if name in WATCHED_FILES:
+                self._changed.set()
+
+    async def _run(self) -> None:
+        while True:
+            if self._fd is not None:
+                await self._changed.wait()
+                await asyncio.sleep(DEBOUNCE)
+                self._changed.clear()
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Failed to read changes to {self.directory}")
+
+    def _stat(self) -> Dict[str, Optional[Tuple[int, int, int]]]:
+        """Get the inode, size and modification time of each watched file"""
+        stats = {}
+        for name in WATCHED_FILES:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                stats[name] = None
+            else:
+                stats[name] = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    async def refresh(self) -> None:
+        """Apply the changes made since the last refresh to the cache"""
+        stats = self._stat()
+        if stats == self._stats:
+            return
+        previous, self._stats = self._stats, stats
+        undo = stats["undo.data"]
+
+        if self.cache.snapshot is None:
+            # Nothing to keep current, the next use loads everything
+            self._undo_offset = undo[1] if undo else 0
+            return
+
+        previous_undo = previous["undo.data"]
+        replaced = (
+            undo is None
+            or previous_undo is None
+            or undo[0] != previous_undo[0]
+            or undo[1] < self._undo_offset
+        )
+        # The garbage collection removes lines from pending.data, changing IDs
+        pending, previous_pending = stats["pending.data"], previous["pending.data"]
+        collected = pending and previous_pending and pending[1] < previous_pending[1]
+        if replaced or collected:
+            self._undo_offset = undo[1] if undo else 0
+            await self.cache.reload()
+            self.reloads += 1
+            return
+
+        if undo[1] > self._undo_offset:
+            tasks, self._undo_offset = await self.cache.executor.run(
+                read_transactions, self.undo_path, self._undo_offset
+            )
+            self.cache.apply(tasks)
+            self.incremental += 1
+        elif self.cache.snapshot.version != self.cache.version():
+            # Changed without a transaction, such as by an editor
+            await self.cache.reload()
+            self.reloads += 1
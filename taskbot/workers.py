@@ -0,0 +1,240 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+from taskbot.config import Config
+from taskbot.errors import ConfigError, WorkerError
+from taskbot.metrics import Metrics
+from taskbot.render import DashboardReply, FileReply, Reply
+from taskbot.runner import Send
+from taskbot.scheduler import CommandScheduler
+from taskbot.stores import SHARED
+
+logger = logging.getLogger(__name__)
+
+# How often worker processes are checked for, in seconds
+CHECK_INTERVAL = 1.0
+
+# How long workers get to finish their commands when the bot stops, in seconds
+STOP_TIMEOUT = 5.0
+
+# Requests are (request ID, room ID, store key, command, arguments). A None request
+# stops the worker, and a RELOAD request makes it reload its config. Results are
+# (request ID, room ID, response), with a None request ID for reminders and
+# dashboards.
+Request = Tuple[int, str, str, str, str]
+Result = Tuple[Optional[int], str, Union[str, Reply, FileReply, DashboardReply, WorkerError]]
+
+RELOAD = "reload"
+
+
+def shard(store_key: str, workers: int) -> int:
+    """The worker owning a store. Stable across processes, unlike hash()."""
+    return zlib.crc32(store_key.encode()) % workers
+
+
+def worker_main(config_path: str, index: int, workers: int, requests, results) -> None:
+    """Entry point of a worker process"""
+    # The worker loads the config itself, setting up its own logging
+    config = Config(config_path)
+    asyncio.run(_serve(config, index, workers, requests, results))
+
+
+async def _serve(config: Config, index: int, workers: int, requests, results) -> None:
+    # Imported here, as importing it in the bot's process isn't needed
+    from taskbot.runner import CommandRunner
+
+    runner = CommandRunner(
+        config,
+        lambda room_id, reply: results.put((None, room_id, reply)),
+        CommandScheduler(),
+        Metrics(),
+    )
+
+    def owns(store_key: str) -> bool:
+        return shard(store_key, workers) == index
+
+    await runner.start(open_shared=owns(SHARED), owns=owns)
+
+    async def handle(request: Request) -> None:
+        request_id, room_id, store_key, cmd, args = request
+        try:
+            response = await runner.run(room_id, store_key, cmd, args)
+        except Exception as e:
+            logger.exception(f"Failed to run '{cmd}' command")
+            response = WorkerError(f"'{cmd}' command failed: {e!r}")
+        results.put((request_id, room_id, response))
+
+    loop = asyncio.get_running_loop()
+    running = set()
+    try:
+        while True:
+            request = await loop.run_in_executor(None, requests.get)
+            if request is None:
+                break
+            if request == RELOAD:
+                try:
+                    config.reload()
+                except ConfigError as e:
+                    logger.error(f"Not reloading the config: {e}")
+                else:
+                    runner.apply_config()
+                continue
+            task = asyncio.create_task(handle(request))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.gather(*running)
+    finally:
+        await runner.close()
+
+
+class WorkerPool:
+    """Runs commands in worker processes, so Taskwarrior calls and the handling of
+    their output don't compete with sync and encryption for the bot's process.
+
+    Each store is owned by one worker, chosen from the store's key, and commands
+    reach it through its own request queue. Responses and reminders come back
+    through a shared result queue, and are sent by the bot's process.
+
+    A worker that dies is restarted, and the commands it was running fail.
+    """
+
+    def __init__(self, config: Config, workers: int, send: Send):
+        """
+        Args:
+            config: Bot configuration parameters. Workers load it again from its
+                file.
+
+            workers: Number of worker processes.
+
+            send: Called with a room ID and a reply to send a reminder or a
+                dashboard.
+        """
+        self.config = config
+        self.send = send
+        # Workers start from a fresh interpreter, rather than a fork of the bot
+        # with its event loop and client
+        self._context = multiprocessing.get_context("spawn")
+        self._requests = [self._context.Queue() for _ in range(workers)]
+        self._results = self._context.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._ids = itertools.count()
+        self._reader: Optional[threading.Thread] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self.restarts = 0
+
+        if not config.per_user and workers > 1:
+            logger.warning(
+                "Users share a single store, so a single worker process will run commands"
+            )
+
+    def _start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=worker_main,
+            args=(
+                self.config.filepath,
+                index,
+                len(self._processes),
+                self._requests[index],
+                self._results,
+            ),
+            name=f"taskbot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def start(self) -> None:
+        for index in range(len(self._processes)):
+            self._start_worker(index)
+        loop = asyncio.get_running_loop()
+        self._reader = threading.Thread(
+            target=self._read_results, args=(loop,), name="taskbot-results", daemon=True
+        )
+        self._reader.start()
+        self._monitor = asyncio.create_task(self._check_workers())
+        logger.info(f"Started {len(self._processes)} worker processes")
+
+    async def run(self, room_id: str, store_key: str, cmd: str, args: str) -> Union[str, Reply, FileReply]:
+        """Run one of task_commands in the worker owning the store, and return its
+        response.
+
+        Raises:
+            WorkerError: If the command failed, or its worker died running it.
+        """
+        index = shard(store_key, len(self._processes))
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = (index, future)
+        self._requests[index].put((request_id, room_id, store_key, cmd, args))
+        return await future
+
+    def apply_config(self) -> None:
+        """Make the workers reload their config"""
+        for queue in self._requests:
+            queue.put(RELOAD)
+
+    def _read_results(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            loop.call_soon_threadsafe(self._deliver, *result)
+
+    def _deliver(self, request_id: Optional[int], room_id: str, response) -> None:
+        if request_id is None:
+            self.send(room_id, response)
+            return
+
+        _, future = self._pending.pop(request_id, (None, None))
+        if future is None or future.done():
+            return
+        if isinstance(response, WorkerError):
+            future.set_exception(response)
+        else:
+            future.set_result(response)
+
+    async def _check_workers(self) -> None:
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if process is None or process.is_alive():
+                    continue
+
+                logger.error(f"{process.name} exited with code {process.exitcode}, restarting it")
+                for request_id, (worker, future) in list(self._pending.items()):
+                    if worker == index:
+                        del self._pending[request_id]
+                        future.set_exception(WorkerError(f"{process.name} died"))
+                self._start_worker(index)
+                self.restarts += 1
+
+    async def close(self) -> None:
+        """Stop the workers once they finished their running commands"""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+
+        for queue in self._requests:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Killing {process.name}")
+                process.kill()
+
+        if self._reader is not None:
+            self._results.put(None)
+            await loop.run_in_executor(None, self._reader.join)
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_exception(WorkerError("The bot is stopping"))
+        self._pending.clear()
@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from taskbot import admission
+from taskbot.admission import (
+    SHED_GLOBAL,
+    SHED_QUEUE,
+    SHED_USER,
+    AdmissionControl,
+    TokenBucket,
+)
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 100.0
+        patcher = patch("taskbot.admission.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst(self):
+        """Tests that a full bucket allows a burst, and nothing more"""
+        bucket = TokenBucket(rate=1, burst=3)
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_refill(self):
+        """Tests that tokens come back at the rate, up to the burst"""
+        bucket = TokenBucket(rate=2, burst=3)
+        for _ in range(3):
+            bucket.take()
+
+        self.now += 0.5
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+
+        self.now += 60
+        self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+
+    def test_configure(self):
+        """Tests that changing the limits keeps the tokens left"""
+        bucket = TokenBucket(rate=1, burst=10)
+        for _ in range(8):
+            bucket.take()
+
+        bucket.configure(rate=1, burst=20)
+        self.assertEqual(bucket.tokens, 2)
+
+        bucket.configure(rate=1, burst=1)
+        self.assertEqual(bucket.tokens, 1)
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 100.0
+        patcher = patch("taskbot.admission.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_limit(self):
+        """Tests that each sender has their own bucket"""
+        control = AdmissionControl(user_rate=1, user_burst=2, max_queued=0)
+        self.assertIsNone(control.admit("@a:x", 0))
+        self.assertIsNone(control.admit("@a:x", 0))
+        self.assertEqual(control.admit("@a:x", 0), SHED_USER)
+        self.assertIsNone(control.admit("@b:x", 0))
+
+        self.now += 1
+        self.assertIsNone(control.admit("@a:x", 0))
+
+    def test_global_limit(self):
+        """Tests that every sender together share the global bucket"""
+        control = AdmissionControl(user_rate=0, global_rate=1, global_burst=2, max_queued=0)
+        self.assertIsNone(control.admit("@a:x", 0))
+        self.assertIsNone(control.admit("@b:x", 0))
+        self.assertEqual(control.admit("@c:x", 0), SHED_GLOBAL)
+
+    def test_user_shed_spares_global(self):
+        """Tests that a sender over their own limit doesn't use up the global bucket"""
+        control = AdmissionControl(user_rate=1, user_burst=1, global_rate=1, global_burst=2)
+        control.admit("@a:x", 0)
+        for _ in range(5):
+            self.assertEqual(control.admit("@a:x", 0), SHED_USER)
+        self.assertIsNone(control.admit("@b:x", 0))
+
+    def test_queue_limit(self):
+        """Tests that commands are shed while too many wait to run"""
+        control = AdmissionControl(user_rate=0, max_queued=3)
+        self.assertIsNone(control.admit("@a:x", 2))
+        self.assertEqual(control.admit("@a:x", 3), SHED_QUEUE)
+
+    def test_tell_busy(self):
+        """Tests that a sender is told once per streak of shed commands"""
+        control = AdmissionControl(user_rate=1, user_burst=1, max_queued=0)
+        control.admit("@a:x", 0)
+        control.admit("@a:x", 0)
+        self.assertTrue(control.tell_busy("@a:x"))
+        control.admit("@a:x", 0)
+        self.assertFalse(control.tell_busy("@a:x"))
+
+        self.now += 1
+        self.assertIsNone(control.admit("@a:x", 0))
+        control.admit("@a:x", 0)
+        self.assertTrue(control.tell_busy("@a:x"))
+
+    def test_max_senders(self):
+        """Tests that the least recently seen senders are forgotten"""
+        with patch.object(admission, "MAX_SENDERS", 2):
+            control = AdmissionControl(user_rate=1, user_burst=1, max_queued=0)
+            for sender in ("@a:x", "@b:x", "@c:x"):
+                control.admit(sender, 0)
+                control.tell_busy(sender)
+        self.assertEqual(list(control._users), ["@b:x", "@c:x"])
+        self.assertEqual(list(control._told_busy), ["@b:x", "@c:x"])
+
+    def test_apply_config(self):
+        """Tests that reloading the limits keeps each sender's tokens"""
+        config = Mock(
+            admission_user_per_minute=60,
+            admission_user_burst=2,
+            admission_global_per_minute=0,
+            admission_global_burst=100,
+            admission_max_queued=0,
+        )
+        control = AdmissionControl.from_config(config)
+        control.admit("@a:x", 0)
+        control.admit("@a:x", 0)
+
+        config.admission_user_burst = 5
+        control.apply_config(config)
+        self.assertEqual(control.admit("@a:x", 0), SHED_USER)
+        self.assertIsNone(control.admit("@b:x", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from taskbot.backends import DataFileBackend, TaskwBackend, make_backend
+from taskbot.errors import ConfigError
+from taskbot.executor import TaskExecutor
+
+from taskw import TaskWarriorShellout
+from taskw.exceptions import TaskwarriorError
+
+from tests.utils import run_coroutine
+
+# Stands in for the task command, exporting one task per line for each status
+FAKE_TASK = """#!/bin/sh
+case "$*" in
+    *--version*) echo 2.6.2 ;;
+    *rc.json.array=off*status:pending*) echo '{"id":1,"uuid":"uuid-1","status":"pending"}' ;;
+    *rc.json.array=off*status:waiting*) echo '{"id":2,"uuid":"uuid-2","status":"waiting"}' ;;
+    *rc.json.array=off*status:completed*) echo 'Unknown status' >&2; exit 2 ;;
+esac
+"""
+
+
+class DataFileBackendTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.taskrc = os.path.join(self.data_dir.name, "taskrc")
+        with open(self.taskrc, "w") as f:
+            f.write(f"data.location={self.data_dir.name}\n")
+
+        with open(os.path.join(self.data_dir.name, "pending.data"), "w") as f:
+            f.write(
+                '[description:"first" entry:"1650000000" status:"pending" uuid:"uuid-1"]\n'
+                '[description:"gone" entry:"1650000000" status:"completed" uuid:"uuid-2"]\n'
+                '[annotation_1650000100:"a note" description:"second" due:"1650086400" '
+                'entry:"1650000000" status:"waiting" tags:"home,work" uuid:"uuid-3"]\n'
+            )
+
+        self.backend = DataFileBackend(self.taskrc)
+
+    def tearDown(self) -> None:
+        self.data_dir.cleanup()
+
+    def test_location(self):
+        self.assertEqual(self.backend.location, self.data_dir.name)
+
+    def test_load_pending(self):
+        """Tests that data files are decoded into the format of 'task export'"""
+        tasks = self.backend.load_tasks("pending")
+
+        self.assertEqual(list(tasks), ["pending"])
+        first, second = tasks["pending"]
+        self.assertEqual(first["id"], 1)
+        self.assertEqual(first["entry"], "20220415T052000Z")
+        self.assertEqual(second["id"], 2)
+        self.assertEqual(second["due"], "20220416T052000Z")
+        self.assertEqual(second["tags"], ["home", "work"])
+        self.assertEqual(
+            second["annotations"],
+            [{"entry": "20220415T052140Z", "description": "a note"}],
+        )
+
+    def test_process_pool(self):
+        """Tests that backend methods can be run by a process pool"""
+        executor = TaskExecutor(kind="process", max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        tasks = run_coroutine(executor.run(self.backend.load_tasks, "pending"))
+        self.assertEqual([task["uuid"] for task in tasks["pending"]], ["uuid-1", "uuid-3"])
+
+        task = run_coroutine(executor.run(self.backend.task_add, "third"))
+        self.assertEqual(task["description"], "third")
+        pending = self.backend.load_tasks("pending")["pending"]
+        self.assertEqual(pending[-1]["uuid"], task["uuid"])
+
+    def test_iter_tasks(self):
+        """Tests that iterating gives the same tasks as loading them"""
+        tasks = list(self.backend.iter_tasks("all"))
+
+        self.assertEqual(tasks, self.backend.load_tasks("pending")["pending"])
+
+    def test_task_add(self):
+        """Tests that added tasks come back in the format of 'task export', even from
+        taskw's fallback writing the data files itself
+        """
+        task = self.backend.task_add("third")
+
+        self.assertEqual(task["description"], "third")
+        self.assertRegex(task["entry"], r"^\d{8}T\d{6}Z$")
+
+    def test_missing_data_file(self):
+        self.assertEqual(self.backend.load_tasks("completed"), {"completed": []})
+
+
+class TaskwBackendTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.bin_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.bin_dir.cleanup)
+        path = os.path.join(self.bin_dir.name, "task")
+        with open(path, "w") as f:
+            f.write(FAKE_TASK)
+        os.chmod(path, 0o755)
+        patcher = patch.dict(
+            os.environ, {"PATH": f"{self.bin_dir.name}{os.pathsep}{os.environ['PATH']}"}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        taskrc = os.path.join(self.bin_dir.name, "taskrc")
+        open(taskrc, "w").close()
+        self.backend = TaskwBackend(taskrc)
+        self.backend.w = TaskWarriorShellout(config_filename=taskrc)
+
+    def test_iter_tasks(self):
+        """Tests that 'task export' is read one task at a time, waiting tasks after
+        pending ones
+        """
+        tasks = self.backend.iter_tasks("pending")
+
+        self.assertEqual(next(tasks)["uuid"], "uuid-1")
+        self.assertEqual([task["uuid"] for task in tasks], ["uuid-2"])
+
+    def test_iter_tasks_error(self):
+        with self.assertRaises(TaskwarriorError) as cm:
+            list(self.backend.iter_tasks("completed"))
+        self.assertEqual(cm.exception.code, 2)
+        self.assertEqual(cm.exception.stderr, "Unknown status")
+
+
+class MakeBackendTestCase(unittest.TestCase):
+    def test_user_backend(self):
+        """Tests that each user gets their own data directory"""
+        with tempfile.TemporaryDirectory() as users_directory:
+            config = Mock(
+                taskwarrior_backend="datafile", taskrc=None, users_directory=users_directory
+            )
+
+            alice = make_backend(config, user_id="@alice:example.com")
+            bob = make_backend(config, user_id="@bob/evil:example.com")
+
+            self.assertEqual(
+                alice.location, os.path.join(users_directory, "@alice:example.com", "task")
+            )
+            self.assertEqual(os.path.dirname(os.path.dirname(bob.location)), users_directory)
+            self.assertTrue(os.path.isdir(alice.location))
+            self.assertEqual(alice.load_tasks("pending"), {"pending": []})
+
+    def test_unknown_backend(self):
+        config = Mock(taskwarrior_backend="sqlite", taskrc=None)
+
+        with self.assertRaises(ConfigError):
+            make_backend(config)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from taskbot.backends import DataFileBackend
+from taskbot.commands import task_commands
+
+from benchmarks.run import bench_size, compare, percentile
+from benchmarks.store import generate_store
+
+from tests.utils import run_coroutine
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+
+    def test_generate_store(self):
+        with tempfile.TemporaryDirectory() as path:
+            taskrc = generate_store(os.path.join(path, "task"), 50)
+
+            tasks = DataFileBackend(taskrc).load_tasks("pending")["pending"]
+
+        self.assertEqual(len(tasks), 50)
+        self.assertEqual(len({task["uuid"] for task in tasks}), 50)
+
+    def test_bench_size(self):
+        """Tests a tiny run, which measures every command"""
+        results = run_coroutine(bench_size(20, "datafile", iterations=2, latency=0))
+
+        self.assertEqual([r["command"] for r in results], list(task_commands))
+        for result in results:
+            self.assertEqual(result["samples"], 2)
+            self.assertGreater(result["throughput"], 0)
+
+        lines = compare({"commit": "abc", "results": results}, {"results": results})
+        self.assertEqual(len(lines), len(results) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from taskbot.cache import SnapshotCache
+from taskbot.executor import TaskExecutor
+
+from tests.utils import run_coroutine
+
+
+class SnapshotCacheTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.pending_path = os.path.join(self.data_dir.name, "pending.data")
+        self._write_pending("first")
+
+        self.executor = TaskExecutor(max_workers=1)
+        self.fake_backend = Mock()
+        self.fake_backend.location = self.data_dir.name
+        self.fake_backend.load_tasks.side_effect = lambda command: {
+            "pending": [
+                {"uuid": "uuid-1", "description": "one"},
+                {"uuid": "uuid-2", "description": "two"},
+            ]
+        }
+        self.cache = SnapshotCache(self.executor, self.fake_backend)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        self.data_dir.cleanup()
+
+    def _write_pending(self, content: str) -> None:
+        with open(self.pending_path, "w") as f:
+            f.write(content)
+
+    def test_indexes(self):
+        """Tests that tasks are indexed by ID and UUID, with IDs defaulting to line numbers"""
+        snapshot = run_coroutine(self.cache.get())
+
+        self.assertEqual(snapshot.by_id[2]["uuid"], "uuid-2")
+        self.assertEqual(snapshot.by_uuid["uuid-1"]["id"], 1)
+
+    def test_reload_on_change(self):
+        """Tests that the snapshot is only reloaded when the data files change"""
+        run_coroutine(self.cache.get())
+        run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+
+        self._write_pending("first\nsecond")
+        run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 2)
+
+    def test_in_place_updates(self):
+        """Tests that the bot's own writes update the snapshot without a reload"""
+        run_coroutine(self.cache.get())
+
+        self._write_pending("first\nsecond")
+        self.cache.added({"id": 3, "uuid": "uuid-3", "description": "three"})
+        self._write_pending("second")
+        self.cache.completed("uuid-1")
+
+        snapshot = run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+        self.assertEqual(sorted(snapshot.by_id), [1, 2])
+        self.assertNotIn("uuid-1", snapshot.by_uuid)
+
+    def test_renumber_after_completed(self):
+        """Tests that completing a task moves the following tasks up an ID, as a fresh
+        load would, and that a task added afterwards takes the next ID
+        """
+        run_coroutine(self.cache.get())
+
+        self._write_pending("second")
+        self.cache.completed("uuid-1")
+        task = {"id": 3, "uuid": "uuid-3", "description": "three"}
+        self._write_pending("second\nthird")
+        self.cache.added(task)
+
+        snapshot = run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+        self.assertEqual(snapshot.by_id[1]["uuid"], "uuid-2")
+        self.assertEqual(snapshot.by_id[2]["uuid"], "uuid-3")
+        self.assertEqual(sorted(snapshot.by_id), [1, 2])
+        self.assertEqual(task["id"], 2)
+
+    def test_added_after_reload(self):
+        """Tests that a task the snapshot already got from a reload isn't added twice,
+        as when a read reloads it while a batched add still waits for its result
+        """
+        run_coroutine(self.cache.get())
+        self.fake_backend.load_tasks.side_effect = lambda command: {
+            "pending": [
+                {"uuid": "uuid-1", "description": "one"},
+                {"uuid": "uuid-2", "description": "two"},
+                {"uuid": "uuid-3", "description": "three"},
+            ]
+        }
+        self._write_pending("first\nsecond\nthird")
+        run_coroutine(self.cache.get())
+
+        self.cache.added({"id": 3, "uuid": "uuid-3", "description": "three"})
+
+        snapshot = run_coroutine(self.cache.get())
+        self.assertEqual([task["description"] for task in snapshot.tasks], ["one", "two", "three"])
+        self.assertEqual(snapshot.by_uuid["uuid-3"]["id"], 3)
+
+    def test_apply(self):
+        """Tests that changes made outside of the bot are applied and published"""
+        published = []
+        self.cache.subscribe(published.append)
+        run_coroutine(self.cache.get())
+
+        self.cache.apply([
+            {"uuid": "uuid-3", "description": "three", "status": "pending"},
+            {"uuid": "uuid-2", "description": "deux", "status": "pending"},
+            {"uuid": "uuid-1", "description": "one", "status": "completed"},
+        ])
+
+        snapshot = run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+        self.assertEqual(snapshot.by_uuid["uuid-3"]["id"], 2)
+        self.assertEqual(snapshot.by_id[1]["description"], "deux")
+        self.assertNotIn("uuid-1", snapshot.by_uuid)
+
+        changes = published[-1]
+        self.assertEqual([task["uuid"] for task in changes.added], ["uuid-3"])
+        self.assertEqual([task["uuid"] for task in changes.modified], ["uuid-2"])
+        self.assertEqual([task["uuid"] for task in changes.removed], ["uuid-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
+import tempfile
+import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import nio
 
@@ -17,31 +19,152 @@ class CallbacksTestCase(unittest.TestCase):
 
         # We don't spec config, as it doesn't currently have well defined attributes
         self.fake_config = Mock()
+        self.fake_config.executor_type = "thread"
+        self.fake_config.executor_max_workers = 1
+        self.fake_config.executor_max_queue = 1
+        self.fake_config.send_max_retries = 0
+        self.fake_config.send_max_merged = 1
+        self.fake_config.reminders_enabled = False
+        self.store = tempfile.TemporaryDirectory()
+        self.fake_config.store_path = self.store.name
+        self.fake_config.processed_events_max_age_days = 30
+        self.fake_config.taskwarrior_backend = "taskw"
+        self.fake_config.per_user = False
+        self.fake_config.pool_max_stores = 1
+        self.fake_config.pool_max_memory_mb = 1
+        self.fake_config.metrics_enabled = False
+        self.fake_config.profiling_slow_command_ms = 0
+        self.fake_config.profiling_loop_stall_ms = 0
+        self.fake_config.watch_enabled = False
+        self.fake_config.add_batch_window_ms = 0
+        self.fake_config.admission_user_per_minute = 0
+        self.fake_config.admission_global_per_minute = 0
+        self.fake_config.admission_max_queued = 0
+        self.fake_config.dashboard_enabled = False
+
+        with patch("taskbot.runner.make_backend"):
+            self.callbacks = Callbacks(
+                self.fake_client, self.fake_config
+            )
+
+    def tearDown(self) -> None:
+        self.callbacks.processed.close()
+        self.store.cleanup()
+
+    def test_message_group_room(self):
+        """Tests that messages in rooms with more than the user and the bot are ignored"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 3
 
-        self.callbacks = Callbacks(
-            self.fake_client, self.fake_config
-        )
+        fake_message_event = Mock(spec=nio.RoomMessageText)
+        fake_message_event.sender = "@some_other_fake_user:example.com"
+        fake_message_event.body = "list"
+        fake_message_event.event_id = "$list"
+        fake_message_event.server_timestamp = time.time() * 1000
+
+        async def receive():
+            await self.callbacks.message(fake_room, fake_message_event)
+            await self.callbacks.scheduler.drain()
+            await self.callbacks.outbox.drain()
+
+        run_coroutine(receive())
+
+        self.fake_client.room_send.assert_not_called()
+        self.assertFalse(self.callbacks.processed.seen("$list", time.time()))
+
+    def test_message_unknown_command(self):
+        """Tests that unknown commands are answered in the room they came from"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 2
+
+        fake_message_event = Mock(spec=nio.RoomMessageText)
+        fake_message_event.sender = "@some_other_fake_user:example.com"
+        fake_message_event.body = "frobnicate 3"
+        fake_message_event.event_id = "$frobnicate"
+        fake_message_event.server_timestamp = time.time() * 1000
+
+        self.fake_client.room_send.return_value = make_awaitable(None)
 
-    def test_invite(self):
-        """Tests the callback for InviteMemberEvents"""
-        # Tests that the bot attempts to join a room after being invited to it
+        async def receive():
+            await self.callbacks.message(fake_room, fake_message_event)
+            # Replayed by the homeserver
+            await self.callbacks.message(fake_room, fake_message_event)
+            await self.callbacks.scheduler.drain()
+            await self.callbacks.outbox.drain()
+
+        run_coroutine(receive())
+
+        self.fake_client.room_send.assert_called_once()
+        room_id, event_type, content = self.fake_client.room_send.call_args.args
+        self.assertEqual(room_id, "!abcdefg:example.com")
+        self.assertEqual(content["body"], "Unknown command 'frobnicate'")
+        self.assertEqual(self.callbacks.metrics.command_seconds.count("unknown"), 1)
+
+    def test_command_failed(self):
+        """Tests that a failing command gets the same reply as in a worker process"""
+        self.callbacks.runner.run = Mock(side_effect=ValueError("boom"))
+        self.fake_client.room_send.return_value = make_awaitable(None)
+
+        async def run():
+            await self.callbacks._run_command("!abcdefg:example.com", "", "info", "1")
+            await self.callbacks.outbox.drain()
+
+        run_coroutine(run())
+
+        content = self.fake_client.room_send.call_args.args[2]
+        self.assertEqual(content["body"], "Something went wrong, try again later.")
+
+    def test_message_shed(self):
+        """Tests that commands over the limits are counted, and answered once"""
+        self.fake_config.admission_user_per_minute = 1
+        self.fake_config.admission_user_burst = 1
+        self.fake_config.admission_busy_reply = True
+        self.callbacks.admission.apply_config(self.fake_config)
 
-        # Create a fake room and invite event to call the 'invite' callback with
         fake_room = Mock(spec=nio.MatrixRoom)
-        fake_room_id = "!abcdefg:example.com"
-        fake_room.room_id = fake_room_id
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 2
+
+        self.fake_client.room_send.side_effect = lambda *args, **kwargs: make_awaitable(None)
+
+        async def receive():
+            for n in range(3):
+                fake_message_event = Mock(spec=nio.RoomMessageText)
+                fake_message_event.sender = "@some_other_fake_user:example.com"
+                fake_message_event.body = "frobnicate"
+                fake_message_event.event_id = f"$frobnicate{n}"
+                fake_message_event.server_timestamp = time.time() * 1000
+                await self.callbacks.message(fake_room, fake_message_event)
+            await self.callbacks.scheduler.drain()
+            await self.callbacks.outbox.drain()
+
+        run_coroutine(receive())
+
+        # The busy reply doesn't wait for the command before it
+        bodies = [call.args[2]["body"] for call in self.fake_client.room_send.call_args_list]
+        self.assertCountEqual(
+            bodies, ["Unknown command 'frobnicate'", "Too many commands, try again later."]
+        )
+        self.assertEqual(self.callbacks.metrics.commands_shed.get("user"), 2)
+
+    def test_reload_config(self):
+        """Tests that reloaded options reach the running components"""
+        def reload():
+            self.fake_config.send_max_retries = 3
+            self.fake_config.executor_max_queue = 8
+            return ["send_max_retries", "executor_max_queue"]
 
-        fake_invite_event = Mock(spec=nio.InviteMemberEvent)
-        fake_invite_event.sender = "@some_other_fake_user:example.com"
+        self.fake_config.reload.side_effect = reload
 
-        # Pretend that attempting to join a room is always successful
-        self.fake_client.join.return_value = make_awaitable(None)
+        async def reload_config():
+            self.callbacks.reload_config()
 
-        # Pretend that we received an invite event
-        run_coroutine(self.callbacks.invite(fake_room, fake_invite_event))
+        run_coroutine(reload_config())
 
-        # Check that we attempted to join the room
-        self.fake_client.join.assert_called_once_with(fake_room_id)
+        self.assertEqual(self.callbacks.outbox.max_retries, 3)
+        self.assertEqual(self.callbacks.runner.executor.max_queue, 8)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from taskbot.cache import TaskChanges, TaskSnapshot
+from taskbot.commands import (
+    AddCommand,
+    DashboardCommand,
+    DoneCommand,
+    ExportCommand,
+    InfoCommand,
+    ListCommand,
+    SearchCommand,
+)
+from taskbot.render import DashboardReply, FileReply, Renderer, Reply
+
+from tests.utils import make_awaitable, run_coroutine
+
+
+def make_task(id: int, **kw) -> dict:
+    task = {
+        "id": id,
+        "uuid": f"uuid-{id}",
+        "description": f"task {id}",
+        "entry": "20220415T052000Z",
+    }
+    task.update(kw)
+    return task
+
+
+class ListCommandTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake_config = Mock()
+        self.fake_config.list_page_size = 2
+
+        tasks = [
+            make_task(1, project="Home"),
+            make_task(2, project="Home.Garden", tags=["outside"]),
+            make_task(3, project="Work", due="20220501T000000Z"),
+            make_task(4, due="20220601T000000Z"),
+            make_task(5),
+        ]
+        snapshot = TaskSnapshot(None, tasks)
+        self.fake_cache = Mock()
+        self.fake_cache.get.side_effect = lambda: make_awaitable(snapshot)
+
+        self.command = ListCommand(self.fake_config, Mock(), self.fake_cache, Mock())
+
+    def _list(self, args: str, room_id: str = "!room:example.com") -> str:
+        response = run_coroutine(self.command.process(args, room_id))
+        if isinstance(response, Reply):
+            return Renderer().render(response)["body"]
+        return response
+
+    def test_pages(self):
+        """Tests that only one page is returned, and that 'more' continues per room"""
+        response = self._list("")
+        self.assertIn("1-2 of 5, page 1/3", response)
+        self.assertIn("task 2", response)
+        self.assertNotIn("task 3", response)
+
+        response = self._list("more")
+        self.assertIn("3-4 of 5, page 2/3", response)
+        self.assertIn("task 3", response)
+
+        # Other rooms have their own cursor
+        self.assertIn("Nothing to continue", self._list("more", "!other:example.com"))
+
+        self.assertIn("5-5 of 5, page 3/3", self._list("more"))
+        self.assertIn("No more tasks", self._list("more"))
+        self.assertIn("Nothing to continue", self._list("more"))
+
+    def test_page_and_limit(self):
+        response = self._list("page:2 limit:3")
+        self.assertIn("4-5 of 5, page 2/2", response)
+
+        self.assertIn("No more tasks", self._list("page:4"))
+
+    def test_filters(self):
+        response = self._list("project:Home")
+        self.assertIn("1-2 of 2 matching (5 pending)", response)
+
+        response = self._list("+outside")
+        self.assertIn("task 2", response)
+        self.assertIn("1-1 of 1", response)
+
+        response = self._list("due.before:2022-05-15")
+        self.assertIn("task 3", response)
+        self.assertIn("1-1 of 1", response)
+
+        self.assertEqual(
+            self._list("project:Nowhere"), "No pending tasks matching the filters."
+        )
+
+    def test_invalid_arguments(self):
+        self.assertIn("Usage", self._list("page:zero"))
+        self.assertIn("Usage", self._list("due.before:tomorrow"))
+        self.assertIn("Usage", self._list("whatever"))
+
+
+class BulkCommandsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        snapshot = TaskSnapshot(None, [make_task(id) for id in range(1, 11)])
+        self.fake_cache = Mock()
+        self.fake_cache.get.side_effect = lambda: make_awaitable(snapshot)
+
+        # Run backend calls inline
+        self.fake_executor = Mock()
+        self.fake_executor.run.side_effect = lambda func, *args: make_awaitable(func(*args))
+
+        self.fake_backend = Mock()
+
+    def _process(self, command_class, args: str) -> str:
+        command = command_class(
+            Mock(add_batch_window_ms=0), self.fake_backend, self.fake_cache, self.fake_executor
+        )
+        return run_coroutine(command.process(args, "!room:example.com"))
+
+    def test_add_lines(self):
+        """Tests that each line is added as a task, with a single backend call"""
+        self.fake_backend.tasks_add.return_value = [
+            make_task(11, description="first"),
+            make_task(12, description="second"),
+        ]
+
+        response = self._process(AddCommand, "first\n\n second \n")
+
+        self.fake_backend.tasks_add.assert_called_once_with(["first", "second"])
+        self.assertEqual(self.fake_cache.added.call_count, 2)
+        self.assertEqual(response, "Tasks 11, 12 added.")
+
+    def test_add_batched(self):
+        """Tests that adds within the batch window share a backend call, and each
+        gets its own tasks back
+        """
+        self.fake_backend.tasks_add.side_effect = lambda descriptions: [
+            make_task(11 + i, description=d) for i, d in enumerate(descriptions)
+        ]
+        command = AddCommand(
+            Mock(add_batch_window_ms=10), self.fake_backend, self.fake_cache, self.fake_executor
+        )
+        self.assertFalse(command.writes)
+
+        async def add_all():
+            return await asyncio.gather(
+                command.process("first\nsecond", "!room:example.com"),
+                command.process("third", "!other:example.com"),
+            )
+
+        responses = run_coroutine(add_all())
+
+        self.fake_backend.tasks_add.assert_called_once_with(["first", "second", "third"])
+        self.assertEqual(responses, ["Tasks 11, 12 added.", "Task 13 added."])
+        self.assertEqual(command.batcher.batches, 1)
+
+    def test_done_ranges(self):
+        """Tests that IDs and ranges are done with a single backend call"""
+        response = self._process(DoneCommand, "3 5,7-9 12 3")
+
+        self.fake_backend.tasks_done.assert_called_once_with(
+            ["uuid-3", "uuid-5", "uuid-7", "uuid-8", "uuid-9"]
+        )
+        self.assertEqual(self.fake_cache.completed.call_count, 5)
+        self.assertEqual(
+            response, "Tasks 3, 5, 7, 8, 9 done.\n\nNo pending task matching ID 12."
+        )
+
+    def test_done_invalid(self):
+        self.assertEqual(self._process(DoneCommand, "3 x"), "Invalid task ID 'x'")
+        self.assertEqual(self._process(DoneCommand, "5-3"), "Invalid task ID '5-3'")
+        self.assertIn("Too many tasks", self._process(DoneCommand, "1-100000"))
+        self.fake_backend.tasks_done.assert_not_called()
+
+    def test_info(self):
+        reply = self._process(InfoCommand, " 4 ")
+
+        self.assertEqual(reply.title, "Task 4")
+        self.assertEqual(reply.fields, [("description", "task 4")])
+
+    def test_info_invalid(self):
+        self.assertEqual(self._process(InfoCommand, "abc"), "Invalid task ID 'abc'")
+        self.assertEqual(self._process(InfoCommand, ""), InfoCommand.usage)
+        self.assertEqual(self._process(InfoCommand, "1 2"), InfoCommand.usage)
+        self.assertEqual(self._process(InfoCommand, "11"), "No pending task matching ID 11.")
+
+
+class ExportCommandTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        fake_backend = Mock()
+        fake_backend.iter_tasks.side_effect = lambda status: iter(
+            [make_task(1, project="Home"), make_task(2, project="Work")]
+        )
+        fake_executor = Mock()
+        fake_executor.run.side_effect = lambda func, *args: make_awaitable(func(*args))
+        self.command = ExportCommand(
+            Mock(store_path=self.store.name), fake_backend, Mock(), fake_executor
+        )
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def _process(self, args: str):
+        return run_coroutine(self.command.process(args, "!room:example.com"))
+
+    def test_export(self):
+        """Tests that matching tasks are written to a file sent as the reply"""
+        reply = self._process("json project:Home")
+
+        self.assertIsInstance(reply, FileReply)
+        self.assertTrue(reply.filename.endswith(".json.gz"))
+        self.assertEqual(reply.summary, "Exported 1 task.")
+        with gzip.open(reply.path, "rt") as f:
+            self.assertEqual([task["id"] for task in json.load(f)], [1])
+
+    def test_export_nothing(self):
+        """Tests that no file is left when no task matches"""
+        response = self._process("csv project:Garden")
+
+        self.assertEqual(response, "No tasks matching the filters.")
+        self.assertEqual(os.listdir(os.path.join(self.store.name, "exports")), [])
+
+    def test_export_invalid(self):
+        response = self._process("xml")
+
+        self.assertTrue(response.startswith("Unknown export argument 'xml'"))
+
+
+class SearchCommandTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.snapshot = TaskSnapshot(None, [
+            make_task(1, description="Water the garden"),
+            make_task(2, description="Buy a watering can"),
+            make_task(3, description="Call the plumber"),
+        ])
+        self.fake_cache = Mock()
+        self.fake_cache.get.side_effect = lambda: make_awaitable(self.snapshot)
+        self.fake_cache.snapshot = self.snapshot
+        self.command = SearchCommand(
+            Mock(list_page_size=1), Mock(), self.fake_cache, Mock()
+        )
+        self.publish = self.fake_cache.subscribe.call_args.args[0]
+
+    def _process(self, args: str):
+        return run_coroutine(self.command.process(args, "!room:example.com"))
+
+    def test_search(self):
+        """Tests that the best matches are listed with their current IDs"""
+        reply = self._process("water")
+
+        self.assertIsInstance(reply, Reply)
+        self.assertEqual(reply.summary, "2 matching `water`, the best 1 shown")
+        self.assertEqual([task["id"] for task in reply.tasks], [1])
+
+    def test_kept_current(self):
+        """Tests that tasks changed after the index was built are found"""
+        self._process("wat")
+        task = self.snapshot.add(make_task(4, description="Fix the fence"))
+        self.publish(TaskChanges(added=[task]))
+
+        reply = self._process("fence")
+
+        self.assertEqual([task["id"] for task in reply.tasks], [4])
+
+    def test_no_match(self):
+        self.assertEqual(self._process("hose"), "No pending tasks matching `hose`.")
+        self.assertEqual(self._process(" "), SearchCommand.usage)
+
+
+class DashboardCommandTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        snapshot = TaskSnapshot(None, [make_task(1)])
+        self.fake_cache = Mock()
+        self.fake_cache.get.side_effect = lambda: make_awaitable(snapshot)
+        self.command = DashboardCommand(Mock(), Mock(), self.fake_cache, Mock())
+        self.command.dashboards = Mock()
+
+    def _process(self, args: str):
+        return run_coroutine(self.command.process(args, "!room:example.com"))
+
+    def test_show(self):
+        self.command.dashboards.show.return_value = DashboardReply(Reply("Dashboard"), new=True)
+
+        reply = self._process("")
+
+        self.assertIsInstance(reply, DashboardReply)
+        self.command.dashboards.show.assert_called_once()
+
+    def test_off(self):
+        self.command.dashboards.hide.return_value = True
+        self.assertEqual(self._process("off"), "The dashboard won't be updated anymore.")
+        self.command.dashboards.hide.return_value = False
+        self.assertEqual(self._process("OFF"), "There is no dashboard in this room.")
+        self.assertEqual(self._process("on please"), DashboardCommand.usage)
+
+    def test_disabled(self):
+        self.command.dashboards = None
+        self.assertEqual(self._process(""), "Dashboards are turned off.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,6 @@
+import logging
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock
 
@@ -5,6 +8,25 @@ from taskbot.config import Config
 from taskbot.errors import ConfigError
 
 
+CONFIG_TEMPLATE = """
+matrix:
+  device_id: TASKBOT
+  homeserver_url: https://matrix.example.com
+storage:
+  store_path: {store_path}
+logging:
+  level: {level}
+  file_logging:
+    enabled: true
+    filepath: {log_path}
+  console_logging:
+    enabled: false
+commands:
+  list:
+    page_size: {page_size}
+"""
+
+
 class ConfigTestCase(unittest.TestCase):
     def test_get_cfg(self):
         """Test that Config._get_cfg works correctly"""
@@ -74,7 +96,64 @@ class ConfigTestCase(unittest.TestCase):
             "something",
         )
 
-    # TODO: Test creating a test yaml file, passing the path to Config and _parse_config_values is called correctly
+
+class ConfigReloadTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.store.name, "config.yaml")
+        self.handlers = list(logging.getLogger().handlers)
+        self.level = logging.getLogger().level
+
+    def tearDown(self) -> None:
+        root = logging.getLogger()
+        for handler in root.handlers:
+            if handler not in self.handlers:
+                root.removeHandler(handler)
+                handler.close()
+        root.setLevel(self.level)
+        self.store.cleanup()
+
+    def _write(self, store_path: str = None, level: str = "INFO", page_size: int = 20) -> None:
+        with open(self.path, "w") as f:
+            f.write(
+                CONFIG_TEMPLATE.format(
+                    store_path=store_path or self.store.name,
+                    log_path=os.path.join(self.store.name, "bot.log"),
+                    level=level,
+                    page_size=page_size,
+                )
+            )
+
+    def _added_handlers(self) -> list:
+        return [h for h in logging.getLogger().handlers if h not in self.handlers]
+
+    def test_reload(self):
+        """Tests that reloading applies reloadable options without adding handlers"""
+        self._write()
+        config = Config(self.path)
+        self.assertEqual(len(self._added_handlers()), 1)
+
+        self._write(store_path=os.path.join(self.store.name, "other"), level="DEBUG", page_size=5)
+        changed = config.reload()
+
+        self.assertEqual(sorted(changed), ["list_page_size", "log_level"])
+        self.assertEqual(config.list_page_size, 5)
+        self.assertEqual(logging.getLogger().level, logging.DEBUG)
+        self.assertEqual(len(self._added_handlers()), 1)
+        # Needs a restart
+        self.assertEqual(config.store_path, self.store.name)
+
+    def test_reload_invalid(self):
+        """Tests that an invalid config file changes nothing"""
+        self._write()
+        config = Config(self.path)
+
+        self._write(level="LOUD", page_size=0)
+        with self.assertRaises(ConfigError):
+            config.reload()
+
+        self.assertEqual(config.list_page_size, 20)
+        self.assertEqual(logging.getLogger().level, logging.INFO)
 
 
 if __name__ == "__main__":
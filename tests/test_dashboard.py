@@ -0,0 +1,181 @@
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from taskbot.cache import TaskChanges, TaskSnapshot
+from taskbot.dashboard import DashboardMessages, DashboardScheduler
+
+from tests.utils import make_awaitable, run_coroutine
+
+
+def make_task(id: int) -> dict:
+    return {
+        "id": id,
+        "uuid": f"uuid-{id}",
+        "description": f"task {id}",
+        "entry": "20220415T052000Z",
+        "status": "pending",
+    }
+
+
+class DashboardSchedulerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        self.snapshot = TaskSnapshot(None, [make_task(id) for id in range(1, 4)])
+        self.fake_cache = Mock()
+        self.fake_cache.get.side_effect = lambda: make_awaitable(self.snapshot)
+        self.sent = []
+        self.dashboards = DashboardScheduler(
+            self.fake_cache,
+            lambda room_id, reply: self.sent.append((room_id, reply)),
+            self.store.name,
+            delay=0.05,
+            limit=2,
+        )
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def _change(self, *delays: float) -> None:
+        """Publish a change after each delay, then wait for the updates"""
+        async def change():
+            for delay in delays:
+                await asyncio.sleep(delay)
+                self.dashboards.on_changes(TaskChanges(added=[make_task(9)]))
+            await asyncio.sleep(0.1)
+            await self.dashboards.stop()
+
+        run_coroutine(change())
+
+    def test_show(self):
+        """Tests that showing a dashboard saves its room and returns a new one"""
+        reply = self.dashboards.show("!room:example.com", self.snapshot)
+
+        self.assertTrue(reply.new)
+        self.assertEqual([task["id"] for task in reply.reply.tasks], [1, 2])
+        self.assertIn("3 pending, the first 2 shown", reply.reply.summary)
+
+        # Saved across restarts
+        dashboards = DashboardScheduler(self.fake_cache, Mock(), self.store.name)
+        self.assertEqual(dashboards.rooms, {"!room:example.com"})
+
+    def test_debounce(self):
+        """Tests that a burst of changes gives a single update of each dashboard"""
+        self.dashboards.show("!a:example.com", self.snapshot)
+        self.dashboards.show("!b:example.com", self.snapshot)
+
+        self._change(0, 0.01, 0.01, 0.01)
+
+        self.assertEqual([room_id for room_id, _ in self.sent], ["!a:example.com", "!b:example.com"])
+        self.assertFalse(self.sent[0][1].new)
+        self.assertEqual(self.dashboards.updates, 1)
+
+    def test_max_delay(self):
+        """Tests that changes that keep coming don't delay updates forever"""
+        self.dashboards.delay = 0.02
+        self.dashboards.show("!room:example.com", self.snapshot)
+
+        # Each change comes before the delay, for longer than the maximum delay
+        self._change(*[0.01] * 20)
+
+        self.assertGreaterEqual(self.dashboards.updates, 2)
+
+    def test_hide(self):
+        """Tests that hidden dashboards aren't updated"""
+        self.dashboards.show("!room:example.com", self.snapshot)
+        self.assertTrue(self.dashboards.hide("!room:example.com"))
+        self.assertFalse(self.dashboards.hide("!room:example.com"))
+
+        self._change(0)
+
+        self.assertEqual(self.sent, [])
+
+
+class DashboardMessagesTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        self.fake_outbox = Mock()
+        self.fake_client = Mock()
+        self.fake_client.room_get_state_event.side_effect = lambda *args: make_awaitable(None)
+        self.fake_client.room_put_state.side_effect = lambda *args: make_awaitable(None)
+        self.messages = DashboardMessages(self.fake_client, self.fake_outbox, self.store.name)
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def _content(self, body: str) -> dict:
+        return {"msgtype": "m.notice", "body": body, "format": "html", "formatted_body": body}
+
+    def _sent(self):
+        return [call.args[1] for call in self.fake_outbox.send.call_args_list]
+
+    def _posted(self, event_id):
+        """Call the on_sent callback of the last message sent"""
+        self.fake_outbox.send.call_args.kwargs["on_sent"](event_id)
+
+    def test_post_then_edit(self):
+        """Tests that a dashboard is posted once, and then edited"""
+        async def show():
+            self.messages.show("!room:example.com", self._content("first"), new=True)
+            self._posted("$dashboard")
+            self.messages.show("!room:example.com", self._content("second"))
+            await self.messages.close()
+
+        run_coroutine(show())
+
+        first, edit = self._sent()
+        self.assertEqual(first["body"], "first")
+        self.assertEqual(edit["body"], "* second")
+        self.assertEqual(edit["formatted_body"], "* second")
+        self.assertEqual(edit["m.new_content"]["body"], "second")
+        self.assertEqual(
+            edit["m.relates_to"], {"rel_type": "m.replace", "event_id": "$dashboard"}
+        )
+        self.assertEqual(
+            self.fake_outbox.send.call_args.kwargs["key"], "dashboard $dashboard"
+        )
+        self.fake_client.room_put_state.assert_called_once_with(
+            "!room:example.com", "m.room.pinned_events", {"pinned": ["$dashboard"]}
+        )
+
+        # Saved across restarts
+        messages = DashboardMessages(self.fake_client, Mock(), self.store.name)
+        self.assertEqual(messages.event_ids, {"!room:example.com": "$dashboard"})
+
+    def test_update_while_posting(self):
+        """Tests that updates wait for the dashboard's event ID, while new dashboards
+        asked for meanwhile are still posted
+        """
+        async def show():
+            self.messages.show("!room:example.com", self._content("first"), new=True)
+            self.messages.show("!room:example.com", self._content("update"))
+            self.messages.show("!room:example.com", self._content("again"), new=True)
+            self.assertEqual([content["body"] for content in self._sent()], ["first", "again"])
+
+            callbacks = [call.kwargs["on_sent"] for call in self.fake_outbox.send.call_args_list]
+            callbacks[0]("$first")
+            callbacks[1]("$again")
+            await self.messages.close()
+
+        run_coroutine(show())
+
+        *_, edit = self._sent()
+        self.assertEqual(edit["m.new_content"]["body"], "update")
+        self.assertEqual(edit["m.relates_to"]["event_id"], "$again")
+
+    def test_dropped(self):
+        """Tests that a dropped dashboard is posted again by the next update"""
+        async def show():
+            self.messages.show("!room:example.com", self._content("first"), new=True)
+            self._posted(None)
+            self.messages.show("!room:example.com", self._content("second"))
+
+        run_coroutine(show())
+
+        self.assertEqual([content["body"] for content in self._sent()], ["first", "second"])
+        self.assertEqual(self.messages.event_ids, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
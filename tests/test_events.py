@@ -0,0 +1,60 @@
+import tempfile
+import time
+import unittest
+
+from taskbot.events import BloomFilter, ProcessedEvents
+
+
+class BloomFilterTestCase(unittest.TestCase):
+    def test_contains(self):
+        bloom = BloomFilter(capacity=1000)
+        for n in range(1000):
+            bloom.add(f"$event{n}")
+
+        self.assertTrue(all(f"$event{n}" in bloom for n in range(1000)))
+        false_positives = sum(f"$other{n}" in bloom for n in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+class ProcessedEventsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def test_seen(self):
+        events = ProcessedEvents(self.store.name)
+        events.add("$handled")
+
+        self.assertTrue(events.seen("$handled"))
+        self.assertFalse(events.seen("$new"))
+        events.close()
+
+    def test_persisted(self):
+        """Tests that handled events are remembered after a restart"""
+        events = ProcessedEvents(self.store.name)
+        events.add("$handled")
+        events.close()
+
+        events = ProcessedEvents(self.store.name)
+        self.assertTrue(events.seen("$handled"))
+        events.close()
+
+    def test_prune(self):
+        """Tests that old events are forgotten, and considered handled"""
+        events = ProcessedEvents(self.store.name, max_age=3600)
+        old = time.time() - 7200
+        events.add("$old", old)
+        events.add("$recent")
+
+        events.prune()
+
+        self.assertFalse(events.seen("$old"))
+        self.assertTrue(events.seen("$old", old))
+        self.assertTrue(events.seen("$recent"))
+        events.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import threading
+import unittest
+
+from taskbot.errors import ExecutorBusyError
+from taskbot.executor import TaskExecutor
+
+from tests.utils import run_coroutine
+
+
+class TaskExecutorTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.executor = TaskExecutor(kind="thread", max_workers=1, max_queue=1)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+
+    def test_run(self):
+        """Tests that calls are run in a worker and their wait time is recorded"""
+        result = run_coroutine(self.executor.run(threading.current_thread))
+
+        self.assertIsNot(result, threading.main_thread())
+        self.assertEqual(self.executor.calls, 1)
+        self.assertEqual(self.executor.pending, 0)
+        self.assertGreaterEqual(self.executor.last_wait, 0)
+        self.assertEqual(self.executor.metrics.taskwarrior_seconds.count("current_thread"), 1)
+
+    def test_run_kwargs(self):
+        """Tests that keyword arguments are passed through to the call"""
+        result = run_coroutine(self.executor.run(dict, a=1))
+        self.assertEqual(result, {"a": 1})
+        self.assertEqual(self.executor.metrics.taskwarrior_seconds.count("dict"), 1)
+
+    def test_queue_full(self):
+        """Tests that calls are rejected once every worker and queue slot is taken"""
+        self.executor.pending = 2
+        with self.assertRaises(ExecutorBusyError):
+            run_coroutine(self.executor.run(dict))
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            TaskExecutor(kind="fiber")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from taskbot.export import write_export
+
+
+class WriteExportTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "export.gz")
+        self.tasks = [
+            {"id": 1, "uuid": "uuid-1", "description": "one", "tags": ["home", "work"]},
+            {"id": 2, "uuid": "uuid-2", "description": "two"},
+            {"id": 0, "uuid": "uuid-3", "description": "three", "status": "completed"},
+        ]
+        self.fake_backend = Mock()
+        self.fake_backend.iter_tasks.side_effect = lambda status: iter(self.tasks)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def _read(self) -> str:
+        with gzip.open(self.path, "rt", newline="") as f:
+            return f.read()
+
+    def test_json(self):
+        """Tests that JSON exports are a list of the matching tasks"""
+        count = write_export(
+            self.fake_backend, self.path, "json", "all", lambda task: task["id"] != 2
+        )
+
+        self.assertEqual(count, 2)
+        self.fake_backend.iter_tasks.assert_called_once_with("all")
+        self.assertEqual(json.loads(self._read()), [self.tasks[0], self.tasks[2]])
+
+    def test_csv(self):
+        """Tests that CSV exports have a header and one row per task"""
+        count = write_export(self.fake_backend, self.path, "csv", "all", lambda task: True)
+
+        self.assertEqual(count, 3)
+        rows = list(csv.DictReader(io.StringIO(self._read())))
+        self.assertEqual(rows[0]["tags"], "home work")
+        self.assertEqual([row["description"] for row in rows], ["one", "two", "three"])
+
+    def test_empty(self):
+        """Tests that an export without tasks is still valid"""
+        count = write_export(self.fake_backend, self.path, "json", "all", lambda task: False)
+
+        self.assertEqual(count, 0)
+        self.assertEqual(json.loads(self._read()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
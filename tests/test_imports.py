@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import unittest
+
+# Slow to import, and only needed once the bot runs
+HEAVY_MODULES = ("nio", "aiohttp", "taskw", "markdown")
+
+
+def imported_modules(module: str) -> dict:
+    """Import a module in a new interpreter and return the cumulative import time,
+    in microseconds, of every module it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_main(self):
+        """Tests that the CLI starts without importing the bot's dependencies"""
+        modules = imported_modules("taskbot.main")
+
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+        # Generous, this is about 30ms when nothing heavy is imported
+        self.assertLess(modules["taskbot.main"], 300_000)
+
+    def test_config(self):
+        """Tests that loading the config, as `taskbot login` does, doesn't import
+        Taskwarrior or the matrix client
+        """
+        modules = imported_modules("taskbot.config")
+
+        for name in HEAVY_MODULES:
+            self.assertNotIn(name, modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
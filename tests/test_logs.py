@@ -0,0 +1,57 @@
+import io
+import logging
+import unittest
+
+from taskbot.logs import DroppingQueueHandler, LogPipeline
+
+
+class DroppingQueueHandlerTestCase(unittest.TestCase):
+    def test_drops_when_full(self):
+        """Tests that records beyond the queue size are counted, not waited for"""
+        handler = DroppingQueueHandler(max_size=2)
+        logger = logging.getLogger("taskbot.tests.dropping")
+        logger.propagate = False
+        logger.addHandler(handler)
+        task = {"description": "first"}
+        try:
+            logger.warning("record %s", task)
+            for i in range(4):
+                logger.warning("record %d", i)
+        finally:
+            logger.removeHandler(handler)
+
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+        # Formatted when logged, so later changes to the arguments don't show
+        task["description"] = "changed"
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "record {'description': 'first'}")
+
+
+class LogPipelineTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pipeline = LogPipeline()
+        self.logger = logging.getLogger("taskbot.tests.pipeline")
+
+    def tearDown(self) -> None:
+        self.pipeline.stop()
+
+    def test_install(self):
+        """Tests that records reach the handlers, and that installing again replaces
+        the previous handlers after writing out their records
+        """
+        first, second = io.StringIO(), io.StringIO()
+        self.pipeline.install([logging.StreamHandler(first)], max_size=10)
+        self.logger.warning("one %s", "arg")
+        self.pipeline.install([logging.StreamHandler(second)], max_size=10)
+        self.logger.warning("two")
+        self.pipeline.stop()
+
+        self.assertEqual(first.getvalue(), "one arg\n")
+        self.assertEqual(second.getvalue(), "two\n")
+        handlers = logging.getLogger().handlers
+        self.assertFalse(any(isinstance(h, DroppingQueueHandler) for h in handlers))
+
+
+if __name__ == "__main__":
+    unittest.main()
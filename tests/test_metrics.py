@@ -0,0 +1,80 @@
+import socket
+import unittest
+
+import aiohttp
+
+from taskbot.metrics import Counter, Histogram, Metrics, MetricsServer
+
+from tests.utils import run_coroutine
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test", labels=("command",), buckets=(0.1, 1))
+        histogram.observe(0.05, "list")
+        histogram.observe(0.5, "list")
+        histogram.observe(5, "list")
+
+        self.assertEqual(
+            histogram.render(),
+            [
+                "# HELP test_seconds Test",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{command="list",le="0.1"} 1',
+                'test_seconds_bucket{command="list",le="1"} 2',
+                'test_seconds_bucket{command="list",le="+Inf"} 3',
+                'test_seconds_sum{command="list"} 5.55',
+                'test_seconds_count{command="list"} 3',
+            ],
+        )
+        self.assertEqual(histogram.count("list"), 3)
+        self.assertEqual(histogram.count("add"), 0)
+
+    def test_counter_escapes_labels(self):
+        counter = Counter("test_total", "Test", labels=("reason",))
+        counter.inc('say "hi"\n')
+
+        self.assertEqual(counter.render()[-1], 'test_total{reason="say \\"hi\\"\\n"} 1')
+
+    def test_gauge(self):
+        metrics = Metrics()
+        metrics.add_gauge("test_depth", "Test", lambda: 3)
+
+        self.assertIn("test_depth 3\n", metrics.render())
+
+    def test_synced(self):
+        """Tests that the time between syncs is recorded from the second sync on"""
+        metrics = Metrics()
+        metrics.synced()
+        self.assertEqual(metrics.sync_interval_seconds.count(), 0)
+        metrics.synced()
+        self.assertEqual(metrics.sync_interval_seconds.count(), 1)
+
+
+class MetricsServerTestCase(unittest.TestCase):
+    def test_serve(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+
+        metrics = Metrics()
+        metrics.command_seconds.observe(0.2, "list")
+        server = MetricsServer(metrics, port=port)
+
+        async def scrape():
+            await server.start()
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                        return response.headers["Content-Type"], await response.text()
+            finally:
+                await server.stop()
+
+        content_type, text = run_coroutine(scrape())
+
+        self.assertTrue(content_type.startswith("text/plain; version=0.0.4"))
+        self.assertIn('taskbot_command_seconds_count{command="list"} 1', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from taskbot.outbox import Outbox
+
+from tests.utils import run_coroutine
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake_client = Mock(spec=nio.AsyncClient)
+        self.responses = []
+        # room_send is an AsyncMock, as AsyncClient.room_send is a coroutine function
+        self.fake_client.room_send.side_effect = lambda *args, **kwargs: (
+            self.responses.pop(0) if self.responses else Mock(spec=nio.RoomSendResponse)
+        )
+        self.outbox = Outbox(self.fake_client, max_retries=2, max_merged=2, backoff=0)
+
+    def _send(self, *messages, room_id="!room:example.com") -> None:
+        async def send():
+            for message in messages:
+                self.outbox.send_text(room_id, message)
+            await self.outbox.drain()
+
+        run_coroutine(send())
+
+    def _sent_bodies(self):
+        return [call.args[2]["body"] for call in self.fake_client.room_send.call_args_list]
+
+    def test_merge(self):
+        """Tests that waiting messages to a room are merged, in order"""
+        self._send("one", "two", "three")
+
+        self.assertEqual(self._sent_bodies(), ["one\n\ntwo", "three"])
+        self.assertEqual(self.outbox.sent, 2)
+        self.assertEqual(self.outbox.depth, 0)
+
+    def test_rate_limited(self):
+        """Tests that a rate limited message is sent again with the same transaction ID"""
+        self.responses.append(
+            nio.RoomSendError("Too many requests", "M_LIMIT_EXCEEDED", retry_after_ms=1)
+        )
+
+        self._send("one")
+
+        first, second = self.fake_client.room_send.call_args_list
+        self.assertEqual(first.kwargs["tx_id"], second.kwargs["tx_id"])
+        self.assertEqual(self.outbox.retries, 1)
+        self.assertEqual(self.outbox.sent, 1)
+
+    def test_give_up(self):
+        """Tests that a message is dropped after too many failures"""
+        self.fake_client.room_send.side_effect = nio.SendRetryError
+
+        self._send("one")
+
+        self.assertEqual(self.fake_client.room_send.call_count, 3)
+        self.assertEqual(self.outbox.failures, 1)
+
+    def test_forbidden(self):
+        """Tests that errors other than rate limiting aren't retried"""
+        self.responses.append(nio.RoomSendError("Forbidden", "M_FORBIDDEN"))
+
+        self._send("one")
+
+        self.assertEqual(self.fake_client.room_send.call_count, 1)
+        self.assertEqual(self.outbox.failures, 1)
+
+    def test_replace_by_key(self):
+        """Tests that a message queued with a key replaces a waiting one with the same
+        key, and that keyed messages aren't merged
+        """
+        async def send():
+            self.outbox.send_text("!room:example.com", "first")
+            self.outbox.send("!room:example.com", {"msgtype": "m.notice", "body": "old"}, key="edit")
+            self.outbox.send("!room:example.com", {"msgtype": "m.notice", "body": "new"}, key="edit")
+            await self.outbox.drain()
+
+        run_coroutine(send())
+
+        self.assertEqual(self._sent_bodies(), ["first", "new"])
+        self.assertEqual(self.outbox.replaced, 1)
+
+    def test_on_sent(self):
+        """Tests that on_sent gets the event ID, or None when the message is dropped"""
+        sent = []
+        self.responses.append(nio.RoomSendResponse("$event", "!room:example.com"))
+        self.responses.append(nio.RoomSendError("Forbidden", "M_FORBIDDEN"))
+
+        async def send():
+            for body in ("one", "two"):
+                self.outbox.send(
+                    "!room:example.com", {"msgtype": "m.notice", "body": body}, on_sent=sent.append
+                )
+            await self.outbox.drain()
+
+        run_coroutine(send())
+
+        self.assertEqual(sent, ["$event", None])
+
+    def test_server_error(self):
+        """Tests that server errors, which nio returns rather than raises, are retried"""
+        self.responses.append(nio.RoomSendError("Bad gateway"))
+        server_error = nio.RoomSendError("Internal error", "M_UNKNOWN")
+        server_error.transport_response = Mock(status=500)
+        self.responses.append(server_error)
+
+        self._send("one")
+
+        self.assertEqual(self.fake_client.room_send.call_count, 3)
+        self.assertEqual(self.outbox.retries, 2)
+        self.assertEqual(self.outbox.sent, 1)
+
+    def _send_file(self, encrypted: bool = False) -> str:
+        self.fake_client.rooms = {"!room:example.com": Mock(encrypted=encrypted)}
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b"tasks")
+        os.close(fd)
+
+        async def send():
+            self.outbox.send_text("!room:example.com", "Exported 1 task.")
+            self.outbox.send_file("!room:example.com", path, "tasks.json.gz", "application/gzip")
+            await self.outbox.drain()
+
+        run_coroutine(send())
+        return path
+
+    def test_send_file(self):
+        """Tests that a file is uploaded when its turn comes, and not merged"""
+        self.fake_client.upload.return_value = (
+            nio.UploadResponse("mxc://example.com/tasks"), None
+        )
+
+        path = self._send_file()
+
+        self.assertEqual(self._sent_bodies(), ["Exported 1 task.", "tasks.json.gz"])
+        content = self.fake_client.room_send.call_args.args[2]
+        self.assertEqual(content["msgtype"], "m.file")
+        self.assertEqual(content["url"], "mxc://example.com/tasks")
+        self.assertEqual(content["info"], {"mimetype": "application/gzip", "size": 5})
+        self.assertFalse(os.path.exists(path))
+
+    def test_send_file_encrypted(self):
+        """Tests that files to encrypted rooms are encrypted"""
+        self.fake_client.upload.return_value = (
+            nio.UploadResponse("mxc://example.com/tasks"), {"key": {"k": "secret"}}
+        )
+
+        self._send_file(encrypted=True)
+
+        self.assertTrue(self.fake_client.upload.call_args.kwargs["encrypt"])
+        content = self.fake_client.room_send.call_args.args[2]
+        self.assertNotIn("url", content)
+        self.assertEqual(
+            content["file"], {"key": {"k": "secret"}, "url": "mxc://example.com/tasks"}
+        )
+
+    def test_upload_failed(self):
+        """Tests that a failed upload is reported in the room"""
+        self.fake_client.upload.return_value = (nio.UploadError("Too large"), None)
+
+        path = self._send_file()
+
+        self.assertEqual(
+            self._sent_bodies()[-1], "Couldn't upload tasks.json.gz, try again later."
+        )
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from taskbot.profiling import CommandProfiler, LoopWatchdog
+
+from tests.utils import run_coroutine
+
+
+class CommandProfilerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        self.profiler = CommandProfiler(self.store.name, threshold=0.05, interval=0.001)
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def test_slow_command(self):
+        """Tests that the stacks of a slow command are saved"""
+        with self.profiler.profile("list"):
+            time.sleep(0.1)
+
+        self.assertEqual(self.profiler.saved, 1)
+        [name] = os.listdir(self.profiler.directory)
+        self.assertIn("-list-", name)
+        with open(os.path.join(self.profiler.directory, name)) as f:
+            stacks = f.read()
+        self.assertIn("MainThread;", stacks)
+        self.assertIn("test_profiling.py:test_slow_command", stacks)
+
+    def test_fast_command(self):
+        with self.profiler.profile("info"):
+            pass
+
+        self.assertEqual(self.profiler.saved, 0)
+        self.assertFalse(os.path.exists(self.profiler.directory))
+
+
+class LoopWatchdogTestCase(unittest.TestCase):
+    def test_stall(self):
+        """Tests that a blocked loop is reported once, with the blocking stack"""
+        watchdog = LoopWatchdog(threshold=0.05)
+
+        async def block():
+            watchdog.start()
+            await asyncio.sleep(0.03)
+            time.sleep(0.2)
+            await asyncio.sleep(0.03)
+            await watchdog.stop()
+
+        with self.assertLogs("taskbot.profiling", "WARNING") as logs:
+            run_coroutine(block())
+
+        self.assertEqual(watchdog.stalls, 1)
+        self.assertIn("in block", logs.output[0])
+        self.assertIn("Event loop was blocked", logs.output[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import asyncio
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from taskbot.cache import TaskChanges, TaskSnapshot
+from taskbot.reminders import (
+    WAKEUP_EARLY,
+    ReminderScheduler,
+    ReminderWakeups,
+    due_timestamp,
+    load_next_due,
+)
+
+from tests.utils import run_coroutine
+
+
+def make_task(id: int, due: str = None) -> dict:
+    task = {"id": id, "uuid": f"uuid-{id}", "description": f"task {id}"}
+    if due:
+        task["due"] = due
+    return task
+
+
+class ReminderSchedulerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store_dir = tempfile.TemporaryDirectory()
+        self.fake_cache = Mock()
+        self.sent = []
+        self.reminders = ReminderScheduler(
+            self.fake_cache,
+            lambda room_id, reply: self.sent.append((room_id, reply.tasks[0]["id"])),
+            self.store_dir.name,
+            room_id="!default:example.com",
+        )
+
+    def tearDown(self) -> None:
+        self.store_dir.cleanup()
+
+    def _set_tasks(self, *tasks) -> None:
+        self.fake_cache.snapshot = TaskSnapshot(None, list(tasks))
+
+    def _send_at(self, due: str) -> None:
+        with patch("taskbot.reminders.time.time", return_value=due_timestamp(due)):
+            self.reminders._send_due()
+
+    def test_subscribed(self):
+        self.fake_cache.subscribe.assert_called_once_with(self.reminders.on_changes)
+
+    def test_remind(self):
+        """Tests that reminders are sent in due order, to the task's room"""
+        first = make_task(1, due="20990101T000000Z")
+        second = make_task(2, due="20990102T000000Z")
+        no_due = make_task(3)
+        self._set_tasks(first, second, no_due)
+        self.reminders.on_changes(TaskChanges(added=[second, no_due]))
+        self.reminders.on_changes(TaskChanges(added=[first], room_id="!room:example.com"))
+        self.assertEqual(self.reminders.upcoming, 2)
+
+        self._send_at("20990101T000000Z")
+        self.assertEqual(self.sent, [("!room:example.com", 1)])
+
+        self._send_at("20990102T000000Z")
+        self.assertEqual(self.sent[1], ("!default:example.com", 2))
+        self.assertEqual(self.reminders.upcoming, 0)
+
+    def test_changes(self):
+        """Tests that moved and removed due dates don't send reminders"""
+        moved = make_task(1, due="20990101T000000Z")
+        removed = make_task(2, due="20990101T000000Z")
+        past = make_task(3, due="20000101T000000Z")
+        self.reminders.on_changes(TaskChanges(added=[moved, removed, past]))
+
+        moved = make_task(1, due="20990105T000000Z")
+        self._set_tasks(moved)
+        self.reminders.on_changes(TaskChanges(modified=[moved], removed=[removed]))
+
+        self._send_at("20990101T000000Z")
+        self.assertEqual(self.sent, [])
+        self._send_at("20990105T000000Z")
+        self.assertEqual(self.sent, [("!default:example.com", 1)])
+
+    def test_rooms_saved(self):
+        """Tests that the room of each task survives a restart"""
+        self.reminders.on_changes(
+            TaskChanges(added=[make_task(1)], room_id="!room:example.com")
+        )
+
+        reminders = ReminderScheduler(Mock(), Mock(), self.store_dir.name)
+        self.assertEqual(reminders.rooms, {"uuid-1": "!room:example.com"})
+
+    def test_stop(self):
+        """Tests that stopping saves when the next reminder is due"""
+        on_stop = Mock()
+        self.reminders.on_stop = on_stop
+        first = make_task(1, due="20990101T000000Z")
+        second = make_task(2, due="20990102T000000Z")
+        self.reminders.on_changes(TaskChanges(added=[first, second]))
+        self.reminders.on_changes(TaskChanges(removed=[first]))
+
+        run_coroutine(self.reminders.stop())
+        on_stop.assert_called_once_with(due_timestamp("20990102T000000Z"))
+        self.assertEqual(load_next_due(self.store_dir.name), due_timestamp("20990102T000000Z"))
+
+        self.reminders.on_changes(TaskChanges(removed=[second]))
+        run_coroutine(self.reminders.stop())
+        on_stop.assert_called_with(None)
+        self.assertIsNone(load_next_due(self.store_dir.name))
+
+
+class ReminderWakeupsTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.woken = []
+        self.wakeups = ReminderWakeups(self.woken.append)
+
+    def _run(self, coroutine) -> None:
+        async def run():
+            await coroutine
+            await asyncio.sleep(0.05)
+            self.wakeups.stop()
+
+        run_coroutine(run())
+
+    def test_wake(self):
+        """Tests that stores are opened before their next reminder is due"""
+        async def schedule():
+            self.wakeups.schedule("@soon:x", time.time() + WAKEUP_EARLY)
+            self.wakeups.schedule("@later:x", time.time() + WAKEUP_EARLY + 60)
+            self.wakeups.schedule("@none:x", None)
+
+        self._run(schedule())
+
+        self.assertEqual(self.woken, ["@soon:x"])
+        self.assertEqual(self.wakeups.wakeups, 1)
+
+    def test_cancel(self):
+        """Tests that a store opened meanwhile isn't opened again"""
+        async def schedule():
+            self.wakeups.schedule("@soon:x", time.time())
+            self.wakeups.cancel("@soon:x")
+
+        self._run(schedule())
+
+        self.assertEqual(self.woken, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
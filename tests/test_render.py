@@ -0,0 +1,53 @@
+import unittest
+
+from taskbot.render import Renderer, Reply
+
+
+class RendererTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.renderer = Renderer(max_fragments=2)
+        self.task = {
+            "id": 4,
+            "uuid": "uuid-4",
+            "description": "Fix <b>tags</b> & *stars*",
+            "entry": "20220415T052000Z",
+            "modified": "20220415T052000Z",
+        }
+
+    def test_render(self):
+        """Tests that replies are rendered to text and escaped HTML"""
+        content = self.renderer.render(
+            Reply("Current tasks", "1-1 of 1, `list more`", tasks=[self.task])
+        )
+
+        body_heading, body_task = content["body"].split("\n\n")
+        self.assertEqual(body_heading, "Current tasks 1-1 of 1, `list more`:")
+        self.assertTrue(body_task.startswith("4 - "))
+        self.assertTrue(body_task.endswith("Fix <b>tags</b> & *stars*"))
+
+        html_heading, html_task = content["formatted_body"].split("\n")
+        self.assertEqual(
+            html_heading,
+            "<p><strong>Current tasks</strong> 1-1 of 1, <code>list more</code>:</p>",
+        )
+        self.assertIn("Fix &lt;b&gt;tags&lt;/b&gt; &amp; *stars*", html_task)
+
+    def test_fields(self):
+        content = self.renderer.render(Reply("Task 4", fields=[("due", "tomorrow")]))
+
+        self.assertEqual(content["body"], "Task 4:\n\ndue: tomorrow")
+
+    def test_fragment_cache(self):
+        """Tests that fragments are reused until the task is modified"""
+        self.renderer.render(Reply("Tasks", tasks=[self.task]))
+        self.renderer.render(Reply("Tasks", tasks=[dict(self.task, id=3)]))
+        self.assertEqual((self.renderer.misses, self.renderer.hits), (1, 1))
+
+        modified = dict(self.task, description="Changed", modified="20220416T052000Z")
+        content = self.renderer.render(Reply("Tasks", tasks=[modified]))
+        self.assertIn("Changed", content["body"])
+        self.assertEqual(self.renderer.misses, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from taskbot.backends import user_directory
+from taskbot.metrics import Metrics
+from taskbot.reminders import NEXT_DUE_FILENAME
+from taskbot.runner import CommandRunner
+from taskbot.scheduler import CommandScheduler
+
+from tests.utils import run_coroutine
+
+
+class CommandRunnerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = tempfile.TemporaryDirectory()
+        self.fake_config = Mock()
+        self.fake_config.executor_type = "thread"
+        self.fake_config.executor_max_workers = 1
+        self.fake_config.executor_max_queue = 1
+        self.fake_config.taskwarrior_backend = "datafile"
+        self.fake_config.per_user = True
+        self.fake_config.users_directory = self.store.name
+        self.fake_config.reminders_enabled = True
+        self.fake_config.pool_max_stores = 1
+        self.fake_config.pool_max_memory_mb = 1
+        self.fake_config.profiling_slow_command_ms = 0
+
+        self.runner = CommandRunner(self.fake_config, Mock(), CommandScheduler(), Metrics())
+
+    def tearDown(self) -> None:
+        self.store.cleanup()
+
+    def _save_next_due(self, user_id: str, next_due: float) -> None:
+        directory = user_directory(self.fake_config, user_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, NEXT_DUE_FILENAME), "w") as f:
+            json.dump({"due": next_due}, f)
+
+    def test_wakeups(self):
+        """Tests that the closed stores a runner owns are opened again for their
+        next reminder, after a restart
+        """
+        next_due = time.time() + 3600
+        self._save_next_due("@alice:example.com", next_due)
+        self._save_next_due("@bob:example.com", next_due)
+        os.makedirs(user_directory(self.fake_config, "@carol:example.com"))
+
+        async def start():
+            await self.runner.start(owns=lambda key: key != "@bob:example.com")
+            scheduled = list(self.runner.wakeups._timers)
+            await self.runner.close()
+            return scheduled
+
+        self.assertEqual(run_coroutine(start()), ["@alice:example.com"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+from taskbot.scheduler import CommandScheduler
+
+from tests.utils import run_coroutine
+
+
+class CommandSchedulerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scheduler = CommandScheduler()
+        self.events = []
+
+    def _job(self, name: str, writes: bool, delay: float = 0.01):
+        async def job():
+            async with self.scheduler.lock("store", writes):
+                self.events.append(f"start {name}")
+                await asyncio.sleep(delay)
+                self.events.append(f"end {name}")
+
+        return job
+
+    def _run(self, jobs) -> None:
+        async def run():
+            for room_id, job in jobs:
+                self.scheduler.submit(room_id, job)
+            await self.scheduler.drain()
+
+        run_coroutine(run())
+
+    def test_room_order(self):
+        """Tests that commands of a room run one after another, in order"""
+        self._run(
+            [
+                ("!a", self._job("first", writes=False)),
+                ("!a", self._job("second", writes=False, delay=0)),
+            ]
+        )
+        self.assertEqual(
+            self.events, ["start first", "end first", "start second", "end second"]
+        )
+
+    def test_parallel_reads(self):
+        """Tests that reads from different rooms overlap"""
+        self._run(
+            [
+                ("!a", self._job("a", writes=False)),
+                ("!b", self._job("b", writes=False)),
+            ]
+        )
+        self.assertEqual(self.events[:2], ["start a", "start b"])
+
+    def test_serialized_writes(self):
+        """Tests that a write doesn't overlap with any other command on the same store"""
+        self._run(
+            [
+                ("!a", self._job("write", writes=True)),
+                ("!b", self._job("read", writes=False)),
+                ("!c", self._job("other write", writes=True)),
+            ]
+        )
+        self.assertEqual(
+            self.events,
+            [
+                "start write",
+                "end write",
+                "start other write",
+                "end other write",
+                "start read",
+                "end read",
+            ],
+        )
+
+    def test_failing_job(self):
+        """Tests that a failing command doesn't stop the room's queue"""
+
+        async def fail():
+            raise ValueError
+
+        self._run([("!a", fail), ("!a", self._job("after", writes=True))])
+        self.assertEqual(self.events, ["start after", "end after"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from taskbot.cache import TaskChanges
+from taskbot.search import SearchIndex, task_terms
+
+from tests.utils import run_coroutine
+
+
+def make_task(uuid: str, description: str, **kw) -> dict:
+    return dict(uuid=uuid, description=description, **kw)
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index = SearchIndex()
+        run_coroutine(self.index.build([
+            make_task("uuid-1", "Water the garden", project="Home.Garden"),
+            make_task("uuid-2", "Buy a watering can", tags=["shopping"]),
+            make_task(
+                "uuid-3",
+                "Call the plumber",
+                annotations=[{"entry": "20220415T052000Z", "description": "about the water heater"}],
+            ),
+        ]))
+
+    def test_task_terms(self):
+        """Tests that terms keep the weight of the most important part they're in"""
+        terms = task_terms(make_task("uuid-1", "Garden work", project="Garden", tags=["Work"]))
+
+        self.assertEqual(sorted(terms), ["garden", "work"])
+        self.assertGreater(terms["garden"], task_terms({"project": "garden"})["garden"])
+
+    def test_prefix(self):
+        """Tests that words match the start of terms, whole words in descriptions
+        ranking first, and annotations last
+        """
+        self.assertEqual(self.index.search("water"), (3, ["uuid-1", "uuid-2", "uuid-3"]))
+        # Rarer terms rank higher
+        self.assertEqual(self.index.search("WAT"), (3, ["uuid-2", "uuid-1", "uuid-3"]))
+
+    def test_every_word(self):
+        """Tests that tasks must match every word of the query"""
+        self.assertEqual(self.index.search("wat gard"), (1, ["uuid-1"]))
+        self.assertEqual(self.index.search("wat plumbing"), (0, []))
+
+    def test_limit(self):
+        self.assertEqual(self.index.search("water", limit=1), (3, ["uuid-1"]))
+
+    def test_update(self):
+        """Tests that changes published by the cache update the index"""
+        self.index.update(TaskChanges(
+            added=[make_task("uuid-4", "Fix the fence")],
+            modified=[make_task("uuid-2", "Buy a hose")],
+            removed=[make_task("uuid-1", "Water the garden")],
+        ))
+
+        self.assertEqual(self.index.search("fen"), (1, ["uuid-4"]))
+        self.assertEqual(self.index.search("water"), (1, ["uuid-3"]))
+        self.assertEqual(self.index.search("garden"), (0, []))
+        self.assertEqual(self.index.search("hose"), (1, ["uuid-2"]))
+        self.assertEqual(len(self.index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import Mock
+
+from taskbot.stores import Store, StorePool
+
+from tests.utils import run_coroutine
+
+
+def make_store(key: str, memory: int = 0) -> Store:
+    cache = Mock()
+    cache.snapshot = Mock(size=memory) if memory else None
+    return Store(key, Mock(), cache, {})
+
+
+class StorePoolTestCase(unittest.TestCase):
+    def test_get(self):
+        """Tests that stores are opened once and then reused"""
+        pool = StorePool(make_store)
+
+        store = pool.get("@alice:example.com")
+
+        self.assertIs(pool.get("@alice:example.com"), store)
+        self.assertEqual(pool.opened, 1)
+
+    def test_max_stores(self):
+        """Tests that the least recently used store is closed"""
+        pool = StorePool(make_store, max_stores=2)
+
+        async def use():
+            pool.get("a")
+            pool.get("b")
+            pool.get("a")
+            pool.get("c")
+
+        run_coroutine(use())
+
+        self.assertNotIn("b", pool)
+        self.assertIn("a", pool)
+        self.assertIn("c", pool)
+        self.assertEqual(pool.evicted, 1)
+
+    def test_max_memory(self):
+        pool = StorePool(lambda key: make_store(key, memory=60), max_memory=100)
+
+        async def use():
+            pool.get("a")
+            pool.get("b")
+
+        run_coroutine(use())
+
+        self.assertEqual(len(pool), 1)
+        self.assertIn("b", pool)
+
+    def test_max_memory_single_store(self):
+        """Tests that the most recently used store stays open even over the cap"""
+        pool = StorePool(lambda key: make_store(key, memory=200), max_memory=100)
+
+        pool.get("a")
+
+        self.assertIn("a", pool)
+
+    def test_in_use(self):
+        """Tests that stores in use aren't closed"""
+        pool = StorePool(make_store, max_stores=1)
+
+        async def use():
+            with pool.use("a"):
+                pool.get("b")
+                self.assertIn("a", pool)
+            # Closed once no longer used
+            self.assertNotIn("a", pool)
+            await pool.close()
+
+        run_coroutine(use())
+
+        self.assertEqual(len(pool), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import Mock
+
+import nio
+
+from taskbot.sync import SYNC_FILTER, first_sync_filter, upload_sync_filter
+
+from tests.utils import run_coroutine
+
+
+class SyncFilterTestCase(unittest.TestCase):
+    def test_first_sync_filter(self):
+        """Tests that the first sync only asks for the last event of each room"""
+        self.assertEqual(first_sync_filter()["room"]["timeline"]["limit"], 1)
+        self.assertNotIn("limit", SYNC_FILTER["room"]["timeline"])
+
+    def test_timeline_state(self):
+        """Tests that state events in the timeline, which nio tracks rooms with, are
+        kept
+        """
+        timeline = SYNC_FILTER["room"]["timeline"]
+        self.assertNotIn("types", timeline)
+        for event_type in ("m.room.member", "m.room.encryption", "m.room.message"):
+            self.assertNotIn(event_type, timeline["not_types"])
+
+    def test_upload(self):
+        fake_client = Mock(spec=nio.AsyncClient)
+        fake_client.upload_filter.return_value = nio.UploadFilterResponse("42")
+
+        self.assertEqual(run_coroutine(upload_sync_filter(fake_client)), "42")
+
+    def test_upload_failed(self):
+        """Tests that the filter is sent inline when it can't be uploaded"""
+        fake_client = Mock(spec=nio.AsyncClient)
+        fake_client.upload_filter.return_value = nio.UploadFilterError("Nope")
+
+        self.assertIs(run_coroutine(upload_sync_filter(fake_client)), SYNC_FILTER)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from taskw.utils import encode_task
+
+from taskbot.cache import SnapshotCache
+from taskbot.executor import TaskExecutor
+from taskbot.watcher import DataWatcher, read_transactions
+
+from tests.utils import run_coroutine
+
+
+def transaction(task: dict, old: dict = None) -> str:
+    lines = ["time 1700000000"]
+    if old:
+        lines.append(f"old {encode_task(old)}")
+    lines.append(f"new {encode_task(task)}")
+    return "\n".join(lines) + "\n---\n"
+
+
+class DataWatcherTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.tasks = [
+            {"uuid": "uuid-1", "description": "one", "status": "pending"},
+            {"uuid": "uuid-2", "description": "two", "status": "pending"},
+        ]
+        self._write("pending.data", "".join(encode_task(t) + "\n" for t in self.tasks))
+        self._write("undo.data", "".join(transaction(t) for t in self.tasks))
+
+        self.executor = TaskExecutor(max_workers=1)
+        self.fake_backend = Mock()
+        self.fake_backend.location = self.data_dir.name
+        self.fake_backend.load_tasks.side_effect = lambda command: {
+            "pending": [dict(task) for task in self.tasks]
+        }
+        self.cache = SnapshotCache(self.executor, self.fake_backend)
+        run_coroutine(self.cache.get())
+        self.watcher = DataWatcher(self.cache)
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        self.data_dir.cleanup()
+
+    def _write(self, name: str, content: str, mode: str = "w") -> None:
+        with open(os.path.join(self.data_dir.name, name), mode) as f:
+            f.write(content)
+
+    def test_read_transactions(self):
+        """Tests that only complete transactions are read"""
+        path = os.path.join(self.data_dir.name, "undo.data")
+        size = os.path.getsize(path)
+        task = {"uuid": "uuid-3", "description": "three", "status": "pending"}
+        self._write("undo.data", transaction(task) + "time 1700000001\n", mode="a")
+
+        tasks, offset = read_transactions(path, size)
+        self.assertEqual([t["uuid"] for t in tasks], ["uuid-3"])
+        self.assertEqual(offset, size + len(transaction(task)))
+
+        self.assertEqual(read_transactions(path, offset), ([], offset))
+
+    def test_incremental(self):
+        """Tests that tasks changed by appended transactions are applied without a reload"""
+        done = dict(self.tasks[0], status="completed")
+        added = {"uuid": "uuid-3", "description": "three", "status": "pending"}
+        self._write("pending.data", encode_task(added) + "\n", mode="a")
+        self._write("undo.data", transaction(done, self.tasks[0]) + transaction(added), mode="a")
+
+        run_coroutine(self.watcher.refresh())
+
+        self.assertEqual(self.watcher.incremental, 1)
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+        snapshot = self.cache.snapshot
+        self.assertNotIn("uuid-1", snapshot.by_uuid)
+        self.assertEqual(snapshot.by_uuid["uuid-3"]["id"], 2)
+        # The snapshot is current, so using it doesn't reload it
+        run_coroutine(self.cache.get())
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 1)
+
+    def test_reload_after_gc(self):
+        """Tests that pending.data shrinking, as IDs change, reloads the snapshot"""
+        self.tasks = self.tasks[1:]
+        self._write("pending.data", encode_task(self.tasks[0]) + "\n")
+
+        run_coroutine(self.watcher.refresh())
+
+        self.assertEqual(self.watcher.reloads, 1)
+        self.assertEqual(self.fake_backend.load_tasks.call_count, 2)
+        self.assertEqual(list(self.cache.snapshot.by_id), [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from taskbot.config import Config
+from taskbot.render import Reply
+from taskbot.stores import SHARED
+from taskbot.workers import WorkerPool, shard
+
+from tests.utils import run_coroutine
+
+CONFIG = """\
+matrix:
+  user_id: "@taskbot:localhost"
+  device_id: TEST
+  homeserver_url: http://localhost
+storage:
+  store_path: {path}/store
+taskwarrior:
+  backend: datafile
+  taskrc: {path}/taskrc
+  per_user: true
+reminders:
+  enabled: false
+logging:
+  level: WARNING
+  file_logging:
+    enabled: false
+  console_logging:
+    enabled: false
+"""
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        path = self.directory.name
+        with open(os.path.join(path, "taskrc"), "w") as f:
+            f.write(f"data.location={path}\n")
+        config_path = os.path.join(path, "config.yaml")
+        with open(config_path, "w") as f:
+            f.write(CONFIG.format(path=path))
+        self.config = Config(config_path)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_shard(self):
+        """Tests that a store always goes to the same worker"""
+        self.assertEqual(shard("@alice:example.com", 4), shard("@alice:example.com", 4))
+        self.assertLess(shard(SHARED, 4), 4)
+
+    def test_run(self):
+        """Tests that commands run in the workers, on the sender's own data"""
+        pool = WorkerPool(self.config, 2, send=lambda room_id, reply: None)
+
+        async def run():
+            await pool.start()
+            try:
+                added = await pool.run("!room:localhost", "@alice:localhost", "add", "buy milk")
+                alice = await pool.run("!room:localhost", "@alice:localhost", "list", "")
+                bob = await pool.run("!other:localhost", "@bob:localhost", "list", "")
+            finally:
+                await pool.close()
+            return added, alice, bob
+
+        added, alice, bob = run_coroutine(run())
+
+        self.assertEqual(added, "Task 1 added.")
+        self.assertIsInstance(alice, Reply)
+        self.assertEqual([task["description"] for task in alice.tasks], ["buy milk"])
+        self.assertEqual(bob, "No pending tasks.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,10 +5,11 @@ from typing import Any, Awaitable
 
 def run_coroutine(result: Awaitable[Any]) -> Any:
     """Wrapper for asyncio functions to allow them to be run from synchronous functions"""
-    loop = asyncio.get_event_loop()
-    result = loop.run_until_complete(result)
-    loop.close()
-    return result
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(result)
+    finally:
+        loop.close()
 
 
 def make_awaitable(result: Any) -> Awaitable[Any]: